@@ -0,0 +1,447 @@
+# ==================== SHARED CONNECTION MANAGER ====================
+#
+# Every device gets one worker thread that owns its client, so requests
+# from concurrent HTTP handlers are serialized instead of interleaving on
+# the same socket or serial port. Identical requests that are already
+# queued or running are coalesced: later callers wait on the same Future
+# and share one response. Connections idle for longer than the timeout are
+# closed and transparently reopened on the next request.
+#
+# A connection can also run a background poller that keeps a timestamped
+# snapshot of its latest read, so API requests are answered from memory and
+# the device load no longer grows with the number of clients.
+#
+# With a MetricsRegistry every connection records its request latency,
+# errors, reconnects and queue depth under its connection ID.
+#
+# Each connection has a circuit breaker: once a device keeps failing,
+# requests fail fast with CircuitOpenError instead of blocking its worker
+# on connect timeouts, and reconnects are attempted after a growing backoff.
+#
+# With a PipelinedTcpClient the worker only sends reads; their answers
+# complete the callers' Futures from the client's reader thread, so up to
+# the client's window of reads are on the wire at once.
+#
+# Reads larger than a unit accepts (as probed by modbus_logger.capabilities)
+# are split into several requests and their answers joined.
+
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+from pymodbus.client import ModbusTcpClient
+
+from modbus_logger.health import Backoff, CircuitBreaker, CircuitOpenError
+from modbus_logger.pipeline import PipelinedTcpClient
+from modbus_logger.read_plan import (
+    FC_READ_COILS, FC_READ_DISCRETE_INPUTS, FC_READ_HOLDING_REGISTERS, ReadBlock, block_request,
+)
+from modbus_logger.write_plan import COIL, WriteBatcher, write_request
+from modbus_logger.scheduler import ScanSchedule
+
+
+def block_addresses(block, response):
+    """Maps a block response to {address: value}."""
+    if block.function_code in (FC_READ_COILS, FC_READ_DISCRETE_INPUTS):
+        values = response.bits
+    else:
+        values = response.registers
+    return {block.address + offset: values[offset] for offset in range(block.count)}
+
+
+class JoinedResponse:
+    """Answers to the parts of a split read, shaped like one pymodbus response."""
+
+    def __init__(self, parts, responses):
+        # Bit responses are padded to whole bytes, so every part is cut to its count
+        self.registers = [value for part, response in zip(parts, responses)
+                          for value in response.registers[:part.count]]
+        self.bits = [value for part, response in zip(parts, responses) for value in response.bits[:part.count]]
+
+    def isError(self):
+        return False
+
+
+def join_reads(parts, futures):
+    """Returns a Future of the JoinedResponse of ``futures``, or of the first error response."""
+    joined = Future()
+    remaining = [len(futures)]
+    lock = threading.Lock()
+
+    def done(_):
+        with lock:
+            remaining[0] -= 1
+            if remaining[0]:
+                return
+        try:
+            responses = [future.result() for future in futures]
+        except Exception as e:
+            joined.set_exception(e)
+            return
+        failed = next((response for response in responses if response.isError()), None)
+        joined.set_result(failed if failed is not None else JoinedResponse(parts, responses))
+
+    for future in futures:
+        future.add_done_callback(done)
+    return joined
+
+
+class DeviceConnection:
+    """A client plus the worker thread that runs its requests one at a time."""
+
+    def __init__(self, connection_id, client, on_update=None, metrics=None, breaker=None):
+        self.connection_id = connection_id
+        self.client = client
+        self.metrics = metrics
+        self.breaker = breaker if breaker is not None else CircuitBreaker()
+        self.framer = "tcp" if isinstance(client, (ModbusTcpClient, PipelinedTcpClient)) else "rtu"
+        # Called as on_update(connection_id, timestamp, {address: value}) after every good read
+        self.on_update = on_update
+        self.last_used = time.monotonic()
+        self.requests_sent = 0
+        self.requests_coalesced = 0
+        # read key -> (timestamp, response) of the latest good read
+        self.snapshots = {}
+        self.poll_interval = None
+        self._pollers = {}  # read key -> poller thread
+        # unit ID -> DeviceCapabilities; reads larger than the unit accepts are split
+        self.capabilities = {}
+
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._in_flight = {}
+        self._closed = False
+        self.idle_closed = False
+        self._worker = threading.Thread(target=self._run, name=f"modbus-{connection_id}", daemon=True)
+        self._worker.start()
+
+    def submit(self, key, func):
+        """Queues ``func(client)`` and returns a Future with its result.
+
+        If a request with the same ``key`` is already queued or running, its
+        Future is returned instead of sending the request again.
+        """
+        with self._lock:
+            if self._closed:
+                raise ConnectionError(f"Connection {self.connection_id} is closed")
+            future = self._in_flight.get(key)
+            if future is not None:
+                self.requests_coalesced += 1
+                return future
+            future = Future()
+            self._in_flight[key] = future
+            self.last_used = time.monotonic()
+            self.idle_closed = False
+        self._queue.put((key, func, future))
+        self._report_queue_depth()
+        return future
+
+    def call(self, key, func, timeout=None):
+        """Runs ``func(client)`` through the queue and waits for the result."""
+        return self.submit(key, func).result(timeout)
+
+    def submit_read(self, block):
+        """Queues a block read and returns its Future, shared with identical reads in flight."""
+        device = self.capabilities.get(block.unit_id)
+        if device is not None and block.count > device.limit(block.function_code):
+            limit = device.limit(block.function_code)
+            parts = [block._replace(address=address, count=min(limit, block.address + block.count - address))
+                     for address in range(block.address, block.address + block.count, limit)]
+            return join_reads(parts, [self._submit_block(part) for part in parts])
+        return self._submit_block(block)
+
+    def _submit_block(self, block):
+        key = ("read", block.unit_id, block.function_code, block.address, block.count)
+        return self.submit(key, lambda client: self._read_block(client, key, block))
+
+    def read(self, block, timeout=None):
+        """Reads one block and waits for the response."""
+        return self.submit_read(block).result(timeout)
+
+    def _read_block(self, client, key, block):
+        if getattr(client, "pipelined", False):
+            # Returns the pending transaction; _run settles the caller's Future when it completes
+            started = time.perf_counter()
+            transaction = client.submit_block(block)
+            transaction.add_done_callback(lambda done: self._pipelined_read_done(key, block, done, started))
+            return transaction
+        if self.metrics is not None:
+            response = self.metrics.timed_request(self.connection_id, block,
+                                                  lambda: block_request(client, block), self.framer)
+        else:
+            response = block_request(client, block)
+        self._store_snapshot(key, block, response)
+        return response
+
+    def _pipelined_read_done(self, key, block, transaction, started):
+        error = transaction.exception()
+        if error is not None:
+            if self.metrics is not None:
+                self.metrics.observe_request(self.connection_id, block, time.perf_counter() - started,
+                                             error=error, framer=self.framer)
+            return
+        response = transaction.result()
+        if self.metrics is not None:
+            self.metrics.observe_request(self.connection_id, block, response.latency, response, framer=self.framer)
+        self._store_snapshot(key, block, response)
+
+    def _store_snapshot(self, key, block, response):
+        if not response.isError():
+            timestamp = time.time()
+            self.snapshots[key] = (timestamp, response)
+            if self.on_update is not None:
+                self.on_update(self.connection_id, timestamp, block_addresses(block, response))
+
+    def submit_write(self, block):
+        """Queues a WriteBlock and returns its Future; writes are never coalesced."""
+        return self.submit(("write", object()), lambda client: self._write_block(client, block))
+
+    def _write_block(self, client, block):
+        if self.metrics is not None:
+            response = self.metrics.timed_request(self.connection_id, block,
+                                                  lambda: write_request(client, block), self.framer)
+        else:
+            response = write_request(client, block)
+        # Snapshots of the written range are stale now; the next read goes to the device
+        function_code = FC_READ_COILS if block.kind == COIL else FC_READ_HOLDING_REGISTERS
+        end = block.address + len(block.values)
+        for key in list(self.snapshots):
+            _, unit_id, key_function_code, address, count = key
+            if (unit_id == block.unit_id and key_function_code == function_code
+                    and address < end and block.address < address + count):
+                self.snapshots.pop(key, None)
+        return response
+
+    def read_cached(self, block, max_age=None, timeout=None):
+        """Returns (timestamp, response), from the snapshot if it is recent enough.
+
+        With ``max_age`` None any snapshot is served; 0 always reads the device.
+        """
+        key = ("read", block.unit_id, block.function_code, block.address, block.count)
+        snapshot = self.snapshots.get(key)
+        if snapshot is not None and (max_age is None or time.time() - snapshot[0] <= max_age):
+            return snapshot
+        response = self.read(block, timeout)
+        return time.time(), response
+
+    def start_poller(self, block, interval):
+        """Keeps the snapshot of ``block`` fresh by reading it every ``interval`` seconds.
+
+        Returns False, without starting another thread, if ``block`` is already polled.
+        """
+        key = ("read", block.unit_id, block.function_code, block.address, block.count)
+        with self._lock:
+            poller = self._pollers.get(key)
+            if self._closed or (poller is not None and poller.is_alive()):
+                return False
+            self.poll_interval = interval
+            poller = self._pollers[key] = threading.Thread(target=self._poll, args=(block, interval),
+                                                           name=f"modbus-poll-{self.connection_id}", daemon=True)
+        poller.start()
+        return True
+
+    def _poll(self, block, interval):
+        schedule = ScanSchedule(interval)
+        while not self._closed:
+            schedule.wait()
+            if self._closed:
+                break
+            try:
+                self.read(block, timeout=max(interval, 1) * 10)
+            except Exception:
+                # The snapshot simply ages; clients can see that from its timestamp
+                pass
+
+    @property
+    def idle(self):
+        with self._lock:
+            return not self._in_flight and self._queue.empty()
+
+    def close_idle(self):
+        """Closes the socket/port; the next request reconnects."""
+        with self._lock:
+            self.idle_closed = True
+        self._queue.put((None, lambda client: client.close(), None))
+
+    def close(self):
+        """Stops the worker after the queued requests and closes the client."""
+        with self._lock:
+            self._closed = True
+        self._queue.put(None)
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            key, func, future = item
+            self._report_queue_depth()
+            if future is None:
+                func(self.client)
+                continue
+            try:
+                if not self.breaker.allow():
+                    raise CircuitOpenError(f"Connection {self.connection_id} is unavailable, "
+                                           f"next attempt in {self.breaker.retry_in():.1f} s")
+                if not self.client.connected:
+                    self._reconnect()
+                self.requests_sent += 1
+                result = func(self.client)
+            except CircuitOpenError as e:
+                self._finish(key, future, exception=e)
+            except BaseException as e:
+                self._settle(key, future, exception=e)
+            else:
+                if isinstance(result, Future):
+                    # A pipelined read still on the wire
+                    result.add_done_callback(lambda done, key=key, future=future: self._settle_transaction(
+                        key, future, done))
+                else:
+                    self._settle(key, future, result=result)
+        self.client.close()
+
+    def _settle(self, key, future, result=None, exception=None):
+        if exception is not None:
+            if self.breaker.record_failure():
+                # The probe after the backoff starts with a fresh connection
+                self.client.close()
+        else:
+            self.breaker.record_success()
+        self._finish(key, future, result, exception)
+
+    def _settle_transaction(self, key, future, transaction):
+        error = transaction.exception()
+        if error is not None:
+            self._settle(key, future, exception=error)
+        else:
+            self._settle(key, future, result=transaction.result())
+
+    def _reconnect(self):
+        connected = self.client.connect()
+        if self.metrics is not None:
+            self.metrics.count(self.connection_id, "reconnects" if connected else "connect_failures")
+        if not connected:
+            self.breaker.trip()
+            raise CircuitOpenError(f"Failed to reconnect {self.connection_id}, "
+                                   f"next attempt in {self.breaker.retry_in():.1f} s")
+
+    def _report_queue_depth(self):
+        if self.metrics is not None:
+            self.metrics.set_gauge(self.connection_id, "request_queue_depth", self._queue.qsize())
+
+    def _finish(self, key, future, result=None, exception=None):
+        # Callers arriving from now on get a fresh request, not this result
+        with self._lock:
+            self._in_flight.pop(key, None)
+            self.last_used = time.monotonic()
+        if exception is not None:
+            future.set_exception(exception)
+        else:
+            future.set_result(result)
+
+
+class ConnectionManager:
+    """Thread-safe registry of device connections with idle timeout."""
+
+    def __init__(self, idle_timeout=300, check_interval=5, on_update=None, metrics=None,
+                 failure_threshold=3, backoff_initial=1.0, backoff_max=60.0):
+        self.idle_timeout = idle_timeout
+        self.on_update = on_update
+        self.metrics = metrics
+        self.failure_threshold = failure_threshold
+        self.backoff_initial = backoff_initial
+        self.backoff_max = backoff_max
+        self._connections = {}
+        self._lock = threading.Lock()
+        self._reaper = threading.Thread(target=self._reap_idle, args=(check_interval,),
+                                        name="modbus-idle-reaper", daemon=True)
+        self._reaper.start()
+
+    def __contains__(self, connection_id):
+        with self._lock:
+            return connection_id in self._connections
+
+    def add(self, connection_id, client):
+        """Registers a connected client; returns False if the ID is already in use."""
+        with self._lock:
+            if connection_id in self._connections:
+                return False
+            breaker = CircuitBreaker(self.failure_threshold, Backoff(self.backoff_initial, self.backoff_max))
+            self._connections[connection_id] = DeviceConnection(connection_id, client, self.on_update,
+                                                              self.metrics, breaker)
+            return True
+
+    def start_polling(self, connection_id, function_code, address, count, interval, unit_id=1):
+        """Starts a background poller that keeps one block's snapshot fresh; False if it already runs."""
+        connection = self.get(connection_id)
+        if connection is None:
+            raise KeyError(connection_id)
+        return connection.start_poller(ReadBlock(unit_id, function_code, address, count, ()), interval)
+
+    def get(self, connection_id):
+        with self._lock:
+            return self._connections.get(connection_id)
+
+    def remove(self, connection_id):
+        """Closes and forgets a connection; returns False if it did not exist."""
+        with self._lock:
+            connection = self._connections.pop(connection_id, None)
+        if connection is None:
+            return False
+        connection.close()
+        return True
+
+    def read(self, connection_id, function_code, address, count, unit_id=1, timeout=None):
+        """Reads one block on a connection, sharing the response with identical reads in flight."""
+        connection = self.get(connection_id)
+        if connection is None:
+            raise KeyError(connection_id)
+        return connection.read(ReadBlock(unit_id, function_code, address, count, ()), timeout)
+
+    def submit_read(self, connection_id, function_code, address, count, unit_id=1):
+        """Queues a read without waiting; reads on different devices run in parallel."""
+        connection = self.get(connection_id)
+        if connection is None:
+            raise KeyError(connection_id)
+        return connection.submit_read(ReadBlock(unit_id, function_code, address, count, ()))
+
+    def read_cached(self, connection_id, function_code, address, count, unit_id=1, max_age=None,
+                    timeout=None):
+        """Returns (timestamp, response), served from the poller's snapshot when fresh enough."""
+        connection = self.get(connection_id)
+        if connection is None:
+            raise KeyError(connection_id)
+        block = ReadBlock(unit_id, function_code, address, count, ())
+        return connection.read_cached(block, max_age, timeout)
+
+    def write(self, connection_id, writes, timeout=None):
+        """Writes [(address, value, kind, unit_id)] combined into multi-writes.
+
+        Returns one WriteResult per write, in order.
+        """
+        connection = self.get(connection_id)
+        if connection is None:
+            raise KeyError(connection_id)
+        batcher = WriteBatcher(lambda block: connection.submit_write(block).result(timeout))
+        for write in writes:
+            batcher.write(*write)
+        return batcher.flush()
+
+    def close_all(self):
+        with self._lock:
+            connections = list(self._connections.values())
+            self._connections.clear()
+        for connection in connections:
+            connection.close()
+
+    def _reap_idle(self, check_interval):
+        while True:
+            time.sleep(check_interval)
+            now = time.monotonic()
+            with self._lock:
+                connections = list(self._connections.values())
+            for connection in connections:
+                if (not connection.idle_closed and connection.idle
+                        and now - connection.last_used > self.idle_timeout):
+                    connection.close_idle()
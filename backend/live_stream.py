@@ -0,0 +1,104 @@
+# ==================== LIVE DATA STREAM ====================
+#
+# Fan-out of polled values to server-sent event (SSE) subscribers. Pollers
+# publish every read; only values that changed are forwarded. Each
+# subscriber keeps just the latest pending value per connection and tag,
+# so a slow consumer gets conflated updates instead of a growing backlog,
+# and updates are sent as one batch per tick.
+
+import threading
+import time
+
+
+class Subscription:
+    """Pending updates for one stream client, filtered by connection and tag."""
+
+    def __init__(self, connection_ids=None, tags=None, tick=0.1):
+        self.connection_ids = set(connection_ids) if connection_ids else None
+        self.tags = set(tags) if tags else None
+        self.tick = tick
+        self.dropped = 0
+
+        self._pending = {}
+        self._condition = threading.Condition()
+        self._last_sent = 0.0
+
+    def wants(self, connection_id):
+        return self.connection_ids is None or connection_id in self.connection_ids
+
+    def offer(self, connection_id, timestamp, values):
+        """Merges changed values; anything not yet sent is overwritten by newer values."""
+        if self.tags is not None:
+            values = {tag: value for tag, value in values.items() if tag in self.tags}
+        if not values:
+            return
+        with self._condition:
+            pending = self._pending.setdefault(connection_id, {"timestamp": timestamp, "values": {}})
+            self.dropped += len(pending["values"].keys() & values.keys())
+            pending["timestamp"] = timestamp
+            pending["values"].update(values)
+            self._condition.notify()
+
+    def next_batch(self, timeout=15):
+        """Waits for updates and returns them as one batch (empty on timeout).
+
+        Batches are at least ``tick`` seconds apart; updates arriving in
+        between are merged into the next one.
+        """
+        delay = self._last_sent + self.tick - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        with self._condition:
+            if not self._pending:
+                self._condition.wait(timeout)
+            batch = [
+                {"connection_id": connection_id, "timestamp": update["timestamp"],
+                 "values": {str(tag): value for tag, value in update["values"].items()}}
+                for connection_id, update in self._pending.items()
+            ]
+            self._pending = {}
+        self._last_sent = time.monotonic()
+        return batch
+
+
+class LiveHub:
+    """Tracks the last published values and forwards changes to subscribers."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscriptions = []
+        self._latest = {}  # connection_id -> (timestamp, {tag: value})
+
+    def subscribe(self, connection_ids=None, tags=None, tick=0.1):
+        """Registers a subscription and seeds it with the current values."""
+        subscription = Subscription(connection_ids, tags, tick)
+        with self._lock:
+            self._subscriptions.append(subscription)
+            latest = list(self._latest.items())
+        for connection_id, (timestamp, values) in latest:
+            if subscription.wants(connection_id):
+                subscription.offer(connection_id, timestamp, values)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            if subscription in self._subscriptions:
+                self._subscriptions.remove(subscription)
+
+    def publish(self, connection_id, timestamp, values):
+        """Forwards the values that differ from the last ones published for the connection."""
+        with self._lock:
+            _, previous = self._latest.get(connection_id, (None, {}))
+            changed = {tag: value for tag, value in values.items()
+                       if tag not in previous or previous[tag] != value}
+            self._latest[connection_id] = (timestamp, {**previous, **values})
+            subscriptions = [s for s in self._subscriptions if s.wants(connection_id)]
+        if not changed:
+            return
+        for subscription in subscriptions:
+            subscription.offer(connection_id, timestamp, changed)
+
+    def forget(self, connection_id):
+        """Drops the cached values of a closed connection."""
+        with self._lock:
+            self._latest.pop(connection_id, None)
@@ -1,13 +1,114 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify, stream_with_context
 from flask_cors import CORS
 from pymodbus.client import ModbusTcpClient, ModbusSerialClient
+import atexit
+import json
+import math
+import os
+import sys
+import threading
 import time
+from concurrent.futures import TimeoutError as FutureTimeoutError
+
+# Shared acquisition components live in the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from modbus_logger.capabilities import CapabilityCache, device_key, load_capabilities
+from modbus_logger.capture import CaptureWriter, capture_kwargs
+from modbus_logger.live_table import QUALITY_NAMES, LiveTable
+from modbus_logger.metrics import MetricsRegistry
+from modbus_logger.pipeline import PipelinedTcpClient
+from modbus_logger.read_plan import FC_READ_COILS, FC_READ_DISCRETE_INPUTS, MAX_READ_COUNT
+from modbus_logger.ring_store import RingStore
+from modbus_logger.rollups import DEFAULT_CAPACITY as ROLLUP_RESOLUTIONS, query_history, rollup_path
+from modbus_logger.write_plan import COIL, REGISTER, compile_write_plan
+from connection_manager import ConnectionManager
+from live_stream import LiveHub
 
 app = Flask(__name__)
 CORS(app)
 
-# Store active connections
-active_connections = {}
+# Active connections; each device serializes its own requests
+IDLE_TIMEOUT = int(os.environ.get('MODBUS_IDLE_TIMEOUT', 300))  # Seconds before an unused socket is closed
+REQUEST_TIMEOUT = 10  # Seconds an HTTP request waits for its turn on the device
+live_hub = LiveHub()  # Pushes changed values to /api/stream subscribers
+metrics = MetricsRegistry()  # Per-connection request metrics, served on /metrics
+active_connections = ConnectionManager(idle_timeout=IDLE_TIMEOUT, on_update=live_hub.publish,
+                                       metrics=metrics)
+
+# Probed block sizes, readable ranges and function codes per host:port/unit (see /api/capabilities)
+CAPABILITIES_FILE = os.environ.get('MODBUS_CAPABILITIES_FILE', 'device_capabilities.json')
+PROBE_TIMEOUT = 300  # Seconds a probe may take; every failed read costs up to the device timeout
+capability_cache = CapabilityCache(CAPABILITIES_FILE)
+connection_devices = {}  # connection ID -> (host or serial port, TCP port or None)
+
+# Traffic of every connection is recorded here for benchmarks/replay.py when set
+CAPTURE_FILE = os.environ.get('MODBUS_CAPTURE_FILE')
+capture = CaptureWriter(CAPTURE_FILE) if CAPTURE_FILE else None
+if capture is not None:
+    atexit.register(capture.close)
+
+# Block served by /api/read (you can modify this based on your needs)
+READ_FUNCTION_CODE = FC_READ_COILS
+READ_ADDRESS = 6304
+READ_COUNT = 1
+
+# Recent history written by the logger; ?store=<name> picks another file in the same folder
+RING_STORE_FILE = os.environ.get('MODBUS_RING_STORE', 'plc_data.ring')
+ring_stores = {}
+ring_stores_lock = threading.Lock()
+
+def open_ring_store(path):
+    with ring_stores_lock:
+        store = ring_stores.get(path)
+        if store is not None and store.replaced():
+            # The logger recreated the file (new tags or capacity): map the new one
+            del ring_stores[path]
+            try:
+                store.close()
+            except BufferError:
+                pass  # A request still holds a view; the old mapping goes when it does
+            store = None
+        if store is None:
+            store = ring_stores[path] = RingStore.open(path)
+        return store
+
+def get_ring_store(name=None):
+    path = RING_STORE_FILE
+    if name:
+        path = os.path.join(os.path.dirname(RING_STORE_FILE), os.path.basename(name))
+    return open_ring_store(path)
+
+def json_value(value):
+    # Missing samples are NaN in float columns; JSON has no NaN or infinity
+    if isinstance(value, float) and not math.isfinite(value):
+        return None
+    return value
+
+def get_history_sources(name=None):
+    # The raw samples (resolution 0) plus whichever rollups the logger keeps next to them
+    store = get_ring_store(name)
+    sources = {0: store}
+    for resolution in ROLLUP_RESOLUTIONS:
+        try:
+            sources[resolution] = open_ring_store(rollup_path(store.path, resolution))
+        except (OSError, ValueError):
+            pass
+    return sources
+
+# Latest values the logger publishes in shared memory (LIVE_TABLE_NAME in pymodbus_nogui.py)
+LIVE_TABLE_NAME = os.environ.get('MODBUS_LIVE_TABLE', 'plc_live')
+live_table = None
+live_table_lock = threading.Lock()
+
+def get_live_table():
+    # Attaches again after the logger restarted and published a new table
+    global live_table
+    if live_table is not None and live_table.closed:
+        live_table.close()
+        live_table = None
+    if live_table is None:
+        live_table = LiveTable.attach(LIVE_TABLE_NAME)
+    return live_table
 
 @app.route('/api/connect', methods=['POST'])
 def connect():
@@ -22,12 +123,20 @@ def connect():
             }), 400
 
         client = None
-        if data['type'] == 'tcp':
+        device = (data['host'], int(data['port'])) if data['type'] == 'tcp' else (data['port_name'], None)
+        source = f'{device[0]}:{device[1]}' if device[1] is not None else device[0]  # Name in the capture
+        if data['type'] == 'tcp' and int(data.get('pipeline_window') or 1) > 1:
+            # Several requests in flight on one socket, for devices that queue them
+            client = PipelinedTcpClient(data['host'], int(data['port']), int(data['pipeline_window']),
+                                        timeout=int(data['timeout']),
+                                        **capture_kwargs(PipelinedTcpClient, capture, source))
+        elif data['type'] == 'tcp':
             client = ModbusTcpClient(
                 host=data['host'],
                 port=int(data['port']),
                 timeout=int(data['timeout']),
-                retries=int(data['retries'])
+                retries=int(data['retries']),
+                **capture_kwargs(ModbusTcpClient, capture, source)
             )
         else:  # rtu or ascii
             client = ModbusSerialClient(
@@ -37,13 +146,28 @@ def connect():
                 parity=data['parity'],
                 stopbits=int(data['stopbits']),
                 bytesize=int(data['bytesize']),
-                timeout=int(data['timeout'])
+                timeout=int(data['timeout']),
+                **capture_kwargs(ModbusSerialClient, capture, source)
             )
 
         # Try to connect
         success = client.connect()
         if success:
-            active_connections[connection_id] = client
+            if not active_connections.add(connection_id, client):
+                client.close()
+                return jsonify({
+                    'success': False,
+                    'message': 'Connection already exists'
+                }), 400
+
+            # Units probed before are sized from the cache straight away
+            connection_devices[connection_id] = device
+            active_connections.get(connection_id).capabilities.update(capability_cache.for_device(*device))
+
+            # Optional background poller: /api/read is then served from its snapshot
+            if data.get('poll_interval'):
+                active_connections.start_polling(connection_id, READ_FUNCTION_CODE, READ_ADDRESS,
+                                                 READ_COUNT, float(data['poll_interval']))
             return jsonify({
                 'success': True,
                 'message': f'Successfully connected to {data["name"]}'
@@ -63,10 +187,9 @@ def connect():
 @app.route('/api/disconnect/<connection_id>', methods=['POST'])
 def disconnect(connection_id):
     try:
-        if connection_id in active_connections:
-            client = active_connections[connection_id]
-            client.close()
-            del active_connections[connection_id]
+        if active_connections.remove(connection_id):
+            live_hub.forget(connection_id)
+            connection_devices.pop(connection_id, None)
             return jsonify({
                 'success': True,
                 'message': 'Successfully disconnected'
@@ -90,10 +213,14 @@ def read_data(connection_id):
                 'message': 'Connection not found'
             }), 404
 
-        client = active_connections[connection_id]
-        
-        # Read coils (you can modify this based on your needs)
-        response = client.read_coils(address=6304, count=1)
+        # Served from the poller's snapshot when there is one; ?max_age=<seconds>
+        # forces a device read if the snapshot is older (max_age=0 always reads).
+        # Concurrent identical reads share a single request to the device.
+        max_age = request.args.get('max_age', type=float)
+        timestamp, response = active_connections.read_cached(
+            connection_id, READ_FUNCTION_CODE, READ_ADDRESS, READ_COUNT,
+            max_age=max_age, timeout=REQUEST_TIMEOUT
+        )
         
         if response.isError():
             return jsonify({
@@ -103,7 +230,267 @@ def read_data(connection_id):
 
         return jsonify({
             'success': True,
-            'data': response.bits
+            'data': response.bits,
+            'timestamp': timestamp,
+            'age': max(0.0, time.time() - timestamp)
+        })
+
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'message': str(e)
+        }), 500
+
+@app.route('/api/capabilities/<connection_id>', methods=['GET', 'POST'])
+def capabilities(connection_id):
+    """What the units of a connection accept: function codes, largest read, readable ranges.
+
+    GET returns the known units. POST probes one unit over the given spans,
+    or takes it from the cache if it covers them (unless "reprobe" is set):
+    {"unit_id": 1, "spans": [{"function_code": 3, "address": 0, "count": 500}]}
+    From then on reads larger than the unit accepts are split.
+    """
+    try:
+        connection = active_connections.get(connection_id)
+        if connection is None:
+            return jsonify({
+                'success': False,
+                'message': 'Connection not found'
+            }), 404
+
+        if request.method == 'GET':
+            return jsonify({
+                'success': True,
+                'units': {str(unit_id): found.to_dict() for unit_id, found in connection.capabilities.items()}
+            })
+
+        data = request.json or {}
+        unit_id = int(data.get('unit_id', 1))
+        tags = []
+        for span in data.get('spans', []):
+            function_code = int(span['function_code'])
+            address = int(span['address'])
+            count = int(span.get('count', 1))
+            if function_code not in MAX_READ_COUNT or count < 1:
+                return jsonify({
+                    'success': False,
+                    'message': 'Invalid function code or count'
+                }), 400
+            # The probe covers the span between a unit's first and last tag
+            tags += [(address, function_code, unit_id), (address + count - 1, function_code, unit_id)]
+        if not tags:
+            return jsonify({
+                'success': False,
+                'message': 'No spans to probe'
+            }), 400
+
+        key = device_key(*connection_devices[connection_id], unit_id)
+        reprobe = bool(data.get('reprobe'))
+        # Runs on the connection's worker, so it never interleaves with other requests
+        found = connection.call(('probe', unit_id),
+                                lambda client: load_capabilities(capability_cache, key, client, unit_id, tags, reprobe),
+                                timeout=PROBE_TIMEOUT)
+        connection.capabilities[unit_id] = found
+        return jsonify({
+            'success': True,
+            'requests': found.requests,
+            'capabilities': found.to_dict()
+        })
+
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'message': str(e)
+        }), 500
+
+@app.route('/api/read/batch', methods=['POST'])
+def read_batch():
+    """Runs many reads in one call: in parallel across devices, in order per device.
+
+    Body: {"requests": [{"connection_id", "function_code", "address", "count", "unit_id"}]}
+    """
+    try:
+        items = request.json.get('requests', [])
+        started = time.perf_counter()
+        pending = []
+        results = []
+
+        # Queue everything first so every device starts working at once
+        for item in items:
+            result = {
+                'connection_id': item.get('connection_id'),
+                'function_code': item.get('function_code', FC_READ_COILS),
+                'address': item.get('address'),
+                'count': item.get('count', 1),
+            }
+            results.append(result)
+            try:
+                function_code = int(result['function_code'])
+                address = int(result['address'])
+                count = int(result['count'])
+                if function_code not in MAX_READ_COUNT or not 1 <= count <= MAX_READ_COUNT[function_code]:
+                    raise ValueError('Invalid function code or count')
+                future = active_connections.submit_read(result['connection_id'], function_code, address,
+                                                        count, int(item.get('unit_id', 1)))
+            except KeyError:
+                result.update(success=False, message='Connection not found')
+                continue
+            except (TypeError, ValueError) as e:
+                result.update(success=False, message=str(e))
+                continue
+
+            finished = {}
+            future.add_done_callback(lambda _, finished=finished: finished.setdefault('at', time.perf_counter()))
+            pending.append((result, future, finished))
+
+        deadline = started + REQUEST_TIMEOUT
+        for result, future, finished in pending:
+            try:
+                response = future.result(max(0.0, deadline - time.perf_counter()))
+            except FutureTimeoutError:
+                result.update(success=False, message='Timed out')
+            except Exception as e:
+                result.update(success=False, message=str(e))
+            else:
+                if response.isError():
+                    result.update(success=False, message=str(response))
+                else:
+                    bits = int(result['function_code']) in (FC_READ_COILS, FC_READ_DISCRETE_INPUTS)
+                    values = response.bits if bits else response.registers
+                    result.update(success=True, data=values[:int(result['count'])])
+            result['latency_ms'] = round((finished.get('at', time.perf_counter()) - started) * 1000, 3)
+
+        return jsonify({
+            'success': True,
+            'results': results,
+            'elapsed_ms': round((time.perf_counter() - started) * 1000, 3)
+        })
+
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'message': str(e)
+        }), 500
+
+@app.route('/api/write/<connection_id>', methods=['POST'])
+def write_data(connection_id):
+    """Writes many registers/coils, combining contiguous addresses into multi-writes.
+
+    Body: {"writes": [{"address", "value", "type": "register"|"coil", "unit_id"}]}
+    or {"registers": {"<address>": value}} / {"coils": {"<address>": value}}
+    """
+    try:
+        if connection_id not in active_connections:
+            return jsonify({
+                'success': False,
+                'message': 'Connection not found'
+            }), 404
+
+        data = request.json
+        unit_id = int(data.get('unit_id', 1))
+        try:
+            writes = [(int(item['address']), item['value'], item.get('type', REGISTER),
+                       int(item.get('unit_id', unit_id)))
+                      for item in data.get('writes', [])]
+            for kind, key in ((REGISTER, 'registers'), (COIL, 'coils')):
+                writes.extend((int(address), value, kind, unit_id)
+                              for address, value in data.get(key, {}).items())
+            requests_needed = len(compile_write_plan(writes))
+        except (KeyError, TypeError, ValueError) as e:
+            return jsonify({
+                'success': False,
+                'message': f'Invalid write: {e}'
+            }), 400
+
+        results = active_connections.write(connection_id, writes, timeout=REQUEST_TIMEOUT)
+        return jsonify({
+            'success': all(result.success for result in results),
+            'requests': requests_needed,
+            'results': [{
+                'address': result.address,
+                'value': result.value,
+                'type': result.kind,
+                'unit_id': result.unit_id,
+                'success': result.success,
+                'message': result.error,
+                'superseded': result.superseded
+            } for result in results]
+        })
+
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'message': str(e)
+        }), 500
+
+@app.route('/api/stream', methods=['GET'])
+def stream_data():
+    """Server-sent events with the values that changed since the last batch.
+
+    ?connections=a,b and ?tags=6304,6305 narrow the stream; ?tick=<seconds>
+    sets the minimum time between batches. Values arrive as connections are
+    polled (see poll_interval in /api/connect) or read.
+    """
+    connection_ids = [c for c in request.args.get('connections', '').split(',') if c]
+    try:
+        tags = [int(tag) for tag in request.args.get('tags', '').split(',') if tag]
+        tick = float(request.args.get('tick', 0.1))
+        if any(tag < 0 or tag > 0xFFFF for tag in tags):
+            raise ValueError('tag addresses must be 0-65535')
+        if not 0 < tick < 3600:
+            raise ValueError('tick must be between 0 and 3600 seconds')
+        tick = max(0.02, tick)
+    except ValueError as e:
+        return jsonify({
+            'success': False,
+            'message': f'Invalid stream parameters: {e}'
+        }), 400
+
+    def events():
+        subscription = live_hub.subscribe(connection_ids, tags, tick)
+        try:
+            yield 'retry: 2000\n\n'
+            while True:
+                batch = subscription.next_batch()
+                if batch:
+                    yield f'data: {json.dumps(batch)}\n\n'
+                else:
+                    yield ': keepalive\n\n'
+        finally:
+            live_hub.unsubscribe(subscription)
+
+    return Response(stream_with_context(events()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@app.route('/api/history/recent/<column>', methods=['GET'])
+def recent_history(column):
+    try:
+        seconds = float(request.args.get('seconds', 600))
+        try:
+            store = get_ring_store(request.args.get('store'))
+        except (OSError, ValueError):
+            return jsonify({
+                'success': False,
+                'message': 'History store not found'
+            }), 404
+
+        if column not in store.columns:
+            return jsonify({
+                'success': False,
+                'message': 'Column not found'
+            }), 404
+
+        end = time.time()
+        timestamps = []
+        values = []
+        for timestamp_view, value_view in store.range(end - seconds, end, column):
+            timestamps.extend(timestamp_view.tolist())
+            values.extend(map(json_value, value_view.tolist()))
+
+        return jsonify({
+            'success': True,
+            'timestamps': timestamps,
+            'values': values
         })
 
     except Exception as e:
@@ -112,5 +499,108 @@ def read_data(connection_id):
             'message': str(e)
         }), 500
 
+@app.route('/api/live', methods=['GET'])
+def live_values():
+    """Latest value, quality and timestamp per tag from the logger's live table.
+
+    ?tags=a,b narrows the result. Nothing is read from the PLC, so any
+    number of clients can poll this while the logger owns the connection.
+    """
+    tags = [tag for tag in request.args.get('tags', '').split(',') if tag]
+    try:
+        with live_table_lock:
+            try:
+                table = get_live_table()
+            except (OSError, ValueError):
+                return jsonify({
+                    'success': False,
+                    'message': 'Live table not found (is the logger running?)'
+                }), 404
+
+            unknown = [tag for tag in tags if tag not in table.index]
+            if unknown:
+                return jsonify({
+                    'success': False,
+                    'message': f"Unknown tag(s): {', '.join(unknown)}"
+                }), 404
+
+            sequence = table.sequence
+            snapshot = table.snapshot(tags or None)
+
+        return jsonify({
+            'success': True,
+            'sequence': sequence,
+            'values': {
+                tag: {
+                    'value': json_value(live.value),
+                    'quality': QUALITY_NAMES.get(live.quality, 'unknown'),
+                    'timestamp': live.timestamp
+                }
+                for tag, live in snapshot.items()
+            }
+        })
+
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'message': str(e)
+        }), 500
+
+@app.route('/api/history/<column>', methods=['GET'])
+def history(column):
+    """Trend of one column as count/min/max/avg/last per time bucket.
+
+    ?start and ?end are Unix times (default: the last hour) and ?width is
+    the chart width in pixels; about one bucket is returned per pixel. Long
+    ranges are served from the logger's 1 s / 1 min / 1 h rollups.
+    """
+    try:
+        end = request.args.get('end', time.time(), type=float)
+        start = request.args.get('start', end - 3600, type=float)
+        width = min(max(request.args.get('width', 1000, type=int), 1), 10000)
+        if start > end:
+            return jsonify({
+                'success': False,
+                'message': 'start must not be after end'
+            }), 400
+
+        try:
+            sources = get_history_sources(request.args.get('store'))
+        except (OSError, ValueError):
+            return jsonify({
+                'success': False,
+                'message': 'History store not found'
+            }), 404
+
+        if column not in sources[0].columns:
+            return jsonify({
+                'success': False,
+                'message': 'Column not found'
+            }), 404
+
+        bucket, rows = query_history(sources, column, start, end, width)
+        return jsonify({
+            'success': True,
+            'bucket': bucket,
+            'timestamps': [row[0] for row in rows],
+            'count': [row[1] for row in rows],
+            'min': [json_value(row[2]) for row in rows],
+            'max': [json_value(row[3]) for row in rows],
+            'avg': [json_value(row[4]) for row in rows],
+            'last': [json_value(row[5]) for row in rows]
+        })
+
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'message': str(e)
+        }), 500
+
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    # Prometheus text format: request latency histograms, timeouts, reconnects,
+    # bytes on the wire and request queue depth per connection
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4; charset=utf-8')
+
 if __name__ == '__main__':
-    app.run(port=5000) 
\ No newline at end of file
+    app.run(port=5000, threaded=True) 
\ No newline at end of file
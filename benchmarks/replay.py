@@ -0,0 +1,251 @@
+# ==================== CAPTURE REPLAY SERVER ====================
+#
+# Serves a capture written by modbus_logger.capture (CAPTURE_FILE in
+# pymodbus_nogui.py, MODBUS_CAPTURE_FILE for the backend) as local Modbus
+# devices, so the logging pipeline can be load-tested and profiled against
+# real plant traffic on a machine without a PLC:
+#
+#   python benchmarks/replay.py plc.mbcap --port 5020 --speed 10
+#   python benchmarks/replay.py plc.mbcap --serial /dev/ttyUSB1 --baudrate 19200
+#
+# Every source in the capture gets its own TCP port (--port, --port + 1,
+# ...), or one source is served as RTU slave(s) on a serial port. A request
+# is answered with the response recorded for the same unit and request PDU
+# at the current point of the replay clock, which runs --speed times as
+# fast as the capture and starts over at its end. Recorded latencies are
+# divided by the speed too, and requests that went unanswered stay
+# unanswered. Writes that weren't captured are acknowledged; any other
+# request that wasn't captured gets an "illegal data address" exception.
+
+import argparse
+import asyncio
+import os
+import struct
+import sys
+import threading
+import time
+from bisect import bisect_right
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCHMARK_DIR))
+
+from modbus_logger.capture import read_capture
+
+MBAP = struct.Struct(">HHHB")  # transaction ID, protocol ID, length, unit ID
+WRITE_FUNCTION_CODES = (5, 6, 15, 16)
+ILLEGAL_DATA_ADDRESS = 2
+
+
+class ReplaySource:
+    """Recorded answers of one device, by unit ID and request PDU."""
+
+    def __init__(self, name):
+        self.name = name
+        self.transactions = 0
+        # (unit ID, request PDU) -> ([timestamps], [(response, latency)])
+        self._answers = {}
+
+    def add(self, transaction):
+        timestamps, answers = self._answers.setdefault((transaction.unit_id, transaction.request), ([], []))
+        timestamps.append(transaction.timestamp)
+        answers.append((transaction.response if transaction.latency is not None else None, transaction.latency))
+        self.transactions += 1
+
+    def units(self):
+        """Unit IDs with recorded requests."""
+        return sorted({unit_id for unit_id, _ in self._answers})
+
+    def answer(self, unit_id, request, position):
+        """(response PDU or None for no answer, latency) at capture time ``position``."""
+        entry = self._answers.get((unit_id, bytes(request)))
+        if entry is None:
+            if request[0] in WRITE_FUNCTION_CODES:
+                # The normal answer to every write echoes its address and value/quantity
+                return bytes(request[:5]), 0.0
+            return bytes([request[0] | 0x80, ILLEGAL_DATA_ADDRESS]), 0.0
+        timestamps, answers = entry
+        return answers[max(bisect_right(timestamps, position) - 1, 0)]
+
+
+def load_capture(path):
+    """Returns ({source name: ReplaySource}, first timestamp, last timestamp)."""
+    sources = {}
+    start = end = None
+    for transaction in read_capture(path):
+        source = sources.get(transaction.source)
+        if source is None:
+            source = sources[transaction.source] = ReplaySource(transaction.source)
+        source.add(transaction)
+        start = transaction.timestamp if start is None else start
+        end = transaction.timestamp
+    if start is None:
+        raise ValueError(f"{path} holds no transactions")
+    return sources, start, end
+
+
+class ReplayClock:
+    """Capture time that runs ``speed`` times as fast as the wall clock, from ``start`` to ``end``."""
+
+    def __init__(self, start, end, speed=1.0, loop=True):
+        self.start = start
+        self.duration = max(end - start, 1e-6)
+        self.speed = speed
+        self.loop = loop
+        self._began = time.monotonic()
+
+    def position(self):
+        elapsed = (time.monotonic() - self._began) * self.speed
+        if self.loop:
+            elapsed %= self.duration
+        return self.start + min(elapsed, self.duration)
+
+
+# ==================== TCP ====================
+
+def serve_replay_tcp(source, clock, port, host="127.0.0.1", latency=True):
+    """Serves ``source`` on a TCP port in a background thread with its own event loop.
+
+    Requests on one connection are answered in order, like a PLC works
+    through its queue. A header with a protocol ID other than 0 or a length
+    below 2 closes the connection.
+    """
+    async def handle(reader, writer):
+        try:
+            while True:
+                header = await reader.readexactly(MBAP.size)
+                transaction_id, protocol_id, length, unit_id = MBAP.unpack(header)
+                if protocol_id != 0 or length < 2:
+                    # Not Modbus (or no function code): the stream can't be trusted any more
+                    break
+                request = await reader.readexactly(length - 1)
+                response, seconds = source.answer(unit_id, request, clock.position())
+                if latency and seconds:
+                    await asyncio.sleep(seconds / clock.speed)
+                if response is None:
+                    continue
+                writer.write(MBAP.pack(transaction_id, protocol_id, len(response) + 1, unit_id) + response)
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    def run():
+        async def main():
+            server = await asyncio.start_server(handle, host, port)
+            await server.serve_forever()
+        asyncio.run(main())
+
+    thread = threading.Thread(target=run, name=f"replay-tcp-{port}", daemon=True)
+    thread.start()
+    return thread
+
+
+# ==================== RTU ====================
+
+def crc16(data):
+    """Modbus RTU CRC, low byte first on the wire."""
+    crc = 0xFFFF
+    for byte in data:
+        crc ^= byte
+        for _ in range(8):
+            crc = (crc >> 1) ^ 0xA001 if crc & 1 else crc >> 1
+    return struct.pack("<H", crc)
+
+
+def rtu_request_length(buffer):
+    """Length of the request frame at the start of ``buffer``, None until it can be told."""
+    if len(buffer) < 2:
+        return None
+    function_code = buffer[1]
+    if function_code in (15, 16):
+        return 9 + buffer[6] if len(buffer) >= 7 else None
+    return 8  # Reads and single writes: unit, function code, address, value/quantity, CRC
+
+
+def serve_replay_rtu(sources, clock, port_name, baudrate=9600, latency=True):
+    """Answers as RTU slave(s) on a serial port in a background thread.
+
+    ``sources`` maps unit IDs to the ReplaySource that answers for them;
+    requests to other units are ignored, as on a shared line.
+    """
+    import serial
+
+    def run():
+        port = serial.Serial(port_name, baudrate, timeout=0.05)
+        buffer = bytearray()
+        while True:
+            data = port.read(256)
+            if not data:
+                # A silent line ends whatever garbage is in the buffer
+                buffer.clear()
+                continue
+            buffer += data
+            while True:
+                length = rtu_request_length(buffer)
+                if length is None or len(buffer) < length:
+                    break
+                frame, buffer = bytes(buffer[:length]), buffer[length:]
+                if crc16(frame[:-2]) != frame[-2:] or frame[0] not in sources:
+                    continue
+                response, seconds = sources[frame[0]].answer(frame[0], frame[1:-2], clock.position())
+                if latency and seconds:
+                    time.sleep(seconds / clock.speed)
+                if response is not None:
+                    reply = bytes([frame[0]]) + response
+                    port.write(reply + crc16(reply))
+
+    thread = threading.Thread(target=run, name=f"replay-rtu-{port_name}", daemon=True)
+    thread.start()
+    return thread
+
+
+# ==================== COMMAND LINE ====================
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Serve a Modbus capture as local devices")
+    parser.add_argument("capture", help="capture file written by modbus_logger.capture")
+    parser.add_argument("--speed", type=float, default=1.0, help="replay speed, e.g. 10 for 10x")
+    parser.add_argument("--once", action="store_true", help="keep the last answers at the end instead of starting over")
+    parser.add_argument("--no-latency", action="store_true", help="answer at once instead of after the recorded latency")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=5020, help="TCP port of the first source")
+    parser.add_argument("--source", help="serve only this source (default: all, or the first on --serial)")
+    parser.add_argument("--serial", help="serve over RTU on this serial port instead of TCP")
+    parser.add_argument("--baudrate", type=int, default=9600)
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    sources, start, end = load_capture(args.capture)
+    if args.source is not None:
+        if args.source not in sources:
+            print(f"❌ No source {args.source} in the capture (found: {', '.join(sources)})")
+            return 1
+        sources = {args.source: sources[args.source]}
+    clock = ReplayClock(start, end, args.speed, loop=not args.once)
+    print(f"📼 {sum(source.transactions for source in sources.values())} transactions over "
+          f"{end - start:.1f} s, replayed at {args.speed}x ({(end - start) / args.speed:.1f} s per pass)")
+
+    if args.serial:
+        source = next(iter(sources.values()))
+        units = {unit_id: source for unit_id in source.units()}
+        serve_replay_rtu(units, clock, args.serial, args.baudrate, latency=not args.no_latency)
+        print(f"🔌 {source.name} (unit(s) {', '.join(map(str, sorted(units)))}) on {args.serial}")
+    else:
+        for offset, source in enumerate(sources.values()):
+            serve_replay_tcp(source, clock, args.port + offset, args.host, latency=not args.no_latency)
+            print(f"🔌 {source.name} on {args.host}:{args.port + offset}")
+
+    print("Press CTRL+C to stop")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        print("\n🛑 Replay stopped")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
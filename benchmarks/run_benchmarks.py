@@ -0,0 +1,309 @@
+# ==================== BENCHMARK SUITE ====================
+#
+# Measures the acquisition paths against local simulated devices, so a
+# change can be judged by numbers instead of by feel:
+#
+#   nogui_tcp      pymodbus_nogui.read_plc_data over Modbus TCP
+#   nogui_tcp_pipelined  the same with --pipeline-window requests in flight
+#   nogui_rtu      the same over RTU through a virtual serial pair (POSIX only)
+#   backend_live   GET /api/read/<id>?max_age=0 (every call reads the device)
+#   backend_cached GET /api/read/<id> served from the background poller's snapshot
+#   async_engine   PollingEngine scanning many devices at once
+#
+# --rtt puts the TCP devices behind a proxy that adds network latency,
+# which is where pipelining pays off.
+#
+# Every scenario reports reads/sec, p50/p95/p99 latency, CPU time and RSS.
+# Results are written as JSON tagged with the git revision, e.g.
+#
+#   python benchmarks/run_benchmarks.py --duration 10 --output results.json
+#
+# Compare two result files to spot regressions before merging.
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import subprocess
+import sys
+import threading
+import time
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_ROOT = os.path.dirname(BENCHMARK_DIR)
+sys.path.insert(0, REPO_ROOT)
+sys.path.insert(0, os.path.join(REPO_ROOT, "backend"))
+
+import pymodbus
+from pymodbus.client import ModbusSerialClient, ModbusTcpClient
+
+from modbus_logger.pipeline import PipelinedTcpClient
+from modbus_logger.poller import Device, PollingEngine
+from modbus_logger.read_plan import FC_READ_HOLDING_REGISTERS, compile_read_plan, make_tag
+from modbus_logger.rtu_bus import RtuBusMaster
+from simulator import Simulator
+
+SCENARIOS = ["nogui_tcp", "nogui_tcp_pipelined", "nogui_rtu", "backend_live", "backend_cached", "async_engine"]
+
+# ==================== MEASUREMENT ====================
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, round(fraction * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def current_rss():
+    """Resident set size of this process in bytes (peak RSS where /proc is unavailable)."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+    except ImportError:
+        return None
+
+
+class Measurement:
+    """Collects per-read latencies plus wall clock and CPU time of one scenario."""
+
+    def __init__(self, name):
+        self.name = name
+        self.latencies = []
+        self.errors = 0
+        self._wall_start = None
+        self._cpu_start = None
+        self.wall = 0.0
+        self.cpu = 0.0
+
+    def __enter__(self):
+        self._wall_start = time.perf_counter()
+        self._cpu_start = time.process_time()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.wall = time.perf_counter() - self._wall_start
+        self.cpu = time.process_time() - self._cpu_start
+
+    def record(self, latency, ok=True):
+        self.latencies.append(latency)
+        if not ok:
+            self.errors += 1
+
+    def result(self):
+        latencies = sorted(self.latencies)
+        reads = len(latencies)
+        to_ms = lambda value: None if value is None else round(value * 1000, 3)
+        rss = current_rss()
+        return {
+            "reads": reads,
+            "errors": self.errors,
+            "duration_s": round(self.wall, 3),
+            "reads_per_sec": round(reads / self.wall, 1) if self.wall else None,
+            "latency_ms": {
+                "p50": to_ms(percentile(latencies, 0.50)),
+                "p95": to_ms(percentile(latencies, 0.95)),
+                "p99": to_ms(percentile(latencies, 0.99)),
+                "max": to_ms(latencies[-1] if latencies else None),
+            },
+            "cpu_s": round(self.cpu, 3),
+            "cpu_percent": round(100 * self.cpu / self.wall, 1) if self.wall else None,
+            "rss_mb": round(rss / 1048576, 1) if rss else None,
+        }
+
+
+def timed_loop(measurement, duration, read):
+    """Calls ``read()`` back to back for ``duration`` seconds, recording each call."""
+    deadline = time.perf_counter() + duration
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        ok = read()
+        measurement.record(time.perf_counter() - start, ok)
+
+# ==================== SCENARIOS ====================
+
+def benchmark_tags(args):
+    """``--tags`` holding registers, ``--tag-spacing`` apart, on unit 1."""
+    return [make_tag((1 + i * args.tag_spacing, FC_READ_HOLDING_REGISTERS, 1)) for i in range(args.tags)]
+
+
+def run_nogui(args, client, bus=None):
+    import pymodbus_nogui
+
+    plan = compile_read_plan(benchmark_tags(args), max_gap=pymodbus_nogui.READ_GAP_TOLERANCE)
+    with Measurement("nogui") as measurement:
+        timed_loop(measurement, args.duration,
+                   lambda: pymodbus_nogui.read_plc_data(client, plan, bus) is not None)
+    result = measurement.result()
+    result["requests_per_read"] = len(plan)
+    return result
+
+
+def scenario_nogui_tcp(args, sim):
+    client = ModbusTcpClient("127.0.0.1", port=sim.ports[0], timeout=args.timeout)
+    client.connect()
+    try:
+        return run_nogui(args, client)
+    finally:
+        client.close()
+
+
+def scenario_nogui_tcp_pipelined(args, sim):
+    client = PipelinedTcpClient("127.0.0.1", sim.ports[0], args.pipeline_window, timeout=args.timeout)
+    client.connect()
+    try:
+        return run_nogui(args, client)
+    finally:
+        client.close()
+
+
+def scenario_nogui_rtu(args, sim):
+    if sim.serial_port is None:
+        return {"skipped": "virtual serial ports need a POSIX system"}
+    client = ModbusSerialClient(port=sim.serial_port, baudrate=args.baudrate, timeout=args.timeout)
+    client.connect()
+    bus = RtuBusMaster(client, args.baudrate, 8, "N", 1)
+    try:
+        return run_nogui(args, client, bus)
+    finally:
+        bus.close()
+        client.close()
+
+
+def run_backend(args, sim, poll_interval, query):
+    import modbus_service
+
+    http = modbus_service.app.test_client()
+    connection_id = f"bench-{poll_interval or 'live'}"
+    response = http.post("/api/connect", json={
+        "id": connection_id, "name": connection_id, "type": "tcp", "host": "127.0.0.1",
+        "port": sim.ports[0], "timeout": args.timeout, "retries": 0, "poll_interval": poll_interval,
+    })
+    if not response.json["success"]:
+        raise RuntimeError(response.json["message"])
+    time.sleep(poll_interval or 0)
+    try:
+        with Measurement("backend") as measurement:
+            timed_loop(measurement, args.duration,
+                       lambda: http.get(f"/api/read/{connection_id}{query}").status_code == 200)
+        result = measurement.result()
+        connection = modbus_service.active_connections.get(connection_id)
+        result["device_requests"] = connection.requests_sent
+        return result
+    finally:
+        http.post(f"/api/disconnect/{connection_id}")
+
+
+def scenario_backend_live(args, sim):
+    return run_backend(args, sim, None, "?max_age=0")
+
+
+def scenario_backend_cached(args, sim):
+    return run_backend(args, sim, args.poll_interval, "")
+
+
+def scenario_async_engine(args, sim):
+    """Scan latency here is how long after its grid time each sample arrived."""
+    tags = benchmark_tags(args)
+    devices = [Device(f"sim{port}", "127.0.0.1", port, tags=tags, interval=args.engine_interval,
+                      timeout=args.timeout) for port in sim.ports]
+    measurement = Measurement("async_engine")
+
+    def sink(sample):
+        measurement.record(time.time() - sample.timestamp, sample.error is None)
+
+    async def run():
+        engine = PollingEngine(devices, sink, max_concurrency=args.max_concurrency)
+        task = asyncio.create_task(engine.run())
+        await asyncio.sleep(args.duration)
+        engine.stop()
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
+    with measurement:
+        asyncio.run(run())
+    result = measurement.result()
+    result["devices"] = len(devices)
+    return result
+
+# ==================== RUNNER ====================
+
+def git_revision():
+    try:
+        return subprocess.check_output(["git", "describe", "--always", "--dirty"], cwd=REPO_ROOT,
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark the Modbus acquisition paths against local simulators.")
+    parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=SCENARIOS)
+    parser.add_argument("--duration", type=float, default=5, help="seconds per scenario")
+    parser.add_argument("--devices", type=int, default=10, help="simulated TCP devices (async_engine uses all)")
+    parser.add_argument("--base-port", type=int, default=15020)
+    parser.add_argument("--tags", type=int, default=50, help="tags per read")
+    parser.add_argument("--tag-spacing", type=int, default=2, help="address step between tags")
+    parser.add_argument("--delay", type=float, default=0.0, help="simulated device response time (s)")
+    parser.add_argument("--jitter", type=float, default=0.0, help="random +/- added to the response time (s)")
+    parser.add_argument("--rtt", type=float, default=0.0, help="network round trip added to TCP devices (s)")
+    parser.add_argument("--pipeline-window", type=int, default=8, help="requests in flight for nogui_tcp_pipelined")
+    parser.add_argument("--baudrate", type=int, default=115200)
+    parser.add_argument("--timeout", type=int, default=3)
+    parser.add_argument("--poll-interval", type=float, default=0.1, help="backend_cached poller interval (s)")
+    parser.add_argument("--engine-interval", type=float, default=0.1, help="async_engine scan interval (s)")
+    parser.add_argument("--max-concurrency", type=int, default=50)
+    parser.add_argument("--output", help="write results to this JSON file")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    ports = range(args.base_port, args.base_port + args.devices)
+    rtu = "nogui_rtu" in args.scenarios and os.name == "posix"
+    report = {
+        "revision": git_revision(),
+        "started": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "pymodbus": pymodbus.__version__,
+        "platform": platform.platform(),
+        "settings": vars(args),
+        "results": {},
+    }
+
+    print(f"🚀 Starting {args.devices} simulated device(s) (delay {args.delay}s ± {args.jitter}s, rtt {args.rtt}s)")
+    with Simulator(ports, args.delay, args.jitter, rtu=rtu, baudrate=args.baudrate, rtt=args.rtt) as sim:
+        for name in args.scenarios:
+            print(f"⏱️ {name} ...")
+            try:
+                result = globals()[f"scenario_{name}"](args, sim)
+            except Exception as e:
+                result = {"error": str(e)}
+            report["results"][name] = result
+            if "reads" in result:
+                latency = result["latency_ms"]
+                print(f"   {result['reads_per_sec']} reads/s, p50 {latency['p50']} ms, "
+                      f"p95 {latency['p95']} ms, p99 {latency['p99']} ms, "
+                      f"CPU {result['cpu_percent']}%, RSS {result['rss_mb']} MB")
+            else:
+                print(f"   ⚠️ {result}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"✅ Results written to {args.output}")
+    else:
+        print(json.dumps(report, indent=2))
+    # Background pollers and reapers of the backend are daemon threads
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
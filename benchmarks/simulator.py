@@ -0,0 +1,250 @@
+# ==================== LOCAL MODBUS SIMULATOR ====================
+#
+# Local stand-ins for field devices so benchmarks need no real PLC:
+# pymodbus TCP servers, and an RTU server behind a virtual serial pair
+# (two pseudo-terminals joined by a relay, Linux/macOS only). Every
+# simulated device answers after a configurable delay plus random jitter.
+# A round-trip time can be added in front of the TCP devices by a proxy
+# that delays traffic like a slow WAN link without serializing it.
+# Devices run in a separate process so they don't skew the CPU and memory
+# numbers of the code under test.
+
+import asyncio
+import logging
+import multiprocessing
+import os
+import random
+import socket
+import threading
+import time
+
+from pymodbus.datastore import ModbusSequentialDataBlock, ModbusServerContext
+
+try:
+    from pymodbus.datastore import ModbusDeviceContext as DeviceContext
+except ImportError:  # pymodbus < 3.10
+    from pymodbus.datastore import ModbusSlaveContext as DeviceContext
+
+REGISTER_COUNT = 30000
+PROXY_PORT_OFFSET = 10000  # Devices behind a latency proxy listen this far above their public port
+
+
+def make_context():
+    """Datastore with every table filled: registers hold their own address, coils alternate."""
+    bits = [address % 2 == 0 for address in range(REGISTER_COUNT)]
+    registers = [address % 65536 for address in range(REGISTER_COUNT)]
+    device = DeviceContext(
+        co=ModbusSequentialDataBlock(1, bits),
+        di=ModbusSequentialDataBlock(1, bits),
+        hr=ModbusSequentialDataBlock(1, registers),
+        ir=ModbusSequentialDataBlock(1, registers),
+    )
+    return ModbusServerContext(device, single=True)
+
+
+def response_delay(delay, jitter):
+    """Packet tracer that holds every response for delay +/- jitter seconds."""
+    def trace_packet(sending, data):
+        if sending and (delay or jitter):
+            time.sleep(max(0.0, delay + random.uniform(-jitter, jitter)))
+        return data
+    return trace_packet
+
+
+def serve_tcp(port, delay=0.0, jitter=0.0, host="127.0.0.1"):
+    """Serves one simulated TCP device in a background thread with its own event loop.
+
+    The delay blocks that device's loop, like a PLC working through its requests.
+    """
+    from pymodbus.server import ModbusTcpServer
+
+    def run():
+        async def main():
+            server = ModbusTcpServer(make_context(), address=(host, port),
+                                     trace_packet=response_delay(delay, jitter))
+            await server.serve_forever()
+        asyncio.run(main())
+
+    thread = threading.Thread(target=run, name=f"sim-tcp-{port}", daemon=True)
+    thread.start()
+    return thread
+
+
+def serve_latency_proxy(port, target_port, rtt, host="127.0.0.1"):
+    """Forwards ``port`` to ``target_port`` in a background thread, adding rtt / 2 each way.
+
+    Unlike the response delay, any number of requests can be on the link at
+    once. The device gets them one at a time, the way a PLC works through
+    its queue (the pymodbus server drops requests that arrive together).
+    """
+    async def read_frame(reader):
+        header = await reader.readexactly(6)
+        return header + await reader.readexactly(int.from_bytes(header[4:6], "big"))
+
+    async def handle(client_reader, client_writer):
+        loop = asyncio.get_running_loop()
+        device_reader, device_writer = await asyncio.open_connection(host, target_port)
+        requests = asyncio.Queue()
+        responses = asyncio.Queue()
+
+        async def receive():
+            while True:
+                requests.put_nowait((loop.time() + rtt / 2, await read_frame(client_reader)))
+
+        async def process():
+            while True:
+                due, frame = await requests.get()
+                await asyncio.sleep(max(0.0, due - loop.time()))
+                device_writer.write(frame)
+                responses.put_nowait((loop.time() + rtt / 2, await read_frame(device_reader)))
+
+        async def reply():
+            while True:
+                due, frame = await responses.get()
+                await asyncio.sleep(max(0.0, due - loop.time()))
+                client_writer.write(frame)
+
+        tasks = [asyncio.create_task(coroutine()) for coroutine in (receive, process, reply)]
+        await asyncio.wait(tasks, return_when=asyncio.FIRST_EXCEPTION)
+        for task in tasks:
+            task.cancel()
+        client_writer.close()
+        device_writer.close()
+
+    def run():
+        async def main():
+            server = await asyncio.start_server(handle, host, port)
+            await server.serve_forever()
+        asyncio.run(main())
+
+    thread = threading.Thread(target=run, name=f"sim-proxy-{port}", daemon=True)
+    thread.start()
+    return thread
+
+
+class VirtualSerialPair:
+    """Two pseudo-terminals joined by a relay thread, like ``socat pty pty``."""
+
+    def __init__(self):
+        import pty
+        import tty
+
+        self._masters = []
+        self.ports = []
+        for _ in range(2):
+            master, slave = pty.openpty()
+            tty.setraw(slave)
+            self._masters.append(master)
+            self.ports.append(os.ttyname(slave))
+        self._running = True
+        self._thread = threading.Thread(target=self._relay, name="sim-serial-relay", daemon=True)
+        self._thread.start()
+
+    @property
+    def server_port(self):
+        return self.ports[0]
+
+    @property
+    def client_port(self):
+        return self.ports[1]
+
+    def _relay(self):
+        import select
+
+        first, second = self._masters
+        while self._running:
+            readable, _, _ = select.select(self._masters, [], [], 0.5)
+            for master in readable:
+                try:
+                    data = os.read(master, 4096)
+                except OSError:
+                    continue
+                os.write(second if master == first else first, data)
+
+    def close(self):
+        self._running = False
+        self._thread.join()
+        for master in self._masters:
+            os.close(master)
+
+
+def serve_rtu(port_name, baudrate=9600, delay=0.0, jitter=0.0):
+    """Serves one simulated RTU line (all unit IDs) on a serial port in a background thread."""
+    from pymodbus.server import ModbusSerialServer
+
+    def run():
+        async def main():
+            server = ModbusSerialServer(make_context(), port=port_name, baudrate=baudrate,
+                                        trace_packet=response_delay(delay, jitter))
+            await server.serve_forever()
+        asyncio.run(main())
+
+    thread = threading.Thread(target=run, name="sim-rtu", daemon=True)
+    thread.start()
+    return thread
+
+
+def _simulator_process(ports, delay, jitter, rtu, baudrate, connection, stop, rtt=0.0):
+    logging.getLogger("pymodbus").setLevel(logging.CRITICAL)
+    for port in ports:
+        if rtt:
+            serve_tcp(port + PROXY_PORT_OFFSET, delay, jitter)
+            wait_for_port(port + PROXY_PORT_OFFSET)
+            serve_latency_proxy(port, port + PROXY_PORT_OFFSET, rtt)
+        else:
+            serve_tcp(port, delay, jitter)
+    serial_pair = None
+    if rtu:
+        serial_pair = VirtualSerialPair()
+        serve_rtu(serial_pair.server_port, baudrate, delay, jitter)
+    time.sleep(0.5)
+    connection.send(serial_pair.client_port if serial_pair else None)
+    stop.wait()
+
+
+def wait_for_port(port, host="127.0.0.1", timeout=10):
+    """Blocks until a simulated TCP device accepts connections."""
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            socket.create_connection((host, port), timeout=1).close()
+            return
+        except OSError:
+            if time.monotonic() > deadline:
+                raise
+            time.sleep(0.1)
+
+
+class Simulator:
+    """Starts simulated devices in a child process; use as a context manager."""
+
+    def __init__(self, ports, delay=0.0, jitter=0.0, rtu=False, baudrate=9600, rtt=0.0):
+        self.ports = list(ports)
+        self.delay = delay
+        self.jitter = jitter
+        self.rtt = rtt
+        self.rtu = rtu
+        self.baudrate = baudrate
+        self.serial_port = None
+        self._process = None
+        self._stop = None
+
+    def __enter__(self):
+        parent, child = multiprocessing.Pipe()
+        self._stop = multiprocessing.Event()
+        self._process = multiprocessing.Process(
+            target=_simulator_process,
+            args=(self.ports, self.delay, self.jitter, self.rtu, self.baudrate, child, self._stop, self.rtt),
+            daemon=True,
+        )
+        self._process.start()
+        self.serial_port = parent.recv()
+        for port in self.ports:
+            wait_for_port(port)
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        self._process.join(5)
+        if self._process.is_alive():
+            self._process.terminate()
@@ -0,0 +1 @@
+"""Shared acquisition components used by the logger, the GUI and the backend."""
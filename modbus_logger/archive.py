@@ -0,0 +1,643 @@
+# ==================== COMPRESSED ARCHIVE ====================
+#
+# Long-term storage for logged samples. An archive file holds chunks of up
+# to CHUNK_POINTS samples of one tag each:
+#   timestamps  delta-of-delta encoded in milliseconds; a fixed scan rate
+#               costs one bit per sample
+#   numbers     values with few decimals (register values, rounded
+#               readings) as scaled integers, delta encoded; an unchanged
+#               value costs one bit
+#   analog      other floats as the XOR of each float64 with the previous
+#               one, storing only the bits that changed
+#   coils       bit values as run lengths
+# Every chunk header carries the tag, sample count and first/last
+# timestamp, and a footer repeats them as an index, so a reader seeks
+# straight to the chunks of a time range and decodes one chunk at a time.
+#
+# File layout (little endian):
+#   magic
+#   chunks   header (tag id, kind, count, first ms, last ms, timestamp
+#            bytes, payload bytes, crc32) + timestamp bits + value bytes
+#   index    tag names, then a copy of every chunk header with its offset
+#   footer   index offset, magic
+#
+# An ArchiveCompactor converts rotated CSV files in a background thread.
+
+import array
+import bisect
+import csv
+import os
+import re
+import struct
+import threading
+import zlib
+from collections import namedtuple
+from datetime import datetime
+
+MAGIC = b"MBARCH01"
+CHUNK = struct.Struct("<HBIqqIII")   # tag id, kind, count, first ms, last ms, timestamp bytes, payload bytes, crc32
+INDEX_ENTRY = struct.Struct("<Q")    # chunk offset, followed by the chunk header
+FOOTER = struct.Struct("<Q8s")       # index offset, magic
+NAME_LENGTH = struct.Struct("<H")
+
+KIND_ANALOG = 0
+KIND_BITS = 1
+KIND_DECIMAL = 2
+
+MAX_DECIMALS = 6
+
+CHUNK_POINTS = 4096
+ARCHIVE_EXT = ".mba"
+MASK64 = (1 << 64) - 1
+
+Chunk = namedtuple("Chunk", ["tag", "timestamps", "values"])
+ChunkInfo = namedtuple("ChunkInfo", ["offset", "tag_id", "kind", "count", "first", "last",
+                                     "timestamp_bytes", "payload_bytes", "crc"])
+
+
+# ==================== BIT STREAMS ====================
+
+class BitWriter:
+    """Appends bit fields, most significant bit first."""
+
+    def __init__(self):
+        self.buffer = bytearray()
+        self._acc = 0
+        self._bits = 0
+
+    def write(self, value, bits):
+        self._acc = (self._acc << bits) | value
+        self._bits += bits
+        while self._bits >= 8:
+            self._bits -= 8
+            self.buffer.append((self._acc >> self._bits) & 0xFF)
+        self._acc &= (1 << self._bits) - 1
+
+    def getvalue(self):
+        if self._bits:
+            return bytes(self.buffer) + bytes([(self._acc << (8 - self._bits)) & 0xFF])
+        return bytes(self.buffer)
+
+
+class BitReader:
+    """Reads bit fields of up to 64 bits written by a BitWriter."""
+
+    def __init__(self, data):
+        self.data = bytes(data) + bytes(9)
+        self.position = 0
+
+    def read(self, bits):
+        start = self.position >> 3
+        window = int.from_bytes(self.data[start:start + 9], "big")
+        shift = 72 - (self.position & 7) - bits
+        self.position += bits
+        return (window >> shift) & ((1 << bits) - 1)
+
+    def zeros(self, limit):
+        """Consumes and counts the 0 bits ahead (up to ``limit`` and 64 at a time)."""
+        start = self.position >> 3
+        available = 72 - (self.position & 7)
+        window = int.from_bytes(self.data[start:start + 9], "big") & ((1 << available) - 1)
+        run = min(available - window.bit_length(), 64, limit)
+        self.position += run
+        return run
+
+
+def _signed(value, bits):
+    return value - (1 << bits) if value >> (bits - 1) else value
+
+
+# ==================== CODECS ====================
+
+# Small signed integers: (prefix, prefix bits, value bits); 0 is a single 0 bit
+_INTEGER_CLASSES = ((0b10, 2, 7), (0b110, 3, 9), (0b1110, 4, 12))
+
+
+def _write_integer(writer, value):
+    if value == 0:
+        writer.write(0, 1)
+        return
+    for prefix, prefix_bits, bits in _INTEGER_CLASSES:
+        if -(1 << (bits - 1)) <= value < (1 << (bits - 1)):
+            writer.write(prefix, prefix_bits)
+            writer.write(value & ((1 << bits) - 1), bits)
+            return
+    writer.write(0b1111, 4)
+    writer.write(value & MASK64, 64)
+
+
+def _read_integer(read):
+    if not read(1):
+        return 0
+    if not read(1):
+        return _signed(read(7), 7)
+    if not read(1):
+        return _signed(read(9), 9)
+    if not read(1):
+        return _signed(read(12), 12)
+    return _signed(read(64), 64)
+
+
+def encode_timestamps(timestamps):
+    """Encodes integer millisecond timestamps (non-decreasing) as delta-of-deltas."""
+    if not timestamps:
+        return b""
+    writer = BitWriter()
+    writer.write(timestamps[0] & MASK64, 64)
+    previous, delta = timestamps[0], 0
+    for timestamp in timestamps[1:]:
+        new_delta = timestamp - previous
+        _write_integer(writer, new_delta - delta)
+        previous, delta = timestamp, new_delta
+    return writer.getvalue()
+
+
+def decode_timestamps(data, count):
+    if not count:
+        return []
+    reader = BitReader(data)
+    read = reader.read
+    timestamp = _signed(read(64), 64)
+    timestamps = [timestamp]
+    delta = 0
+    remaining = count - 1
+    while remaining:
+        # A steady scan rate is a long run of 0 bits: take it in one go
+        run = reader.zeros(remaining)
+        if not run:
+            delta += _read_integer(read)
+            run = 1
+        if delta:
+            timestamps.extend(range(timestamp + delta, timestamp + delta * (run + 1), delta))
+        else:
+            timestamps.extend([timestamp] * run)
+        timestamp += delta * run
+        remaining -= run
+    return timestamps
+
+
+def decimal_places(values):
+    """Fewest decimals (up to MAX_DECIMALS) that represent every value exactly, or None."""
+    for decimals in range(MAX_DECIMALS + 1):
+        factor = 10 ** decimals
+        if all(abs(value) * factor < 2 ** 53 and round(value * factor) / factor == value for value in values):
+            return decimals
+    return None
+
+
+def encode_decimals(values, decimals):
+    """Encodes values with ``decimals`` decimal places as deltas of the scaled integers."""
+    if not values:
+        return b""
+    factor = 10 ** decimals
+    writer = BitWriter()
+    writer.write(decimals, 8)
+    previous = round(values[0] * factor)
+    writer.write(previous & MASK64, 64)
+    for value in values[1:]:
+        scaled = round(value * factor)
+        _write_integer(writer, scaled - previous)
+        previous = scaled
+    return writer.getvalue()
+
+
+def decode_decimals(data, count):
+    if not count:
+        return []
+    reader = BitReader(data)
+    read = reader.read
+    decimals = read(8)
+    scaled = _signed(read(64), 64)
+    values = [scaled]
+    remaining = count - 1
+    while remaining:
+        run = reader.zeros(remaining)
+        if run:
+            values.extend([scaled] * run)
+            remaining -= run
+            continue
+        scaled += _read_integer(read)
+        values.append(scaled)
+        remaining -= 1
+    if not decimals:
+        return values
+    # Integer / power of ten rounds to the same double the decimal text parses to
+    factor = 10 ** decimals
+    return [value / factor for value in values]
+
+
+def encode_floats(values):
+    """XOR-compresses float64 values."""
+    if not values:
+        return b""
+    words = memoryview(array.array("d", values).tobytes()).cast("Q").tolist()
+    writer = BitWriter()
+    previous = words[0]
+    writer.write(previous, 64)
+    leading = trailing = None
+    for word in words[1:]:
+        xor = word ^ previous
+        previous = word
+        if xor == 0:
+            writer.write(0, 1)
+            continue
+        new_leading = min(64 - xor.bit_length(), 31)
+        new_trailing = (xor & -xor).bit_length() - 1
+        if leading is not None and new_leading >= leading and new_trailing >= trailing:
+            # The changed bits fit in the previous window
+            writer.write(0b10, 2)
+            writer.write(xor >> trailing, 64 - leading - trailing)
+        else:
+            leading, trailing = new_leading, new_trailing
+            significant = 64 - leading - trailing
+            writer.write(0b11, 2)
+            writer.write(leading, 5)
+            writer.write(significant - 1, 6)
+            writer.write(xor >> trailing, significant)
+    return writer.getvalue()
+
+
+def decode_floats(data, count):
+    if not count:
+        return []
+    reader = BitReader(data)
+    read = reader.read
+    word = read(64)
+    words = [word]
+    leading = trailing = 0
+    remaining = count - 1
+    while remaining:
+        run = reader.zeros(remaining)
+        if run:
+            words.extend([word] * run)
+            remaining -= run
+            continue
+        read(1)
+        if read(1):
+            leading = read(5)
+            trailing = 64 - leading - (read(6) + 1)
+        word ^= read(64 - leading - trailing) << trailing
+        words.append(word)
+        remaining -= 1
+    return array.array("d", array.array("Q", words).tobytes()).tolist()
+
+
+def _write_varint(buffer, value):
+    while value >= 0x80:
+        buffer.append((value & 0x7F) | 0x80)
+        value >>= 7
+    buffer.append(value)
+
+
+def encode_bits(values):
+    """Run-length encodes 0/1 values: the first value, then alternating run lengths."""
+    if not values:
+        return b""
+    buffer = bytearray([1 if values[0] else 0])
+    current, run = bool(values[0]), 0
+    for value in values:
+        if bool(value) == current:
+            run += 1
+        else:
+            _write_varint(buffer, run)
+            current, run = not current, 1
+    _write_varint(buffer, run)
+    return bytes(buffer)
+
+
+def decode_bits(data, count):
+    if not count:
+        return []
+    values = []
+    current = data[0]
+    position = 1
+    while len(values) < count:
+        run = shift = 0
+        while True:
+            byte = data[position]
+            position += 1
+            run |= (byte & 0x7F) << shift
+            shift += 7
+            if not byte & 0x80:
+                break
+        values.extend([current] * run)
+        current ^= 1
+    return values
+
+
+# ==================== WRITING ====================
+
+class ArchiveWriter:
+    """Writes tag series into a new archive file.
+
+    The file is written under a temporary name and moved into place by
+    ``close()``, so readers never see a half-written archive.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.tags = []
+        self._tag_ids = {}
+        self._index = []
+        self._temporary = path + ".tmp"
+        self._file = open(self._temporary, "wb")
+        self._file.write(MAGIC)
+
+    def add_series(self, tag, timestamps, values, kind=None):
+        """Appends one tag's samples (timestamps in seconds, oldest first).
+
+        ``kind`` is chosen per chunk by default: KIND_BITS when every value
+        is 0 or 1, KIND_DECIMAL when they have few decimals, else KIND_ANALOG.
+        """
+        if not timestamps:
+            return
+        if tag not in self._tag_ids:
+            self._tag_ids[tag] = len(self.tags)
+            self.tags.append(tag)
+        tag_id = self._tag_ids[tag]
+        milliseconds = [round(timestamp * 1000) for timestamp in timestamps]
+        for start in range(0, len(milliseconds), CHUNK_POINTS):
+            self._write_chunk(tag_id, kind, milliseconds[start:start + CHUNK_POINTS],
+                              values[start:start + CHUNK_POINTS])
+
+    def _write_chunk(self, tag_id, kind, milliseconds, values):
+        decimals = None
+        if kind is None:
+            if all(value in (0, 1) for value in values):
+                kind = KIND_BITS
+            else:
+                decimals = decimal_places(values)
+                kind = KIND_ANALOG if decimals is None else KIND_DECIMAL
+        elif kind == KIND_DECIMAL:
+            decimals = decimal_places(values)
+            if decimals is None:
+                raise ValueError("Values have too many decimals for KIND_DECIMAL")
+
+        timestamp_bytes = encode_timestamps(milliseconds)
+        if kind == KIND_BITS:
+            value_bytes = encode_bits(values)
+        elif kind == KIND_DECIMAL:
+            value_bytes = encode_decimals(values, decimals)
+        else:
+            value_bytes = encode_floats([float(value) for value in values])
+        payload = timestamp_bytes + value_bytes
+        header = (tag_id, kind, len(milliseconds), milliseconds[0], milliseconds[-1],
+                  len(timestamp_bytes), len(payload), zlib.crc32(payload))
+        self._index.append((self._file.tell(), header))
+        self._file.write(CHUNK.pack(*header))
+        self._file.write(payload)
+
+    def close(self):
+        index_offset = self._file.tell()
+        self._file.write(NAME_LENGTH.pack(len(self.tags)))
+        for tag in self.tags:
+            name = tag.encode()
+            self._file.write(NAME_LENGTH.pack(len(name)) + name)
+        self._file.write(struct.pack("<I", len(self._index)))
+        for offset, header in self._index:
+            self._file.write(INDEX_ENTRY.pack(offset) + CHUNK.pack(*header))
+        self._file.write(FOOTER.pack(index_offset, MAGIC))
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._file.close()
+        os.replace(self._temporary, self.path)
+
+    def abort(self):
+        """Discards the archive being written."""
+        self._file.close()
+        os.remove(self._temporary)
+
+
+# ==================== READING ====================
+
+class ArchiveReader:
+    """Streams decoded chunks out of an archive file."""
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, "rb")
+        try:
+            self._read_index()
+        except Exception:
+            self._file.close()
+            raise
+
+    def _read_index(self):
+        if self._file.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{self.path} is not an archive file")
+        self._file.seek(-FOOTER.size, os.SEEK_END)
+        index_offset, magic = FOOTER.unpack(self._file.read(FOOTER.size))
+        if magic != MAGIC:
+            raise ValueError(f"{self.path} is incomplete (no index)")
+        self._file.seek(index_offset)
+        data = self._file.read()
+
+        (tag_count,) = NAME_LENGTH.unpack_from(data, 0)
+        position = NAME_LENGTH.size
+        self.tags = []
+        for _ in range(tag_count):
+            (length,) = NAME_LENGTH.unpack_from(data, position)
+            position += NAME_LENGTH.size
+            self.tags.append(data[position:position + length].decode())
+            position += length
+        (chunk_count,) = struct.unpack_from("<I", data, position)
+        position += 4
+        self.chunks_by_tag = {tag: [] for tag in self.tags}
+        for _ in range(chunk_count):
+            (offset,) = INDEX_ENTRY.unpack_from(data, position)
+            info = ChunkInfo(offset, *CHUNK.unpack_from(data, position + INDEX_ENTRY.size))
+            self.chunks_by_tag[self.tags[info.tag_id]].append(info)
+            position += INDEX_ENTRY.size + CHUNK.size
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def time_range(self, tag=None):
+        """(first, last) timestamp in seconds of one tag or the whole file, or None if empty."""
+        infos = self.chunks_by_tag.get(tag, []) if tag is not None else \
+            [info for infos in self.chunks_by_tag.values() for info in infos]
+        if not infos:
+            return None
+        return min(info.first for info in infos) / 1000, max(info.last for info in infos) / 1000
+
+    def chunks(self, tags=None, start=None, end=None):
+        """Yields a decoded Chunk per stored chunk of ``tags`` overlapping [start, end].
+
+        Chunks are trimmed to the range; chunks outside it are never read.
+        """
+        start_ms = None if start is None else round(start * 1000)
+        end_ms = None if end is None else round(end * 1000)
+        for tag in (self.tags if tags is None else tags):
+            for info in self.chunks_by_tag.get(tag, []):
+                if (start_ms is not None and info.last < start_ms) or (end_ms is not None and info.first > end_ms):
+                    continue
+                milliseconds, values = self._decode(info)
+                lo = 0 if start_ms is None else bisect.bisect_left(milliseconds, start_ms)
+                hi = len(milliseconds) if end_ms is None else bisect.bisect_right(milliseconds, end_ms)
+                if lo < hi:
+                    yield Chunk(tag, [ms / 1000 for ms in milliseconds[lo:hi]], values[lo:hi])
+
+    def read(self, tag, start=None, end=None):
+        """Yields (timestamp, value) samples of one tag in [start, end]."""
+        for chunk in self.chunks([tag], start, end):
+            yield from zip(chunk.timestamps, chunk.values)
+
+    def _decode(self, info):
+        self._file.seek(info.offset + CHUNK.size)
+        payload = self._file.read(info.payload_bytes)
+        if zlib.crc32(payload) != info.crc:
+            raise ValueError(f"{self.path}: corrupt chunk at offset {info.offset}")
+        milliseconds = decode_timestamps(payload[:info.timestamp_bytes], info.count)
+        value_bytes = payload[info.timestamp_bytes:]
+        if info.kind == KIND_BITS:
+            return milliseconds, decode_bits(value_bytes, info.count)
+        if info.kind == KIND_DECIMAL:
+            return milliseconds, decode_decimals(value_bytes, info.count)
+        return milliseconds, decode_floats(value_bytes, info.count)
+
+
+def read_archives(paths, tag, start=None, end=None):
+    """Yields (timestamp, value) samples of ``tag`` across several archives, oldest file first."""
+    readers = []
+    try:
+        for path in paths:
+            readers.append(ArchiveReader(path))
+        readers.sort(key=lambda reader: reader.time_range(tag) or (float("inf"),))
+        for reader in readers:
+            yield from reader.read(tag, start, end)
+    finally:
+        for reader in readers:
+            reader.close()
+
+
+# ==================== CSV COMPACTION ====================
+
+def _parse_value(text):
+    if text == "True":
+        return 1
+    if text == "False":
+        return 0
+    value = float(text)
+    return int(value) if value.is_integer() and abs(value) < 2 ** 53 else value
+
+
+def compact_csv(csv_path, archive_path=None):
+    """Converts a logged CSV file (full rows or Timestamp,Tag,Value changes) into an archive.
+
+    The file is streamed: a tag's samples are written out as a chunk as
+    soon as CHUNK_POINTS of them are pending, so memory stays bounded by
+    one chunk per tag whatever the size of the CSV file.
+    Returns the archive path and the number of samples written.
+    """
+    if archive_path is None:
+        archive_path = os.path.splitext(csv_path)[0] + ARCHIVE_EXT
+    writer = ArchiveWriter(archive_path)
+    try:
+        samples = 0
+        pending = {}  # tag -> (timestamps, values) not yet written
+        last_text = timestamp = None
+        with open(csv_path, newline="") as file:
+            reader = csv.reader(file)
+            headers = next(reader, None)
+            if headers is None:
+                raise ValueError(f"{csv_path} is empty")
+            by_exception = headers == ["Timestamp", "Tag", "Value"]
+            if not by_exception:
+                columns = [(name, pending.setdefault(name, ([], []))) for name in headers[1:]]
+            for row in reader:
+                if not row:
+                    continue
+                if row[0] != last_text:
+                    # Rows within one second share their timestamp text
+                    last_text, timestamp = row[0], datetime.fromisoformat(row[0]).timestamp()
+                if by_exception:
+                    cells = [(row[1], pending.setdefault(row[1], ([], [])), row[2])]
+                else:
+                    cells = [(name, series, text) for (name, series), text in zip(columns, row[1:]) if text]
+                for tag, (timestamps, values), text in cells:
+                    timestamps.append(timestamp)
+                    values.append(_parse_value(text))
+                    if len(values) >= CHUNK_POINTS:
+                        writer.add_series(tag, timestamps, values)
+                        samples += len(values)
+                        del timestamps[:], values[:]
+
+        for tag, (timestamps, values) in pending.items():
+            writer.add_series(tag, timestamps, values)
+            samples += len(values)
+    except Exception:
+        writer.abort()
+        raise
+    writer.close()
+    return archive_path, samples
+
+
+def rotated_files(csv_path):
+    """Rotated siblings of a CSV file (<name>_<YYYYmmdd-HHMMSS>[-n]<ext>), oldest first."""
+    folder = os.path.dirname(csv_path) or "."
+    base, ext = os.path.splitext(os.path.basename(csv_path))
+    pattern = re.compile(re.escape(base) + r"_\d{8}-\d{6}(-\d+)?" + re.escape(ext) + "$")
+    return sorted(os.path.join(folder, name) for name in os.listdir(folder) if pattern.match(name))
+
+
+class ArchiveCompactor:
+    """Compacts rotated CSV files of ``csv_paths`` into archives in a background thread.
+
+    A CSV file is only removed (with ``delete_source``) after its archive
+    has been written and read back with the same number of samples.
+    """
+
+    def __init__(self, csv_paths, interval=300.0, delete_source=False, log=None):
+        self.csv_paths = list(csv_paths)
+        self.interval = interval
+        self.delete_source = delete_source
+        self.log = log or (lambda message: None)
+        self.compacted = 0
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="archive-compactor", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stops after the current file; an archive cut short is redone on the next start."""
+        self._stopped.set()
+
+    def run_once(self):
+        """Compacts every rotated file that has no archive yet."""
+        for csv_path in self.csv_paths:
+            for rotated in rotated_files(csv_path):
+                if self._stopped.is_set():
+                    return
+                archive_path = os.path.splitext(rotated)[0] + ARCHIVE_EXT
+                if os.path.exists(archive_path):
+                    continue
+                try:
+                    self._compact(rotated, archive_path)
+                except Exception as e:
+                    self.log(f"Could not archive {rotated}: {e}")
+
+    def _compact(self, rotated, archive_path):
+        archive_path, samples = compact_csv(rotated, archive_path)
+        with ArchiveReader(archive_path) as reader:
+            stored = sum(info.count for infos in reader.chunks_by_tag.values() for info in infos)
+        if stored != samples:
+            os.remove(archive_path)
+            raise ValueError(f"archive holds {stored} of {samples} samples")
+        self.compacted += 1
+        before, after = os.path.getsize(rotated), os.path.getsize(archive_path)
+        self.log(f"Archived {rotated}: {before} -> {after} bytes ({before / max(after, 1):.0f}x)")
+        if self.delete_source:
+            os.remove(rotated)
+
+    def _run(self):
+        while not self._stopped.is_set():
+            self.run_once()
+            self._stopped.wait(self.interval)
@@ -0,0 +1,285 @@
+# ==================== DEVICE CAPABILITY PROBING ====================
+#
+# The read planner assumes every device accepts the protocol maximum of 125
+# registers (2000 bits) per request and answers every address between two
+# tags. Many field devices don't: they reject large reads, have holes in
+# their address maps or don't implement some function codes, and a plan
+# that ignores this fails on every scan.
+#
+# probe_device() finds out once per device and unit: which read function
+# codes it supports, which addresses around the configured tags it can read
+# (large reads that fail are split in halves until they succeed, so holes
+# cost a few requests each) and the largest block it accepts. The results
+# are cached in a JSON file keyed by host:port/unit, so later startups plan
+# from the cache without probing. A device is only probed again when its
+# tags move outside the probed spans.
+
+import json
+import os
+import threading
+import time
+
+from modbus_logger.read_plan import MAX_READ_COUNT, ReadBlock, block_request, make_tag
+
+ILLEGAL_FUNCTION = 1  # Modbus exception code of a function the device doesn't implement
+
+DEFAULT_CACHE_FILE = "device_capabilities.json"
+
+
+def device_key(host, port=None, unit_id=1):
+    """Cache key of one unit: "host:port/unit", or "port_name/unit" on a serial line."""
+    if port is None:
+        return f"{host}/{unit_id}"
+    return f"{host}:{port}/{unit_id}"
+
+
+def tag_spans(tags):
+    """{function_code: (first address, last address)} covered by ``tags``."""
+    spans = {}
+    for tag in map(make_tag, tags):
+        last = tag.address + getattr(tag, "width", 1) - 1
+        start, end = spans.get(tag.function_code, (tag.address, last))
+        spans[tag.function_code] = (min(start, tag.address), max(end, last))
+    return spans
+
+
+class DeviceCapabilities:
+    """What one unit accepts: function codes, largest read and readable ranges.
+
+    ``max_count`` maps function codes to the largest read that succeeded,
+    ``ranges`` to sorted (start, end) address ranges that could be read and
+    ``spans`` to the (start, end) span that was probed.
+    """
+
+    def __init__(self, function_codes, max_count=None, ranges=None, spans=None, probed_at=None):
+        self.function_codes = set(function_codes)
+        self.max_count = dict(max_count or {})
+        self.ranges = {function_code: [tuple(r) for r in ranges_] for function_code, ranges_ in (ranges or {}).items()}
+        self.spans = {function_code: tuple(span) for function_code, span in (spans or {}).items()}
+        self.probed_at = probed_at if probed_at is not None else time.time()
+        self.requests = 0  # Requests the probe took (not cached)
+
+    def supports(self, function_code):
+        return function_code in self.function_codes
+
+    def limit(self, function_code):
+        """Largest quantity to request in one read."""
+        return min(MAX_READ_COUNT[function_code], self.max_count.get(function_code) or MAX_READ_COUNT[function_code])
+
+    def readable(self, function_code, start, end):
+        """True if [start, end] can be read in one request (unknown spans count as readable)."""
+        if function_code not in self.ranges:
+            return True
+        return any(low <= start and end <= high for low, high in self.ranges[function_code])
+
+    def covers(self, tags):
+        """True if every tag lies within what was probed."""
+        for function_code, (start, end) in tag_spans(tags).items():
+            span = self.spans.get(function_code)
+            if span is None or start < span[0] or end > span[1]:
+                return False
+        return True
+
+    def unreadable(self, tags):
+        """Tags this unit can't read: unsupported function code or an address in a hole."""
+        result = []
+        for tag in map(make_tag, tags):
+            last = tag.address + getattr(tag, "width", 1) - 1
+            if not self.supports(tag.function_code) or not self.readable(tag.function_code, tag.address, last):
+                result.append(tag)
+        return result
+
+    def __str__(self):
+        parts = []
+        for function_code in sorted(self.spans):
+            if not self.supports(function_code):
+                parts.append(f"FC{function_code} unsupported")
+            else:
+                parts.append(f"FC{function_code} up to {self.limit(function_code)} "
+                             f"in {len(self.ranges.get(function_code, []))} range(s)")
+        return ", ".join(parts) or "nothing probed"
+
+    def to_dict(self):
+        return {
+            "function_codes": sorted(self.function_codes),
+            "max_count": {str(fc): count for fc, count in self.max_count.items()},
+            "ranges": {str(fc): [list(r) for r in ranges] for fc, ranges in self.ranges.items()},
+            "spans": {str(fc): list(span) for fc, span in self.spans.items()},
+            "probed_at": self.probed_at,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data["function_codes"],
+                   {int(fc): count for fc, count in data.get("max_count", {}).items()},
+                   {int(fc): ranges for fc, ranges in data.get("ranges", {}).items()},
+                   {int(fc): span for fc, span in data.get("spans", {}).items()},
+                   data.get("probed_at"))
+
+
+# ==================== PROBING ====================
+
+class _Prober:
+    def __init__(self, client, unit_id):
+        self.client = client
+        self.unit_id = unit_id
+        self.requests = 0
+
+    def read(self, function_code, address, count):
+        """Returns (success, exception code) of one read."""
+        self.requests += 1
+        try:
+            response = block_request(self.client, ReadBlock(self.unit_id, function_code, address, count, ()))
+        except Exception:
+            self._check_connection()
+            return False, None
+        if response.isError():
+            return False, getattr(response, "exception_code", None)
+        return True, None
+
+    def _check_connection(self):
+        # Timeouts are expected while probing, a lost connection is not
+        if not self.client.connected and not self.client.connect():
+            raise ConnectionError(f"Lost the connection while probing unit {self.unit_id}")
+
+    def readable_ranges(self, function_code, start, end):
+        limit = MAX_READ_COUNT[function_code]
+        ranges = []
+        largest = 0
+        for chunk_start in range(start, end + 1, limit):
+            chunk_ranges, chunk_largest = self._split(function_code, chunk_start, min(chunk_start + limit - 1, end))
+            ranges.extend(chunk_ranges)
+            largest = max(largest, chunk_largest)
+        merged = []
+        for low, high in ranges:
+            if merged and merged[-1][1] + 1 == low:
+                merged[-1] = (merged[-1][0], high)
+            else:
+                merged.append((low, high))
+        return merged, largest
+
+    def _split(self, function_code, start, end):
+        # Halve failed reads until they succeed or reach a single unreadable address
+        ok, _ = self.read(function_code, start, end - start + 1)
+        if ok:
+            return [(start, end)], end - start + 1
+        if start == end:
+            return [], 0
+        middle = (start + end) // 2
+        low_ranges, low_largest = self._split(function_code, start, middle)
+        high_ranges, high_largest = self._split(function_code, middle + 1, end)
+        return low_ranges + high_ranges, max(low_largest, high_largest)
+
+    def max_count(self, function_code, ranges, known):
+        """Largest read accepted at the start of the longest range, ``known`` already succeeded."""
+        start, end = max(ranges, key=lambda r: r[1] - r[0])
+        low, high = max(known, 1), min(MAX_READ_COUNT[function_code], end - start + 1)
+        while low < high:
+            count = (low + high + 1) // 2
+            if self.read(function_code, start, count)[0]:
+                low = count
+            else:
+                high = count - 1
+        return low
+
+
+def probe_device(client, unit_id=1, tags=(), function_codes=None):
+    """Probes one unit and returns its DeviceCapabilities.
+
+    Readable ranges and the block size are probed over the span of ``tags``
+    per function code; ``function_codes`` without tags are only checked
+    for support (at address 0). Raises ConnectionError if the connection
+    is lost.
+    """
+    prober = _Prober(client, unit_id)
+    spans = tag_spans(tags)
+    for function_code in function_codes or ():
+        spans.setdefault(function_code, (0, 0))
+
+    supported = set()
+    max_count = {}
+    ranges = {}
+    for function_code, (start, end) in sorted(spans.items()):
+        ok, code = prober.read(function_code, start, 1)
+        if code == ILLEGAL_FUNCTION:
+            ranges[function_code] = []
+            continue
+        found, largest = prober.readable_ranges(function_code, start, end)
+        ranges[function_code] = found
+        if ok or found or code is not None:
+            supported.add(function_code)
+        if found:
+            max_count[function_code] = prober.max_count(function_code, found, largest)
+
+    capabilities = DeviceCapabilities(supported, max_count, ranges, spans)
+    capabilities.requests = prober.requests
+    return capabilities
+
+
+# ==================== CACHE ====================
+
+class CapabilityCache:
+    """DeviceCapabilities per ``device_key()``, kept in a JSON file. Thread-safe."""
+
+    def __init__(self, path=DEFAULT_CACHE_FILE):
+        self.path = path
+        self._lock = threading.Lock()
+        self._entries = {}
+        try:
+            with open(path, encoding="utf-8") as f:
+                self._entries = json.load(f)
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError):
+            # A damaged cache only costs a new probe
+            self._entries = {}
+
+    def get(self, key):
+        data = self._entries.get(key)
+        if data is None:
+            return None
+        try:
+            return DeviceCapabilities.from_dict(data)
+        except (KeyError, TypeError, ValueError):
+            return None
+
+    def put(self, key, capabilities):
+        """Stores the capabilities of one unit and rewrites the file."""
+        with self._lock:
+            self._entries[key] = capabilities.to_dict()
+            self._save()
+
+    def for_device(self, host, port=None):
+        """{unit_id: DeviceCapabilities} of every cached unit of one device."""
+        prefix = device_key(host, port, "")
+        with self._lock:
+            keys = [key for key in self._entries if key.startswith(prefix) and key[len(prefix):].isdigit()]
+        return {int(key[len(prefix):]): self.get(key) for key in keys}
+
+    def remove(self, key):
+        """Forgets one unit, so it is probed again on the next start."""
+        with self._lock:
+            if self._entries.pop(key, None) is not None:
+                self._save()
+
+    def _save(self):
+        temp_path = f"{self.path}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump(self._entries, f, indent=2, sort_keys=True)
+        os.replace(temp_path, self.path)
+
+
+def load_capabilities(cache, key, client, unit_id, tags, reprobe=False):
+    """Returns the unit's DeviceCapabilities from ``cache``, probing it if needed.
+
+    A cached entry is used as long as it covers ``tags``. Without a
+    ``client`` (not connected yet) the cached entry, if any, is returned.
+    """
+    cached = cache.get(key)
+    if cached is not None and not reprobe and cached.covers(tags):
+        return cached
+    if client is None:
+        return cached
+    capabilities = probe_device(client, unit_id, tags)
+    cache.put(key, capabilities)
+    return capabilities
@@ -0,0 +1,205 @@
+# ==================== TRAFFIC CAPTURE ====================
+#
+# Records every Modbus transaction a client makes (request PDU, response
+# PDU, time and latency) to a compact binary file, so production traffic
+# can be served back offline by benchmarks/replay.py and the logging
+# pipeline load-tested and profiled against exact plant inputs.
+#
+# pymodbus clients are hooked through their ``trace_pdu`` callback (see
+# capture_kwargs()); PipelinedTcpClient records its transactions itself.
+#
+# File layout (little endian):
+#   header   magic, version, capture start (Unix time)
+#   records  kind, source, µs since start, latency µs, unit ID,
+#            request length, response length, request, response
+# A "source" record names a device (e.g. "192.168.1.10:502") the first
+# time it appears; transaction records refer to it by number. A request
+# that got no answer has latency NO_RESPONSE and an empty response.
+
+import inspect
+import struct
+import threading
+import time
+from collections import namedtuple
+
+MAGIC = b"MBCAPT01"
+VERSION = 1
+HEADER = struct.Struct("<8sId")     # magic, version, start time
+RECORD = struct.Struct("<BHQIBHH")  # kind, source, offset µs, latency µs, unit ID, request length, response length
+
+KIND_TRANSACTION = 1
+KIND_SOURCE = 2
+NO_RESPONSE = 0xFFFFFFFF
+
+FLUSH_BYTES = 65536   # Buffered bytes that trigger a write
+FLUSH_INTERVAL = 5.0  # Seconds a record may wait in the buffer
+
+# timestamp is Unix time of the request, latency seconds (None: no answer, response b"")
+Transaction = namedtuple("Transaction", ["timestamp", "source", "unit_id", "request", "response", "latency"])
+
+
+class CaptureWriter:
+    """Appends transactions to a capture file. Thread-safe.
+
+    Records are buffered and written every FLUSH_BYTES or FLUSH_INTERVAL
+    seconds. Once the file reaches ``max_bytes`` further transactions are
+    counted in ``dropped`` instead of written.
+    """
+
+    def __init__(self, path, max_bytes=None):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.start = time.time()
+        self.records = 0
+        self.dropped = 0
+        self._lock = threading.Lock()
+        self._sources = {}
+        self._buffer = bytearray(HEADER.pack(MAGIC, VERSION, self.start))
+        self._written = 0
+        self._last_flush = time.monotonic()
+        self._file = open(path, "wb")
+
+    def record(self, source, unit_id, request, response, timestamp, latency=None):
+        """Adds one transaction; ``response`` None (or ``latency`` None) means it went unanswered."""
+        if response is None or latency is None:
+            response, latency_us = b"", NO_RESPONSE
+        else:
+            latency_us = min(int(latency * 1e6), NO_RESPONSE - 1)
+        offset = max(0, int((timestamp - self.start) * 1e6))
+        with self._lock:
+            if self._file is None:
+                return
+            if self.max_bytes and self._written + len(self._buffer) >= self.max_bytes:
+                self.dropped += 1
+                return
+            source_id = self._sources.get(source)
+            if source_id is None:
+                source_id = self._sources[source] = len(self._sources)
+                name = str(source).encode()
+                self._buffer += RECORD.pack(KIND_SOURCE, source_id, offset, 0, 0, len(name), 0) + name
+            self._buffer += RECORD.pack(KIND_TRANSACTION, source_id, offset, latency_us, unit_id,
+                                        len(request), len(response))
+            self._buffer += request
+            self._buffer += response
+            self.records += 1
+            if len(self._buffer) >= FLUSH_BYTES or time.monotonic() - self._last_flush >= FLUSH_INTERVAL:
+                self._flush()
+
+    def flush(self):
+        with self._lock:
+            if self._file is not None:
+                self._flush()
+
+    def _flush(self):
+        self._file.write(self._buffer)
+        self._file.flush()
+        self._written += len(self._buffer)
+        self._buffer = bytearray()
+        self._last_flush = time.monotonic()
+
+    def close(self):
+        with self._lock:
+            if self._file is None:
+                return
+            self._flush()
+            self._file.close()
+            self._file = None
+
+
+def read_capture(path):
+    """Yields the Transactions of a capture file in recorded order.
+
+    A record cut short (the logger was killed while writing) ends the capture.
+    """
+    with open(path, "rb") as f:
+        data = f.read()
+    magic, version, start = HEADER.unpack_from(data, 0)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError(f"{path} is not a Modbus capture")
+
+    sources = {}
+    offset = HEADER.size
+    while offset + RECORD.size <= len(data):
+        kind, source_id, micros, latency_us, unit_id, request_length, response_length = \
+            RECORD.unpack_from(data, offset)
+        offset += RECORD.size
+        if offset + request_length + response_length > len(data):
+            break
+        request = data[offset:offset + request_length]
+        offset += request_length
+        response = data[offset:offset + response_length]
+        offset += response_length
+        if kind == KIND_SOURCE:
+            sources[source_id] = request.decode()
+        elif kind == KIND_TRANSACTION:
+            latency = None if latency_us == NO_RESPONSE else latency_us / 1e6
+            yield Transaction(start + micros / 1e6, sources.get(source_id, str(source_id)), unit_id,
+                              request, response, latency)
+
+
+# ==================== PYMODBUS HOOK ====================
+
+def pdu_bytes(pdu):
+    """Function code plus data of a pymodbus PDU, as on the wire."""
+    return bytes([pdu.function_code & 0xFF]) + pdu.encode()
+
+
+class PduTracer:
+    """``trace_pdu`` callback that records a pymodbus client's transactions as ``source``.
+
+    pymodbus clients have one transaction in flight, so a request still
+    pending when the next one is sent went unanswered.
+    """
+
+    def __init__(self, capture, source):
+        self.capture = capture
+        self.source = source
+        self._pending = None  # (timestamp, sent, unit ID, request PDU)
+
+    def __call__(self, sending, pdu):
+        try:
+            if sending:
+                self._finish(None)
+                self._pending = (time.time(), time.monotonic(), pdu.dev_id, pdu_bytes(pdu))
+            else:
+                self._finish(pdu_bytes(pdu))
+        except Exception:
+            # Capturing must never break the connection
+            pass
+        return pdu
+
+    def _finish(self, response):
+        pending, self._pending = self._pending, None
+        if pending is not None:
+            timestamp, sent, unit_id, request = pending
+            latency = time.monotonic() - sent if response is not None else None
+            self.capture.record(self.source, unit_id, request, response, timestamp, latency)
+
+
+def _client_params(client_class):
+    try:
+        return inspect.signature(client_class).parameters
+    except (TypeError, ValueError):
+        return {}
+
+
+def supports_capture(client_class):
+    """True if clients of this class can be captured (pymodbus 3.9+ or PipelinedTcpClient)."""
+    params = _client_params(client_class)
+    return "trace_pdu" in params or "capture" in params
+
+
+def capture_kwargs(client_class, capture, source):
+    """Client keyword arguments that record its traffic into ``capture`` as ``source``.
+
+    Empty without a capture, or when the client can't be captured (the
+    ``trace_pdu`` hook was added in pymodbus 3.9).
+    """
+    if capture is None:
+        return {}
+    params = _client_params(client_class)
+    if "capture" in params:
+        return {"capture": capture, "source": source}
+    if "trace_pdu" in params:
+        return {"trace_pdu": PduTracer(capture, source)}
+    return {}
@@ -0,0 +1,173 @@
+# ==================== BUFFERED CSV WRITER ====================
+#
+# Keeps the CSV file open and queues rows in memory, writing them out in
+# groups once enough rows are pending or enough time has passed. This
+# replaces an open/write/close (and a fresh csv.writer) per sample.
+# Files can be rotated by size or by day; rotated files are renamed to
+# <name>_<YYYYmmdd-HHMMSS><ext> after the time of their first row.
+# An existing file whose header doesn't match the current tags is rotated
+# out of the way the same way instead of being appended to.
+
+import csv
+import os
+import threading
+import time
+from datetime import datetime
+
+# fsync policies
+FSYNC_NEVER = "never"    # leave it to the OS page cache
+FSYNC_FLUSH = "flush"    # fsync after every group commit
+FSYNC_ROTATE = "rotate"  # fsync only when a file is rotated or closed
+
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+
+class BufferedCsvWriter:
+    """Appends rows to a CSV file in batches, with optional rotation.
+
+    Rows are queued by ``write_row()`` and written when ``flush_rows`` are
+    pending or ``flush_interval`` seconds have passed since the last flush.
+    A background timer flushes rows left queued after the last write, so
+    no row waits much longer than ``flush_interval`` even when the device
+    stops answering. Call ``close()`` to write out whatever is still
+    queued. Thread-safe.
+    """
+
+    def __init__(self, path, headers, flush_rows=100, flush_interval=5.0, fsync=FSYNC_NEVER,
+                 rotate_max_bytes=0, rotate_daily=False, timestamp_format=TIMESTAMP_FORMAT):
+        if fsync not in (FSYNC_NEVER, FSYNC_FLUSH, FSYNC_ROTATE):
+            raise ValueError(f"Unknown fsync policy: {fsync}")
+        self.path = path
+        self.headers = list(headers)
+        self.flush_rows = max(1, flush_rows)
+        self.flush_interval = flush_interval
+        self.fsync = fsync
+        self.rotate_max_bytes = rotate_max_bytes
+        self.rotate_daily = rotate_daily
+        self.timestamp_format = timestamp_format
+        self.rows_written = 0
+
+        self._lock = threading.RLock()
+        self._closed = threading.Event()
+        self._pending = []
+        self._last_flush = time.monotonic()
+        self._file = None
+        self._writer = None
+        self._file_started = None
+        # Rows from the same second share one formatted timestamp
+        self._cached_second = None
+        self._cached_text = None
+
+        self.created = False
+        self._open()
+        if flush_interval and flush_interval > 0:
+            threading.Thread(target=self._flush_loop, name=f"csv-flush-{os.path.basename(path)}",
+                             daemon=True).start()
+
+    @property
+    def pending(self):
+        """Number of rows queued but not yet written."""
+        return len(self._pending)
+
+    def write_row(self, timestamp, values):
+        """Queues one row; ``timestamp`` is seconds since the epoch."""
+        with self._lock:
+            self._pending.append((timestamp, values))
+            if (len(self._pending) >= self.flush_rows
+                    or time.monotonic() - self._last_flush >= self.flush_interval):
+                self._flush()
+
+    def flush(self):
+        """Writes every queued row to disk as one group commit."""
+        with self._lock:
+            if self._file is not None:
+                self._flush()
+
+    def _flush(self):
+        rows, self._pending = self._pending, []
+        for timestamp, values in rows:
+            if self._needs_rotation(timestamp):
+                self._rotate(timestamp)
+            if self._file_started is None:
+                self._file_started = timestamp
+            self._writer.writerow([self.format_timestamp(timestamp)] + list(values))
+        self.rows_written += len(rows)
+
+        self._file.flush()
+        if self.fsync == FSYNC_FLUSH and rows:
+            os.fsync(self._file.fileno())
+        self._last_flush = time.monotonic()
+
+    def close(self):
+        """Flushes queued rows and closes the file."""
+        self._closed.set()
+        with self._lock:
+            if self._file is None:
+                return
+            self._flush()
+            if self.fsync != FSYNC_NEVER:
+                os.fsync(self._file.fileno())
+            self._file.close()
+            self._file = None
+
+    def _flush_loop(self):
+        # Wake a few times per interval so a stale row waits at most ~1.25 intervals
+        while not self._closed.wait(max(self.flush_interval / 4, 0.05)):
+            with self._lock:
+                if (self._file is not None and self._pending
+                        and time.monotonic() - self._last_flush >= self.flush_interval):
+                    self._flush()
+
+    def format_timestamp(self, timestamp):
+        second = int(timestamp)
+        if second != self._cached_second:
+            self._cached_second = second
+            self._cached_text = datetime.fromtimestamp(second).strftime(self.timestamp_format)
+        return self._cached_text
+
+    def _open(self):
+        new_file = not os.path.exists(self.path) or os.path.getsize(self.path) == 0
+        if not new_file and self._file_headers() != self.headers:
+            # Appending would put rows under another file's columns
+            os.replace(self.path, self._rotated_path(os.path.getmtime(self.path)))
+            new_file = True
+        if new_file:
+            self.created = True
+        self._file = open(self.path, mode="a", newline="")
+        self._writer = csv.writer(self._file)
+        if new_file:
+            self._writer.writerow(self.headers)
+            self._file_started = None
+        else:
+            self._file_started = os.path.getmtime(self.path)
+
+    def _file_headers(self):
+        with open(self.path, newline="") as f:
+            return next(csv.reader(f), None)
+
+    def _rotated_path(self, started):
+        base, ext = os.path.splitext(self.path)
+        stamp = datetime.fromtimestamp(started).strftime("%Y%m%d-%H%M%S")
+        rotated = f"{base}_{stamp}{ext}"
+        suffix = 1
+        while os.path.exists(rotated):
+            rotated = f"{base}_{stamp}-{suffix}{ext}"
+            suffix += 1
+        return rotated
+
+    def _needs_rotation(self, timestamp):
+        if self._file_started is None:
+            return False
+        if self.rotate_daily and (datetime.fromtimestamp(timestamp).date()
+                                  != datetime.fromtimestamp(self._file_started).date()):
+            return True
+        return bool(self.rotate_max_bytes) and self._file.tell() >= self.rotate_max_bytes
+
+    def _rotate(self, timestamp):
+        self._file.flush()
+        if self.fsync != FSYNC_NEVER:
+            os.fsync(self._file.fileno())
+        self._file.close()
+
+        os.replace(self.path, self._rotated_path(self._file_started))
+        self._open()
@@ -0,0 +1,57 @@
+# ==================== REPORT BY EXCEPTION ====================
+#
+# Change detection between the read and the writer: a value is reported
+# only when it moved by more than its deadband since the last reported
+# value, or when it has been silent for longer than its heartbeat. Coils
+# and other booleans are reported on any change.
+
+import math
+from collections import namedtuple
+
+# absolute: minimum change in engineering units
+# percent: minimum change relative to the last reported value
+# max_silence: seconds after which the value is reported even if unchanged (None = never)
+Deadband = namedtuple("Deadband", ["absolute", "percent", "max_silence"], defaults=(0, 0, None))
+
+
+class ChangeFilter:
+    """Keeps the last reported value per tag and passes on only the changes."""
+
+    def __init__(self, default=Deadband(), deadbands=None):
+        self.default = default
+        self.deadbands = dict(deadbands or {})
+        self.reported = 0
+        self.suppressed = 0
+        self._last = {}
+
+    def changes(self, timestamp, values):
+        """Returns [(tag, value)] for the values of ``values`` ({tag: value}) worth reporting."""
+        changed = []
+        for tag, value in values.items():
+            if value is None or (isinstance(value, float) and math.isnan(value)):
+                continue
+            band = self.deadbands.get(tag, self.default)
+            last = self._last.get(tag)
+            if (last is None
+                    or exceeds_deadband(band, last[1], value)
+                    or (band.max_silence is not None and timestamp - last[0] >= band.max_silence)):
+                self._last[tag] = (timestamp, value)
+                changed.append((tag, value))
+            else:
+                self.suppressed += 1
+        self.reported += len(changed)
+        return changed
+
+    def reset(self):
+        """Forgets the last values so the next scan is reported in full."""
+        self._last.clear()
+
+
+def exceeds_deadband(band, previous, value):
+    """True if ``value`` moved far enough from ``previous`` to be reported."""
+    if isinstance(value, bool) or isinstance(previous, bool):
+        return value != previous
+    delta = abs(value - previous)
+    if delta == 0:
+        return False
+    return delta > max(band.absolute, abs(previous) * band.percent / 100.0)
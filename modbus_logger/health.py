@@ -0,0 +1,153 @@
+# ==================== CONNECTION HEALTH ====================
+#
+# A per-device circuit breaker with jittered exponential backoff. After a
+# few consecutive failures the circuit opens and the device is left alone
+# until its backoff expires; then one probe is let through (half-open) and
+# either closes the circuit again or reopens it with a longer backoff.
+# The jitter keeps many devices that dropped together from reconnecting in
+# lockstep. A Reconnector runs the probes in a background thread, so the
+# scan loop never sleeps on a dead device.
+
+import random
+import threading
+import time
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half-open"
+
+
+class CircuitOpenError(ConnectionError):
+    """Raised instead of contacting a device whose circuit is open."""
+
+
+class Backoff:
+    """Exponential backoff delays: initial, initial * multiplier, ... up to maximum.
+
+    Every delay is shortened by a random fraction of up to ``jitter``.
+    """
+
+    def __init__(self, initial=1.0, maximum=60.0, multiplier=2.0, jitter=0.2):
+        self.initial = initial
+        self.maximum = maximum
+        self.multiplier = multiplier
+        self.jitter = jitter
+        self.attempts = 0
+
+    def next_delay(self):
+        delay = min(self.maximum, self.initial * self.multiplier ** self.attempts)
+        self.attempts += 1
+        return delay * (1 - self.jitter * random.random())
+
+    def reset(self):
+        self.attempts = 0
+
+
+class CircuitBreaker:
+    """Tracks the health of one device; thread-safe.
+
+    Call ``allow()`` before talking to the device and report the outcome with
+    ``record_success()`` or ``record_failure()``.
+    """
+
+    def __init__(self, failure_threshold=3, backoff=None):
+        self.failure_threshold = failure_threshold
+        self.backoff = backoff if backoff is not None else Backoff()
+        self.state = CLOSED
+        self.failures = 0
+        self.retry_at = 0.0
+        self._lock = threading.Lock()
+
+    def allow(self):
+        """Returns True if a request may be sent; an expired open circuit lets one probe through."""
+        with self._lock:
+            if self.state == CLOSED:
+                return True
+            if self.state == OPEN and time.monotonic() >= self.retry_at:
+                self.state = HALF_OPEN
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.state = CLOSED
+            self.failures = 0
+            self.backoff.reset()
+
+    def record_failure(self):
+        """Counts a failure; returns True if it opened the circuit."""
+        with self._lock:
+            self.failures += 1
+            if self.state == HALF_OPEN or (self.state == CLOSED and self.failures >= self.failure_threshold):
+                self._open()
+                return True
+            return False
+
+    def trip(self):
+        """Opens the circuit now, e.g. because the connection is known to be down."""
+        with self._lock:
+            self.failures += 1
+            self._open()
+
+    def _open(self):
+        self.state = OPEN
+        self.retry_at = time.monotonic() + self.backoff.next_delay()
+
+    def retry_in(self):
+        """Seconds until the next probe is allowed (0 if it is allowed now)."""
+        with self._lock:
+            if self.state != OPEN:
+                return 0.0
+            return max(0.0, self.retry_at - time.monotonic())
+
+
+class Reconnector:
+    """Re-establishes a connection in a background thread, paced by a CircuitBreaker.
+
+    ``connect`` returns a connected client or None. ``start()`` begins the
+    attempts (if they aren't already running) and ``take()`` hands over the
+    new client once one is connected.
+    """
+
+    def __init__(self, connect, breaker, name="reconnect"):
+        self.connect = connect
+        self.breaker = breaker
+        self.name = name
+        self._client = None
+        self._thread = None
+        self._stopped = threading.Event()
+        self._lock = threading.Lock()
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        with self._lock:
+            if self.running or self._client is not None:
+                return
+            self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+            self._thread.start()
+
+    def take(self):
+        """Returns the reconnected client once, or None while still reconnecting."""
+        with self._lock:
+            client, self._client = self._client, None
+            return client
+
+    def stop(self):
+        self._stopped.set()
+
+    def _run(self):
+        while not self._stopped.is_set():
+            if not self.breaker.allow():
+                self._stopped.wait(max(self.breaker.retry_in(), 0.05))
+                continue
+            client = self.connect()
+            if client is not None:
+                self.breaker.record_success()
+                with self._lock:
+                    self._client = client
+                return
+            # Without a connection there is nothing to retry before the backoff
+            self.breaker.trip()
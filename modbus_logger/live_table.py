@@ -0,0 +1,238 @@
+# ==================== SHARED LIVE VALUE TABLE ====================
+#
+# The logger, the GUI and the backend used to open their own connections
+# to the same PLC. Instead one acquisition process publishes the latest
+# value of every tag in a shared memory segment and the others attach to
+# it read-only: the device sees one poller and the readers never block it.
+#
+# Every tag has a value (float64), a quality and a timestamp. The writer
+# guards each update with a seqlock: it makes the sequence number odd,
+# writes, and makes it even again. A reader copies the table and keeps the
+# copy only if the sequence was even and unchanged around it, so it never
+# sees half of a scan and the writer never waits for a reader.
+#
+# Segment layout (little endian, every section 8-byte aligned):
+#   header   magic, version, tag count, reserved, sequence, writer pid
+#   names    64 bytes per tag
+#   data     values (float64), timestamps (float64), qualities (uint8)
+
+import os
+import struct
+import time
+import weakref
+from collections import namedtuple
+from multiprocessing import shared_memory
+
+MAGIC = b"MBLIVE01"
+VERSION = 1
+HEADER = struct.Struct("<8sIIQQQ")  # magic, version, tags, reserved, sequence, writer pid
+NAME = struct.Struct("<64s")
+SEQUENCE_OFFSET = 24
+PID_OFFSET = 32
+
+QUALITY_UNKNOWN = 0  # Never published
+QUALITY_GOOD = 1
+QUALITY_BAD = 2      # Last read failed; the value is the last good one
+
+QUALITY_NAMES = {
+    QUALITY_UNKNOWN: "unknown",
+    QUALITY_GOOD: "good",
+    QUALITY_BAD: "bad",
+}
+
+LiveValue = namedtuple("LiveValue", ["value", "quality", "timestamp"])
+
+
+def _align(size):
+    return (size + 7) & ~7
+
+
+def _segment_size(count):
+    return _align(HEADER.size + NAME.size * count) + 16 * count + _align(count)
+
+
+def _release(segment, views):
+    for view in views:
+        view.release()
+    segment.close()
+
+
+def _attach_segment(name):
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        # Before Python 3.13 every attached segment is registered with the
+        # resource tracker, which would remove it when this reader exits
+        segment = shared_memory.SharedMemory(name=name)
+        if os.name == "posix":
+            from multiprocessing import resource_tracker
+            resource_tracker.unregister(segment._name, "shared_memory")
+        return segment
+
+
+class LiveTable:
+    """Latest value, quality and timestamp per tag in shared memory.
+
+    The acquisition process calls ``LiveTable.create()`` and ``publish()``;
+    other processes ``LiveTable.attach()`` and call ``snapshot()`` or
+    ``get()``. Values are stored as float64 (integers are exact up to 2**53).
+    """
+
+    def __init__(self, segment, readonly):
+        self.name = segment.name.lstrip("/")
+        self.readonly = readonly
+        self._segment = segment
+
+        magic, version, count, _, _, _ = HEADER.unpack_from(segment.buf, 0)
+        if magic != MAGIC or version != VERSION:
+            segment.close()
+            raise ValueError(f"{self.name} is not a live value table")
+
+        self.tags = []
+        offset = HEADER.size
+        for _ in range(count):
+            self.tags.append(NAME.unpack_from(segment.buf, offset)[0].rstrip(b"\0").decode())
+            offset += NAME.size
+        self.index = {tag: i for i, tag in enumerate(self.tags)}
+
+        view = segment.buf.toreadonly() if readonly else segment.buf
+        offset = _align(offset)
+        self._sequence = view[SEQUENCE_OFFSET:SEQUENCE_OFFSET + 8].cast("Q")
+        self._pid = view[PID_OFFSET:PID_OFFSET + 8].cast("Q")
+        self._values = view[offset:offset + 8 * count].cast("d")
+        offset += 8 * count
+        self._timestamps = view[offset:offset + 8 * count].cast("d")
+        offset += 8 * count
+        self._qualities = view[offset:offset + count].cast("B")
+
+        # The views must go before the segment, also when a reader exits without close()
+        views = [self._sequence, self._pid, self._values, self._timestamps, self._qualities]
+        if readonly:
+            views.append(view)
+        self._release = weakref.finalize(self, _release, segment, views)
+
+    # ---------- opening ----------
+
+    @classmethod
+    def create(cls, name, tags):
+        """Creates the table for ``tags`` (names), replacing one left over under ``name``."""
+        tags = list(tags)
+        if len(set(tags)) != len(tags):
+            raise ValueError("Tag names must be unique")
+        for tag in tags:
+            if len(tag.encode()) > NAME.size:
+                raise ValueError(f"Tag name too long: {tag}")
+
+        try:
+            segment = shared_memory.SharedMemory(name=name, create=True, size=_segment_size(len(tags)))
+        except FileExistsError:
+            # Left by a logger that didn't exit cleanly: mark it closed for its
+            # readers and replace it (the tag list may have changed)
+            stale = shared_memory.SharedMemory(name=name)
+            try:
+                cls(stale, readonly=True)._retire(unlink=False)
+            except ValueError:
+                stale.close()
+            stale.unlink()
+            segment = shared_memory.SharedMemory(name=name, create=True, size=_segment_size(len(tags)))
+
+        HEADER.pack_into(segment.buf, 0, MAGIC, VERSION, len(tags), 0, 0, os.getpid())
+        for i, tag in enumerate(tags):
+            NAME.pack_into(segment.buf, HEADER.size + i * NAME.size, tag.encode())
+        return cls(segment, readonly=False)
+
+    @classmethod
+    def attach(cls, name):
+        """Attaches read-only to a table published by another process."""
+        return cls(_attach_segment(name), readonly=True)
+
+    @property
+    def closed(self):
+        """True once the writer has gone away; readers should attach again."""
+        return self._pid[0] == 0
+
+    def close(self, unlink=None):
+        """Detaches; the writer also marks the table closed and (by default) removes it."""
+        if not self._release.alive:
+            return
+        if not self.readonly:
+            self._retire(unlink=True if unlink is None else unlink)
+            return
+        self._release()
+
+    def _retire(self, unlink):
+        writable = self._segment.buf[PID_OFFSET:PID_OFFSET + 8].cast("Q")
+        writable[0] = 0
+        writable.release()
+        self._release()
+        if unlink:
+            self._segment.unlink()
+
+    # ---------- writing ----------
+
+    def slots(self, tags):
+        """Positions of ``tags`` for ``publish()``; look them up once, not every scan."""
+        return [self.index[tag] for tag in tags]
+
+    @property
+    def sequence(self):
+        """Even sequence number, advanced by 2 on every update."""
+        return self._sequence[0]
+
+    def publish(self, timestamp, values, slots=None, quality=QUALITY_GOOD):
+        """Publishes one scan: ``values`` in table order, or in the order of ``slots``.
+
+        None values keep the previous value and are marked bad.
+        """
+        if self.readonly:
+            raise PermissionError(f"{self.name} is attached read-only")
+        if slots is None:
+            slots = range(len(self.tags))
+        sequence = self._sequence[0]
+        self._sequence[0] = sequence + 1
+        try:
+            for slot, value in zip(slots, values):
+                if value is None:
+                    self._qualities[slot] = QUALITY_BAD
+                else:
+                    self._values[slot] = value
+                    self._qualities[slot] = quality
+                self._timestamps[slot] = timestamp
+        finally:
+            self._sequence[0] = sequence + 2
+
+    def mark_bad(self, timestamp, slots=None):
+        """Flags tags (all by default) as bad after a failed read, keeping their last values."""
+        if slots is None:
+            slots = range(len(self.tags))
+        self.publish(timestamp, [None] * len(slots), slots)
+
+    # ---------- reading ----------
+
+    def snapshot(self, tags=None, timeout=0.1):
+        """Returns {tag: LiveValue} for ``tags`` (all by default) from one consistent update.
+
+        Raises TimeoutError if no consistent copy could be taken within
+        ``timeout`` seconds (e.g. the writer died in the middle of an update).
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            before = self._sequence[0]
+            if not before & 1:
+                values = self._values.tolist()
+                timestamps = self._timestamps.tolist()
+                qualities = self._qualities.tolist()
+                if self._sequence[0] == before:
+                    break
+            if time.monotonic() >= deadline:
+                raise TimeoutError(f"No consistent copy of {self.name} within {timeout} s")
+            time.sleep(0)
+
+        if tags is None:
+            return {tag: LiveValue(values[i], qualities[i], timestamps[i]) for i, tag in enumerate(self.tags)}
+        return {tag: LiveValue(values[self.index[tag]], qualities[self.index[tag]], timestamps[self.index[tag]])
+                for tag in tags}
+
+    def get(self, tag):
+        """Returns the LiveValue of one tag."""
+        return self.snapshot([tag])[tag]
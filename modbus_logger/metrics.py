@@ -0,0 +1,250 @@
+# ==================== ACQUISITION METRICS ====================
+#
+# Per-device counters, gauges and request latency histograms, kept in one
+# thread-safe registry and rendered in the Prometheus text format. The
+# numbers show which device or bus is holding back the scan rates: slow
+# or timing-out requests, reconnect storms, scan overruns and writers
+# that can't keep up.
+
+import asyncio
+import math
+import os
+import socket
+import threading
+import time
+
+from pymodbus.exceptions import ModbusIOException
+
+from modbus_logger.read_plan import FC_READ_COILS, FC_READ_DISCRETE_INPUTS
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# counter name -> (Prometheus metric, help text)
+COUNTERS = {
+    "requests": ("modbus_requests_total", "Modbus requests sent"),
+    "timeouts": ("modbus_timeouts_total", "Requests that got no response"),
+    "exceptions": ("modbus_exceptions_total", "Requests that failed with a client or transport error"),
+    "error_responses": ("modbus_error_responses_total", "Requests answered with a Modbus exception"),
+    "skipped": ("modbus_skipped_requests_total", "Requests skipped while the device was suspended"),
+    "reconnects": ("modbus_reconnects_total", "Connections re-established after being lost"),
+    "connect_failures": ("modbus_connect_failures_total", "Failed connection attempts"),
+    "bytes_sent": ("modbus_bytes_sent_total", "Request bytes on the wire (ADU)"),
+    "bytes_received": ("modbus_bytes_received_total", "Response bytes on the wire (ADU)"),
+    "scan_overruns": ("modbus_scan_overruns_total", "Scan deadlines missed because a scan ran late"),
+}
+
+# gauge name -> (Prometheus metric, help text)
+GAUGES = {
+    "writer_queue_depth": ("modbus_writer_queue_depth", "Rows waiting in the CSV writer buffer"),
+    "request_queue_depth": ("modbus_request_queue_depth", "Requests waiting for the device"),
+}
+
+# Bytes a Modbus ADU adds around the PDU: MBAP header, or unit ID plus CRC
+FRAMING_OVERHEAD = {"tcp": 7, "rtu": 3}
+
+
+def wire_bytes(block, response, framer="tcp"):
+    """Returns (sent, received) ADU sizes of a block read or write; received is 0 without a response."""
+    overhead = FRAMING_OVERHEAD.get(framer, 7)
+    sent = overhead + 5
+    values = getattr(block, "values", None)
+    if values is not None and len(values) > 1:
+        # Multi-write: quantity, byte count and the packed values follow the address
+        data = math.ceil(len(values) / 8) if block.kind == "coil" else 2 * len(values)
+        sent = overhead + 6 + data
+    if response is None:
+        return sent, 0
+    if response.isError():
+        return sent, overhead + 2
+    if values is not None:
+        return sent, overhead + 5
+    if block.function_code in (FC_READ_COILS, FC_READ_DISCRETE_INPUTS):
+        return sent, overhead + 2 + math.ceil(block.count / 8)
+    return sent, overhead + 2 + 2 * block.count
+
+
+def error_kind(error):
+    """Classifies a failed request as a "timeout" or an "exception"."""
+    if isinstance(error, (TimeoutError, socket.timeout, asyncio.TimeoutError, ModbusIOException)):
+        return "timeout"
+    return "exception"
+
+
+class Histogram:
+    """Fixed-bucket histogram of observed values."""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        index = next((i for i, bound in enumerate(self.buckets) if value <= bound), len(self.buckets))
+        self.counts[index] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, fraction):
+        """Upper bucket bound below which ``fraction`` of the observations fall."""
+        if not self.count:
+            return None
+        target = fraction * self.count
+        seen = 0
+        for bound, count in zip(self.buckets + (math.inf,), self.counts):
+            seen += count
+            if seen >= target:
+                return bound
+        return math.inf
+
+
+class DeviceMetrics:
+    def __init__(self):
+        self.counters = dict.fromkeys(COUNTERS, 0)
+        self.gauges = {}
+        self.latency = Histogram()
+
+
+def _label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _number(value):
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class MetricsRegistry:
+    """Thread-safe per-device metrics; devices appear the first time they are used."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._devices = {}
+
+    def _device(self, device):
+        metrics = self._devices.get(device)
+        if metrics is None:
+            metrics = self._devices[device] = DeviceMetrics()
+        return metrics
+
+    def count(self, device, counter, amount=1):
+        with self._lock:
+            self._device(device).counters[counter] += amount
+
+    def set_gauge(self, device, gauge, value):
+        with self._lock:
+            self._device(device).gauges[gauge] = value
+
+    def observe_request(self, device, block, seconds, response=None, error=None, framer="tcp"):
+        """Records one block request: latency, outcome and bytes on the wire."""
+        sent, received = wire_bytes(block, response, framer)
+        with self._lock:
+            metrics = self._device(device)
+            counters = metrics.counters
+            counters["requests"] += 1
+            counters["bytes_sent"] += sent
+            counters["bytes_received"] += received
+            if error is not None:
+                counters["timeouts" if error_kind(error) == "timeout" else "exceptions"] += 1
+            elif response.isError():
+                # Older clients return the no-response error instead of raising it
+                counters["timeouts" if isinstance(response, ModbusIOException) else "error_responses"] += 1
+            metrics.latency.observe(seconds)
+
+    def timed_request(self, device, block, request, framer="tcp"):
+        """Runs ``request()`` for one block, records it and returns the response."""
+        start = time.perf_counter()
+        try:
+            response = request()
+        except Exception as e:
+            self.observe_request(device, block, time.perf_counter() - start, error=e, framer=framer)
+            raise
+        self.observe_request(device, block, time.perf_counter() - start, response, framer=framer)
+        return response
+
+    async def timed_request_async(self, device, block, request, framer="tcp"):
+        """Awaits ``request()`` for one block, records it and returns the response."""
+        start = time.perf_counter()
+        try:
+            response = await request()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self.observe_request(device, block, time.perf_counter() - start, error=e, framer=framer)
+            raise
+        self.observe_request(device, block, time.perf_counter() - start, response, framer=framer)
+        return response
+
+    def export(self):
+        """Returns a picklable copy of every device's metrics, e.g. to send to another process."""
+        with self._lock:
+            return {device: (dict(metrics.counters), dict(metrics.gauges), list(metrics.latency.counts),
+                             metrics.latency.sum, metrics.latency.count)
+                    for device, metrics in self._devices.items()}
+
+    def load(self, exported):
+        """Replaces the metrics of the devices in an ``export()`` with its values."""
+        with self._lock:
+            for device, (counters, gauges, counts, total, count) in exported.items():
+                metrics = self._device(device)
+                metrics.counters.update(counters)
+                metrics.gauges.update(gauges)
+                metrics.latency.counts = list(counts)
+                metrics.latency.sum = total
+                metrics.latency.count = count
+
+    def render(self):
+        """Returns every metric in the Prometheus text exposition format."""
+        with self._lock:
+            devices = sorted(self._devices.items())
+            lines = []
+            for name, (metric, help_text) in COUNTERS.items():
+                lines.append(f"# HELP {metric} {help_text}")
+                lines.append(f"# TYPE {metric} counter")
+                for device, metrics in devices:
+                    lines.append(f'{metric}{{device="{_label(device)}"}} {metrics.counters[name]}')
+            for name, (metric, help_text) in GAUGES.items():
+                lines.append(f"# HELP {metric} {help_text}")
+                lines.append(f"# TYPE {metric} gauge")
+                for device, metrics in devices:
+                    if name in metrics.gauges:
+                        lines.append(f'{metric}{{device="{_label(device)}"}} {_number(metrics.gauges[name])}')
+            metric = "modbus_request_duration_seconds"
+            lines.append(f"# HELP {metric} Block request latency")
+            lines.append(f"# TYPE {metric} histogram")
+            for device, metrics in devices:
+                label = _label(device)
+                histogram = metrics.latency
+                cumulative = 0
+                for bound, count in zip(histogram.buckets + (math.inf,), histogram.counts):
+                    cumulative += count
+                    lines.append(f'{metric}_bucket{{device="{label}",le="{_number(bound)}"}} {cumulative}')
+                lines.append(f'{metric}_sum{{device="{label}"}} {histogram.sum!r}')
+                lines.append(f'{metric}_count{{device="{label}"}} {histogram.count}')
+        return "\n".join(lines) + "\n"
+
+    def summary(self):
+        """One human-readable line per device for console dumps."""
+        with self._lock:
+            lines = []
+            for device, metrics in sorted(self._devices.items()):
+                counters = metrics.counters
+                p95 = metrics.latency.quantile(0.95)
+                latency = "-" if p95 is None else ("> 10 s" if p95 == math.inf else f"<= {p95 * 1000:g} ms")
+                lines.append(
+                    f"{device}: {counters['requests']} requests, p95 {latency}, "
+                    f"{counters['timeouts']} timeouts, {counters['exceptions']} exceptions, "
+                    f"{counters['reconnects']} reconnects, {counters['connect_failures']} failed connects, "
+                    f"{counters['scan_overruns']} overruns, "
+                    f"{counters['bytes_sent']}/{counters['bytes_received']} bytes out/in, "
+                    f"queue {metrics.gauges.get('writer_queue_depth', metrics.gauges.get('request_queue_depth', 0))}"
+                )
+        return lines
+
+    def write_textfile(self, path):
+        """Writes the metrics atomically, e.g. for the node_exporter textfile collector."""
+        temp_path = f"{path}.tmp"
+        with open(temp_path, "w") as f:
+            f.write(self.render())
+        os.replace(temp_path, path)
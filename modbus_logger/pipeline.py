@@ -0,0 +1,265 @@
+# ==================== PIPELINED MODBUS TCP ====================
+#
+# ModbusTcpClient sends a request and waits for its answer before sending
+# the next one, so on a link with 80 ms round trips a scan of 20 blocks
+# takes 1.6 s no matter how fast the device is. Modbus TCP allows several
+# transactions in flight on one socket: every request carries a
+# transaction ID in its MBAP header and the answer echoes it back.
+#
+# PipelinedTcpClient keeps up to ``window`` requests outstanding. A reader
+# thread matches responses to requests by transaction ID (so they may
+# arrive in any order) and rejects answers whose protocol or unit ID don't
+# match the request (a gateway routing a reply to the wrong socket). Each
+# transaction that isn't answered within its own timeout fails without
+# dropping the others. Devices differ in how many transactions they
+# queue, hence the per-device window; 1 gives the classic lockstep
+# behaviour.
+
+import select
+import socket
+import struct
+import threading
+import time
+from concurrent.futures import Future
+
+from modbus_logger.read_plan import (
+    FC_READ_COILS, FC_READ_DISCRETE_INPUTS, FC_READ_HOLDING_REGISTERS, FC_READ_INPUT_REGISTERS, READ_METHODS,
+)
+
+MBAP = struct.Struct(">HHHB")  # transaction ID, protocol ID, length, unit ID
+REQUEST = struct.Struct(">BHH")  # function code, address, count or value
+
+EXPIRY_CHECK = 0.05  # Seconds between checks for transactions that timed out
+
+FC_WRITE_COIL = 5
+FC_WRITE_REGISTER = 6
+FC_WRITE_COILS = 15
+FC_WRITE_REGISTERS = 16
+
+
+class PipelinedResponse:
+    """Decoded answer to one transaction, shaped like a pymodbus response."""
+
+    def __init__(self, function_code, registers=None, bits=None, exception_code=None, latency=0.0):
+        self.function_code = function_code
+        self.registers = registers if registers is not None else []
+        self.bits = bits if bits is not None else []
+        self.exception_code = exception_code
+        self.latency = latency  # Seconds from sending the request to its answer
+
+    def isError(self):
+        return self.exception_code is not None
+
+    def __str__(self):
+        if self.exception_code is not None:
+            return f"Exception Response(FC{self.function_code}, code {self.exception_code})"
+        return f"Response(FC{self.function_code})"
+
+
+def _parse_response(function_code, pdu, latency):
+    if pdu[0] & 0x80:
+        return PipelinedResponse(function_code, exception_code=pdu[1] if len(pdu) > 1 else 0, latency=latency)
+    if pdu[0] != function_code:
+        raise ValueError(f"Answer with FC{pdu[0]} to an FC{function_code} request")
+    if function_code in (FC_READ_COILS, FC_READ_DISCRETE_INPUTS):
+        data = pdu[2:2 + pdu[1]]
+        return PipelinedResponse(function_code, bits=[bool(byte >> bit & 1) for byte in data for bit in range(8)],
+                                 latency=latency)
+    if function_code in READ_METHODS:
+        registers = list(struct.unpack(f">{pdu[1] // 2}H", pdu[2:2 + pdu[1] - pdu[1] % 2]))
+        return PipelinedResponse(function_code, registers=registers, latency=latency)
+    return PipelinedResponse(function_code, latency=latency)
+
+
+class PipelinedTcpClient:
+    """Modbus TCP client with up to ``window`` transactions in flight on one socket.
+
+    ``submit()`` / ``submit_block()`` return a Future per transaction; the
+    read_* and write_* methods have the pymodbus signatures and wait for
+    their answer. ``execute_read_plan`` sends all blocks of a plan at once
+    when given this client. A transaction not answered within ``timeout``
+    seconds fails with TimeoutError; a lost connection fails all of them
+    with ConnectionError. With a ``capture.CaptureWriter`` every transaction
+    is recorded as ``source`` (default "host:port"). Thread-safe.
+    """
+
+    pipelined = True
+
+    def __init__(self, host, port=502, window=8, timeout=3.0, capture=None, source=None):
+        self.host = host
+        self.port = port
+        self.window = max(1, int(window))
+        self.timeout = timeout
+        self.capture = capture
+        self.source = source or f"{host}:{port}"
+        self.late_responses = 0  # Answers that arrived after their transaction timed out
+        self._socket = None
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(self.window)
+        self._pending = {}  # transaction ID -> (future, function code, sent at, deadline, unit ID, PDU, time)
+        self._next_id = 0
+
+    @property
+    def connected(self):
+        return self._socket is not None
+
+    def connect(self):
+        """Opens the socket (if needed); returns True when connected."""
+        with self._lock:
+            if self._socket is not None:
+                return True
+            try:
+                sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+            except OSError:
+                return False
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            self._socket = sock
+        threading.Thread(target=self._read_loop, args=(sock,), name=f"modbus-pipeline-{self.host}",
+                         daemon=True).start()
+        return True
+
+    def close(self):
+        """Closes the socket; transactions still in flight fail with ConnectionError."""
+        with self._lock:
+            sock, self._socket = self._socket, None
+        if sock is not None:
+            sock.close()
+        self._fail_all(ConnectionError(f"Connection to {self.host}:{self.port} closed"))
+
+    # ---------- transactions ----------
+
+    def submit(self, unit_id, pdu):
+        """Sends one request PDU and returns a Future of its PipelinedResponse.
+
+        Blocks while ``window`` transactions are already in flight.
+        """
+        if not self._slots.acquire(timeout=self.timeout):
+            raise TimeoutError(f"No free transaction slot on {self.host}:{self.port}")
+        future = Future()
+        with self._lock:
+            sock = self._socket
+            if sock is None:
+                self._slots.release()
+                raise ConnectionError(f"Not connected to {self.host}:{self.port}")
+            transaction_id = self._allocate_id()
+            sent = time.monotonic()
+            self._pending[transaction_id] = (future, pdu[0], sent, sent + self.timeout, unit_id, pdu, time.time())
+            try:
+                sock.sendall(MBAP.pack(transaction_id, 0, len(pdu) + 1, unit_id) + pdu)
+            except OSError as e:
+                del self._pending[transaction_id]
+                self._slots.release()
+                raise ConnectionError(f"Send to {self.host}:{self.port} failed: {e}") from e
+        return future
+
+    def submit_block(self, block):
+        """Sends the read of one ReadBlock and returns its Future."""
+        return self.submit(block.unit_id, REQUEST.pack(block.function_code, block.address, block.count))
+
+    def _allocate_id(self):
+        while True:
+            self._next_id = self._next_id % 0xFFFF + 1
+            if self._next_id not in self._pending:
+                return self._next_id
+
+    def _complete(self, transaction_id, pdu=None, error=None, protocol_id=0, unit_id=None):
+        with self._lock:
+            entry = self._pending.pop(transaction_id, None)
+        if entry is None:
+            self.late_responses += 1
+            return
+        self._slots.release()
+        future, function_code, sent, _, request_unit_id, request, timestamp = entry
+        if error is None and (protocol_id != 0 or (unit_id is not None and unit_id != request_unit_id)):
+            error = ValueError(f"Response from {self.host}:{self.port} to transaction {transaction_id} has "
+                               f"protocol ID {protocol_id} and unit ID {unit_id}, expected 0 and {request_unit_id}")
+        if self.capture is not None:
+            self.capture.record(self.source, request_unit_id, request, pdu if error is None else None, timestamp,
+                                time.monotonic() - sent)
+        if error is None:
+            try:
+                future.set_result(_parse_response(function_code, pdu, time.monotonic() - sent))
+            except (ValueError, IndexError, struct.error) as e:
+                future.set_exception(ValueError(f"Malformed response from {self.host}:{self.port}: {e}"))
+        else:
+            future.set_exception(error)
+
+    def _expire(self):
+        now = time.monotonic()
+        with self._lock:
+            expired = [transaction_id for transaction_id, entry in self._pending.items() if entry[3] <= now]
+        for transaction_id in expired:
+            self._complete(transaction_id, error=TimeoutError(
+                f"No response from {self.host}:{self.port} within {self.timeout} s"))
+
+    def _fail_all(self, error):
+        with self._lock:
+            transaction_ids = list(self._pending)
+        for transaction_id in transaction_ids:
+            self._complete(transaction_id, error=error)
+
+    def _read_loop(self, sock):
+        buffer = bytearray()
+        while True:
+            try:
+                ready, _, _ = select.select([sock], [], [], EXPIRY_CHECK)
+                data = sock.recv(65536) if ready else None
+            except (OSError, ValueError):
+                break
+            if data is not None:
+                if not data:
+                    break
+                buffer += data
+                while len(buffer) >= MBAP.size:
+                    transaction_id, protocol_id, length, unit_id = MBAP.unpack_from(buffer)
+                    if len(buffer) < 6 + length:
+                        break
+                    pdu = bytes(buffer[MBAP.size:6 + length])
+                    del buffer[:6 + length]
+                    self._complete(transaction_id, pdu, protocol_id=protocol_id, unit_id=unit_id)
+            self._expire()
+
+        with self._lock:
+            lost = self._socket is sock
+            if lost:
+                self._socket = None
+        sock.close()
+        # After close() the transactions already failed, and new ones may belong to a new socket
+        if lost:
+            self._fail_all(ConnectionError(f"Connection to {self.host}:{self.port} lost"))
+
+    # ---------- pymodbus-style calls ----------
+
+    def _call(self, unit_id, pdu):
+        return self.submit(unit_id, pdu).result()
+
+    def read_coils(self, address, count=1, device_id=1):
+        return self._call(device_id, REQUEST.pack(FC_READ_COILS, address, count))
+
+    def read_discrete_inputs(self, address, count=1, device_id=1):
+        return self._call(device_id, REQUEST.pack(FC_READ_DISCRETE_INPUTS, address, count))
+
+    def read_holding_registers(self, address, count=1, device_id=1):
+        return self._call(device_id, REQUEST.pack(FC_READ_HOLDING_REGISTERS, address, count))
+
+    def read_input_registers(self, address, count=1, device_id=1):
+        return self._call(device_id, REQUEST.pack(FC_READ_INPUT_REGISTERS, address, count))
+
+    def write_coil(self, address, value, device_id=1):
+        return self._call(device_id, REQUEST.pack(FC_WRITE_COIL, address, 0xFF00 if value else 0))
+
+    def write_register(self, address, value, device_id=1):
+        return self._call(device_id, REQUEST.pack(FC_WRITE_REGISTER, address, value))
+
+    def write_coils(self, address, values, device_id=1):
+        packed = bytearray((len(values) + 7) // 8)
+        for index, value in enumerate(values):
+            if value:
+                packed[index // 8] |= 1 << (index % 8)
+        pdu = REQUEST.pack(FC_WRITE_COILS, address, len(values)) + bytes([len(packed)]) + bytes(packed)
+        return self._call(device_id, pdu)
+
+    def write_registers(self, address, values, device_id=1):
+        pdu = (REQUEST.pack(FC_WRITE_REGISTERS, address, len(values)) + bytes([2 * len(values)])
+               + struct.pack(f">{len(values)}H", *values))
+        return self._call(device_id, pdu)
@@ -0,0 +1,189 @@
+# ==================== ASYNC MULTI-DEVICE POLLER ====================
+#
+# Polls many Modbus TCP devices from a single process. Every device gets its
+# own task and client, a semaphore bounds how many requests are in flight at
+# once, and every scan result is handed to a common sink as a Sample.
+# Each device can carry several scan classes (e.g. 100 ms alarms, 1 s process
+# values, 60 s counters) that run on their own fixed-rate schedules.
+# A device that stops answering trips its circuit breaker and is only
+# probed again after a jittered, growing backoff, so it neither floods the
+# network with connects nor holds request slots the healthy devices need.
+
+import asyncio
+import inspect
+from collections import namedtuple
+
+from pymodbus.client import AsyncModbusTcpClient
+
+from modbus_logger.capture import capture_kwargs
+from modbus_logger.health import Backoff, CircuitBreaker
+from modbus_logger.read_plan import block_request, block_values, compile_read_plan, skipped_block
+from modbus_logger.scheduler import ScanClass, ScanSchedule, spread_phase
+
+# ``tags`` and ``interval`` describe a single scan class; pass ``scan_classes``
+# instead to poll groups of tags at different rates. ``capabilities`` maps unit
+# IDs to probed ``capabilities.DeviceCapabilities`` that size the block reads.
+Device = namedtuple("Device", ["name", "host", "port", "tags", "interval", "timeout", "max_gap",
+                               "scan_classes", "capabilities"],
+                    defaults=(502, (), 5.0, 3, 8, (), None))
+
+# values is {Tag: value} for a good scan, error is the failure text otherwise.
+# timestamp is the scheduled grid time, missed counts deadlines skipped before it.
+Sample = namedtuple("Sample", ["device", "timestamp", "values", "error", "scan_class", "missed"],
+                    defaults=(None, 0))
+
+
+def device_scan_classes(device):
+    """Returns the scan classes of a device, deriving one from tags/interval if needed."""
+    if device.scan_classes:
+        return list(device.scan_classes)
+    return [ScanClass("main", device.interval, device.tags)]
+
+
+class PollingEngine:
+    """Runs one polling task per device and pushes every Sample to ``sink``.
+
+    ``sink`` is any callable taking a Sample; if it returns an awaitable it is
+    awaited, so an ``asyncio.Queue().put`` gives the consumer backpressure.
+    Requests, reconnects and overruns are recorded in ``metrics`` if given.
+    After ``failure_threshold`` failed scans in a row a device's circuit
+    opens and it is reconnected with backoff between ``backoff_initial``
+    and ``backoff_max`` seconds; its scans are skipped meanwhile.
+    With a ``capture.CaptureWriter`` every device's traffic is recorded
+    under the device name.
+    """
+
+    def __init__(self, devices, sink, max_concurrency=50, metrics=None, failure_threshold=3,
+                 backoff_initial=1.0, backoff_max=60.0, capture=None):
+        self.devices = list(devices)
+        self.sink = sink
+        self.max_concurrency = max_concurrency
+        self.metrics = metrics
+        self.failure_threshold = failure_threshold
+        self.backoff_initial = backoff_initial
+        self.backoff_max = backoff_max
+        self.capture = capture
+        self.running = False
+        self._tasks = []
+        self._semaphore = None
+        # (device name, scan class name) -> ScanSchedule, for missed deadline reporting
+        self.schedules = {}
+        # device name -> CircuitBreaker
+        self.breakers = {}
+        self._connected_once = set()
+
+    async def run(self):
+        """Polls every device until ``stop()`` is called or the task is cancelled."""
+        self.running = True
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        self._tasks = [asyncio.create_task(self._poll_device(device, index), name=f"poll-{device.name}")
+                       for index, device in enumerate(self.devices)]
+        try:
+            await asyncio.gather(*self._tasks)
+        except asyncio.CancelledError:
+            pass
+        finally:
+            self.running = False
+            for task in self._tasks:
+                task.cancel()
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    def stop(self):
+        """Asks every device task to finish."""
+        self.running = False
+        for task in self._tasks:
+            task.cancel()
+
+    async def _poll_device(self, device, index):
+        scan_classes = device_scan_classes(device)
+        plans = [compile_read_plan(scan_class.tags, max_gap=device.max_gap, capabilities=device.capabilities)
+                 for scan_class in scan_classes]
+        # Devices are phase-shifted across the period so they don't all fire at once
+        schedules = [ScanSchedule(scan_class.interval,
+                                  phase=spread_phase(index, len(self.devices), scan_class.interval))
+                     for scan_class in scan_classes]
+        for scan_class, schedule in zip(scan_classes, schedules):
+            self.schedules[(device.name, scan_class.name)] = schedule
+
+        breaker = CircuitBreaker(self.failure_threshold, Backoff(self.backoff_initial, self.backoff_max))
+        self.breakers[device.name] = breaker
+
+        client = AsyncModbusTcpClient(device.host, port=device.port, timeout=device.timeout,
+                                      **capture_kwargs(AsyncModbusTcpClient, self.capture, device.name))
+        try:
+            while self.running:
+                # Run whichever scan class is due next on this device's connection
+                due = min(range(len(schedules)), key=lambda i: schedules[i].delay())
+                timestamp = await schedules[due].wait_async()
+                if self.metrics is not None and schedules[due].last_missed:
+                    self.metrics.count(device.name, "scan_overruns", schedules[due].last_missed)
+                if not breaker.allow():
+                    continue
+
+                # Connect outside the semaphore, a dead device must not hold request slots
+                if not client.connected and not await self._connect(device, client):
+                    breaker.trip()
+                    error = f"Failed to connect (next attempt in {breaker.retry_in():.1f} s)"
+                    await self._emit(Sample(device, timestamp, None, error,
+                                            scan_classes[due], schedules[due].last_missed))
+                    continue
+
+                async with self._semaphore:
+                    values, error = await self._scan(device, client, plans[due])
+                if error is None:
+                    breaker.record_success()
+                elif breaker.record_failure():
+                    client.close()
+                    error = f"{error} (next attempt in {breaker.retry_in():.1f} s)"
+                await self._emit(Sample(device, timestamp, values, error,
+                                        scan_classes[due], schedules[due].last_missed))
+        finally:
+            client.close()
+
+    async def _connect(self, device, client):
+        try:
+            connected = await client.connect()
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            connected = False
+        if not connected:
+            self._count(device, "connect_failures")
+            return False
+        if device.name in self._connected_once:
+            self._count(device, "reconnects")
+        self._connected_once.add(device.name)
+        return True
+
+    async def _scan(self, device, client, plan):
+        try:
+            values = {}
+            for block in plan:
+                if skipped_block(block):
+                    values.update(dict.fromkeys(block.tags))
+                    continue
+                if self.metrics is not None:
+                    response = await self.metrics.timed_request_async(
+                        device.name, block, lambda: block_request(client, block))
+                else:
+                    response = await block_request(client, block)
+                if response.isError():
+                    return None, f"Modbus Error: {response}"
+                values.update(block_values(block, response))
+            return values, None
+
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            # Drop the socket so the next scan starts with a fresh connection
+            client.close()
+            return None, str(e) or type(e).__name__
+
+    def _count(self, device, counter):
+        if self.metrics is not None:
+            self.metrics.count(device.name, counter)
+
+    async def _emit(self, sample):
+        result = self.sink(sample)
+        if inspect.isawaitable(result):
+            await result
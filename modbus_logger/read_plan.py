@@ -0,0 +1,232 @@
+# ==================== READ PLAN COMPILER ====================
+#
+# Turns a list of tags (address, function code, unit ID) into the fewest
+# block reads that respect the Modbus PDU limits. Every request saved is a
+# full round trip on the wire, which on a 9600 baud RTU line is tens of ms.
+
+import inspect
+import time
+from collections import namedtuple
+
+# Modbus read function codes
+FC_READ_COILS = 1
+FC_READ_DISCRETE_INPUTS = 2
+FC_READ_HOLDING_REGISTERS = 3
+FC_READ_INPUT_REGISTERS = 4
+
+# Maximum quantity per request allowed by the Modbus specification
+MAX_READ_COUNT = {
+    FC_READ_COILS: 2000,
+    FC_READ_DISCRETE_INPUTS: 2000,
+    FC_READ_HOLDING_REGISTERS: 125,
+    FC_READ_INPUT_REGISTERS: 125,
+}
+
+# Client method used for each function code (same name on sync and async clients)
+READ_METHODS = {
+    FC_READ_COILS: "read_coils",
+    FC_READ_DISCRETE_INPUTS: "read_discrete_inputs",
+    FC_READ_HOLDING_REGISTERS: "read_holding_registers",
+    FC_READ_INPUT_REGISTERS: "read_input_registers",
+}
+
+Tag = namedtuple("Tag", ["address", "function_code", "unit_id"])
+ReadBlock = namedtuple("ReadBlock", ["unit_id", "function_code", "address", "count", "tags"])
+
+
+def make_tag(tag):
+    """Normalizes an (address, function_code, unit_id) tuple into a Tag.
+
+    Typed tags (``tag_map.TagDef``) are kept as they are.
+    """
+    if hasattr(tag, "data_type"):
+        return tag
+    address, function_code, unit_id = tag
+    if function_code not in MAX_READ_COUNT:
+        raise ValueError(f"Unsupported read function code: {function_code}")
+    return Tag(int(address), int(function_code), int(unit_id))
+
+
+def compile_read_plan(tags, max_gap=0, max_count=None, capabilities=None):
+    """Merges tags into the fewest block reads.
+
+    ``max_gap`` is the number of unused addresses that may be read to join two
+    neighbouring tags into one request. ``max_count`` optionally lowers the
+    protocol limit, either as a single number or as a {function_code: count} dict.
+    ``capabilities`` maps unit IDs to probed ``capabilities.DeviceCapabilities``:
+    blocks then stay within the largest read each unit accepts and never
+    span addresses it can't read. A tag the unit can't read at all gets a
+    placeholder block of its own (see ``skipped_block()``) that is never
+    sent, so the plan keeps its tag order and the tag reads as None.
+    Tags spanning several registers (``width``) are never split across blocks.
+    """
+    unique_tags = sorted({make_tag(tag) for tag in tags},
+                         key=lambda t: (t.unit_id, t.function_code, t.address))
+
+    plan = []
+    start = end = None
+    group = []
+    for tag in unique_tags:
+        limit = _block_limit(tag.function_code, max_count)
+        device = capabilities.get(tag.unit_id) if capabilities else None
+        if device is not None:
+            limit = min(limit, device.limit(tag.function_code))
+        last = tag.address + getattr(tag, "width", 1) - 1
+        if device is not None and device.unreadable([tag]):
+            if group:
+                plan.append(_make_block(group, start, end))
+                group = []
+            plan.append(ReadBlock(tag.unit_id, tag.function_code, tag.address, 0, (tag,)))
+            continue
+        if (group
+                and group[0].unit_id == tag.unit_id
+                and group[0].function_code == tag.function_code
+                and tag.address - end - 1 <= max_gap
+                and max(end, last) - start + 1 <= limit
+                and (device is None or device.readable(tag.function_code, start, max(end, last)))):
+            end = max(end, last)
+            group.append(tag)
+            continue
+
+        if group:
+            plan.append(_make_block(group, start, end))
+        start, end = tag.address, last
+        group = [tag]
+
+    if group:
+        plan.append(_make_block(group, start, end))
+    return plan
+
+
+def plan_tags(plan):
+    """Returns the tags of a plan in the order their values are read."""
+    return [tag for block in plan for tag in block.tags]
+
+
+def skipped_block(block):
+    """True for the placeholder block of a tag the device can't read; no request is sent for it."""
+    return block.count == 0
+
+
+def _block_limit(function_code, max_count):
+    limit = MAX_READ_COUNT[function_code]
+    if isinstance(max_count, dict):
+        max_count = max_count.get(function_code)
+    if max_count:
+        limit = min(limit, int(max_count))
+    return limit
+
+
+def _make_block(group, start, end):
+    first = group[0]
+    return ReadBlock(first.unit_id, first.function_code, start, end - start + 1, tuple(group))
+
+
+# ==================== EXECUTING A PLAN ====================
+
+_unit_keywords = {}
+
+
+def unit_kwargs(method, unit_id):
+    """Returns the unit ID keyword for a client method.
+
+    pymodbus renamed the argument across 3.x releases (``slave`` to
+    ``device_id``), so it is looked up once per method from its signature.
+    """
+    func = getattr(method, "__func__", method)
+    if func not in _unit_keywords:
+        try:
+            params = inspect.signature(method).parameters
+        except (TypeError, ValueError):
+            params = {}
+        _unit_keywords[func] = next(
+            (name for name in ("device_id", "slave", "unit") if name in params), None)
+    keyword = _unit_keywords[func]
+    return {keyword: unit_id} if keyword else {}
+
+
+def block_request(client, block):
+    """Issues the client call for one block (a coroutine on async clients)."""
+    method = getattr(client, READ_METHODS[block.function_code])
+    return method(block.address, count=block.count, **unit_kwargs(method, block.unit_id))
+
+
+# id(block) -> (block, decoder); plans are fixed, so each block is compiled once.
+# Keyed by identity because hashing a block hashes every one of its tags.
+_block_decoders = {}
+
+
+def block_values(block, response):
+    """Maps a block response back to {tag: value}, decoding typed tags."""
+    entry = _block_decoders.get(id(block))
+    if entry is None or entry[0] is not block:
+        from modbus_logger.tag_map import compile_block_decoder  # tag_map builds on this module
+        if len(_block_decoders) >= 4096:
+            _block_decoders.clear()
+        entry = _block_decoders[id(block)] = (block, compile_block_decoder(block))
+    return entry[1](response)
+
+
+def execute_read_plan(client, plan, metrics=None, device=None, framer="tcp"):
+    """Runs every block of a plan on a synchronous client.
+
+    Returns {tag: value}, or raises ``ModbusReadError`` on the first failed block.
+    Tags of skipped blocks (unreadable on the device) map to None.
+    Requests are recorded under ``device`` when a MetricsRegistry is given.
+    On a pipelined client (``pipeline.PipelinedTcpClient``) every block is
+    sent before the first answer is awaited.
+    """
+    if getattr(client, "pipelined", False):
+        return _execute_pipelined(client, plan, metrics, device, framer)
+    values = {}
+    for block in plan:
+        if skipped_block(block):
+            values.update(dict.fromkeys(block.tags))
+            continue
+        if metrics is not None:
+            response = metrics.timed_request(device, block, lambda: block_request(client, block), framer)
+        else:
+            response = block_request(client, block)
+        if response.isError():
+            raise ModbusReadError(block, response)
+        values.update(block_values(block, response))
+    return values
+
+
+def _execute_pipelined(client, plan, metrics, device, framer):
+    # The client's window caps how many of these are on the wire at once
+    started = time.perf_counter()
+    values = {}
+    for block in plan:
+        if skipped_block(block):
+            values.update(dict.fromkeys(block.tags))
+    plan = [block for block in plan if not skipped_block(block)]
+    transactions = [client.submit_block(block) for block in plan]
+    failure = None
+    for block, transaction in zip(plan, transactions):
+        try:
+            response = transaction.result()
+        except Exception as e:
+            if metrics is not None:
+                metrics.observe_request(device, block, time.perf_counter() - started, error=e, framer=framer)
+            failure = failure or e
+            continue
+        if metrics is not None:
+            metrics.observe_request(device, block, response.latency, response, framer=framer)
+        if response.isError():
+            failure = failure or ModbusReadError(block, response)
+            continue
+        values.update(block_values(block, response))
+    if failure is not None:
+        raise failure
+    return values
+
+
+class ModbusReadError(Exception):
+    """Raised when a device answers a block read with a Modbus exception."""
+
+    def __init__(self, block, response):
+        super().__init__(f"{response} (unit {block.unit_id}, FC{block.function_code}, "
+                         f"address {block.address}, count {block.count})")
+        self.block = block
+        self.response = response
@@ -0,0 +1,231 @@
+# ==================== MEMORY-MAPPED RING STORE ====================
+#
+# Fixed-size history of recent samples in a memory-mapped file: one
+# timestamp column plus one typed column per tag, written as a circular
+# buffer. Appends are O(1) and time-range queries binary-search the
+# timestamp column and return memoryviews straight into the mapping, so the
+# logger can write while the GUI and the backend read the same file.
+#
+# File layout (little endian, every section 8-byte aligned):
+#   header   magic, version, capacity, column count, rows written
+#   columns  name (32 bytes) + struct typecode (8 bytes) per column
+#   data     timestamps (float64) then each column, ``capacity`` slots each
+
+import bisect
+import mmap
+import os
+import struct
+
+MAGIC = b"MBRING01"
+VERSION = 1
+HEADER = struct.Struct("<8sIIIIQ")  # magic, version, capacity, columns, reserved, rows written
+COLUMN = struct.Struct("<32s8s")
+COUNT_OFFSET = 24
+
+# Typecodes a column may use (same letters as struct/array/memoryview)
+TYPECODES = {"b", "B", "h", "H", "i", "I", "q", "Q", "f", "d"}
+
+
+def _align(size):
+    return (size + 7) & ~7
+
+
+class RingStore:
+    """Circular, memory-mapped column store of timestamped samples.
+
+    Use ``RingStore.create()`` (or ``open_or_create()``) in the writing process
+    and ``RingStore.open()`` in readers. Views returned by ``range()`` point at
+    live memory: copy them (``list(view)``) if they must outlive the next few
+    appends. A store is never rewritten in place: ``create()`` replaces the
+    file, and long-lived readers should reopen it once ``replaced()`` is True.
+    """
+
+    def __init__(self, path, mapping, file, readonly):
+        self.path = path
+        self.readonly = readonly
+        self._file = file
+        self._mmap = mapping
+        stat = os.fstat(file.fileno())
+        self._identity = (stat.st_dev, stat.st_ino)
+
+        magic, version, capacity, column_count, _, _ = HEADER.unpack_from(mapping, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{path} is not a ring store file")
+        self.capacity = capacity
+
+        self.columns = []
+        self.typecodes = {}
+        offset = HEADER.size
+        for _ in range(column_count):
+            name, typecode = COLUMN.unpack_from(mapping, offset)
+            name = name.rstrip(b"\0").decode()
+            self.columns.append(name)
+            self.typecodes[name] = typecode.rstrip(b"\0").decode()
+            offset += COLUMN.size
+
+        view = self._view = memoryview(mapping)
+        offset = _align(offset)
+        self._count = view[COUNT_OFFSET:COUNT_OFFSET + 8].cast("Q")
+        self._timestamps = view[offset:offset + capacity * 8].cast("d")
+        offset += capacity * 8
+        self._values = {}
+        for name in self.columns:
+            size = struct.calcsize(self.typecodes[name]) * capacity
+            self._values[name] = view[offset:offset + size].cast(self.typecodes[name])
+            offset = _align(offset + size)
+
+    # ---------- opening ----------
+
+    @classmethod
+    def create(cls, path, columns, capacity):
+        """Creates (or overwrites) a store with ``columns`` as [(name, typecode)]."""
+        columns = list(columns)
+        for name, typecode in columns:
+            if typecode not in TYPECODES:
+                raise ValueError(f"Unsupported typecode {typecode!r} for column {name}")
+            if len(name.encode()) > COLUMN.size - 8:
+                raise ValueError(f"Column name too long: {name}")
+
+        size = _align(HEADER.size + COLUMN.size * len(columns)) + capacity * 8
+        for _, typecode in columns:
+            size = _align(size + struct.calcsize(typecode) * capacity)
+
+        # Built under a temporary name and swapped in, so processes that have the
+        # old file mapped keep a valid mapping instead of one truncated under them
+        temp_path = f"{path}.tmp"
+        with open(temp_path, "wb") as file:
+            file.write(HEADER.pack(MAGIC, VERSION, capacity, len(columns), 0, 0))
+            for name, typecode in columns:
+                file.write(COLUMN.pack(name.encode(), typecode.encode()))
+            file.truncate(size)
+        os.replace(temp_path, path)
+        return cls.open(path, readonly=False)
+
+    @classmethod
+    def open(cls, path, readonly=True):
+        """Maps an existing store, read-only unless ``readonly`` is False."""
+        file = open(path, "rb" if readonly else "r+b")
+        try:
+            access = mmap.ACCESS_READ if readonly else mmap.ACCESS_WRITE
+            mapping = mmap.mmap(file.fileno(), 0, access=access)
+        except Exception:
+            file.close()
+            raise
+        return cls(path, mapping, file, readonly)
+
+    @classmethod
+    def open_or_create(cls, path, columns, capacity):
+        """Reopens a store for writing if its layout matches, else creates a new one."""
+        columns = list(columns)
+        if os.path.exists(path):
+            try:
+                store = cls.open(path, readonly=False)
+            except ValueError:
+                pass
+            else:
+                if (store.capacity == capacity
+                        and [(name, store.typecodes[name]) for name in store.columns] == columns):
+                    return store
+                store.close()
+        return cls.create(path, columns, capacity)
+
+    def replaced(self):
+        """True if the file at ``path`` is no longer the one mapped (recreated or removed)."""
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return True
+        return (stat.st_dev, stat.st_ino) != self._identity
+
+    def close(self):
+        """Unmaps the file; views returned by ``range()`` must be dropped first."""
+        for view in [self._count, self._timestamps, self._view] + list(self._values.values()):
+            view.release()
+        self._values = {}
+        self._mmap.close()
+        self._file.close()
+
+    # ---------- writing ----------
+
+    @property
+    def count(self):
+        """Total number of rows ever appended."""
+        return self._count[0]
+
+    def __len__(self):
+        return min(self.count, self.capacity)
+
+    def append(self, timestamp, values):
+        """Appends one row; ``values`` is a sequence in column order or a {name: value} dict.
+
+        Timestamps must not go backwards, since range queries binary-search them.
+        Missing values (None) are stored as NaN in float columns and 0 otherwise.
+        """
+        if self.readonly:
+            raise PermissionError(f"{self.path} is open read-only")
+        if isinstance(values, dict):
+            values = [values[name] for name in self.columns]
+
+        count = self.count
+        slot = count % self.capacity
+        for name, value in zip(self.columns, values):
+            if value is None:
+                value = float("nan") if self.typecodes[name] in "fd" else 0
+            self._values[name][slot] = value
+        self._timestamps[slot] = timestamp
+        # Publishing the new count last means readers never see a half-written row
+        self._count[0] = count + 1
+
+    # ---------- reading ----------
+
+    def latest(self):
+        """Returns (timestamp, {name: value}) of the newest row, or None if empty."""
+        count = self.count
+        if not count:
+            return None
+        slot = (count - 1) % self.capacity
+        return self._timestamps[slot], {name: self._values[name][slot] for name in self.columns}
+
+    def range(self, start, end, column):
+        """Returns the rows with ``start <= timestamp <= end`` for one column.
+
+        The result is a list of (timestamps, values) memoryview pairs: one pair
+        normally, two when the range wraps around the end of the buffer.
+        """
+        values = self._values[column]
+        count = self.count
+        first = max(0, count - self.capacity)
+        timeline = _Timeline(self._timestamps, first, count, self.capacity)
+        lo = bisect.bisect_left(timeline, start)
+        hi = bisect.bisect_right(timeline, end)
+
+        # Rows the writer overwrote while we searched are no longer valid
+        lo = max(lo, self.count - self.capacity - first)
+        if lo >= hi:
+            return []
+
+        segments = []
+        position = first + lo
+        stop = first + hi
+        while position < stop:
+            slot = position % self.capacity
+            length = min(stop - position, self.capacity - slot)
+            segments.append((self._timestamps[slot:slot + length], values[slot:slot + length]))
+            position += length
+        return segments
+
+
+class _Timeline:
+    """Sequence view of the ring's timestamps in logical (oldest first) order."""
+
+    def __init__(self, timestamps, first, count, capacity):
+        self.timestamps = timestamps
+        self.first = first
+        self.length = count - first
+        self.capacity = capacity
+
+    def __len__(self):
+        return self.length
+
+    def __getitem__(self, index):
+        return self.timestamps[(self.first + index) % self.capacity]
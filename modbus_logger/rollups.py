@@ -0,0 +1,195 @@
+# ==================== HISTORIAN ROLLUPS ====================
+#
+# Trend charts need a few points per pixel, not every raw sample. As
+# samples arrive they are folded into 1 s, 1 min and 1 h buckets (count,
+# then count/min/max/avg/last per tag) and every closed bucket is appended
+# to a ring store of its own next to the raw one (plc_data.1s.ring, ...).
+# Missing values (failed reads) are left out of a tag's statistics, so one
+# bad sample doesn't blank its whole bucket.
+#
+# A query picks the coarsest resolution that still gives at least one row
+# per output bucket and merges rows into buckets that are a whole multiple
+# of it. The newest part that the coarse store hasn't closed yet is filled
+# in from the next finer store, and finally from the raw samples.
+
+import math
+import os
+
+from modbus_logger.ring_store import RingStore
+
+# resolution in seconds -> rows kept (1 day of seconds, 30 days of minutes, 10 years of hours)
+DEFAULT_CAPACITY = {
+    1: 86400,
+    60: 43200,
+    3600: 87600,
+}
+
+STATS = ("min", "max", "avg", "last")
+
+
+def resolution_label(resolution):
+    """"1s", "1m", "1h" style name of a resolution in seconds."""
+    for unit, seconds in (("h", 3600), ("m", 60)):
+        if resolution % seconds == 0:
+            return f"{resolution // seconds}{unit}"
+    return f"{resolution}s"
+
+
+def rollup_path(store_path, resolution):
+    """Ring store file of one resolution next to the raw store, e.g. plc_data.1m.ring."""
+    base, ext = os.path.splitext(store_path)
+    return f"{base}.{resolution_label(resolution)}{ext or '.ring'}"
+
+
+def rollup_columns(tags):
+    """Ring store columns of a rollup: the sample count, then count/min/max/avg/last per tag."""
+    columns = [("count", "I")]
+    for tag in tags:
+        columns.append((f"{tag}.count", "I"))
+        columns.extend((f"{tag}.{stat}", "d") for stat in STATS)
+    return columns
+
+
+class _Bucket:
+    __slots__ = ("start", "count", "counts", "mins", "maxs", "sums", "lasts")
+
+    def __init__(self, start, values):
+        self.start = start
+        self.count = 0
+        self.counts = [0] * len(values)
+        self.mins = [math.nan] * len(values)
+        self.maxs = [math.nan] * len(values)
+        self.sums = [0.0] * len(values)
+        self.lasts = [math.nan] * len(values)
+        self.add(values)
+
+    def add(self, values):
+        self.count += 1
+        counts, mins, maxs, sums, lasts = self.counts, self.mins, self.maxs, self.sums, self.lasts
+        for i, value in enumerate(values):
+            if value != value:
+                continue  # NaN: no reading for this tag
+            if not counts[i]:
+                mins[i] = maxs[i] = value
+            elif value < mins[i]:
+                mins[i] = value
+            elif value > maxs[i]:
+                maxs[i] = value
+            counts[i] += 1
+            sums[i] += value
+            lasts[i] = value
+
+    def row(self):
+        row = [self.count]
+        for count, low, high, total, last in zip(self.counts, self.mins, self.maxs, self.sums, self.lasts):
+            row.extend((count, low, high, total / count if count else math.nan, last))
+        return row
+
+
+class RollupWriter:
+    """Folds samples into one rollup ring store per resolution.
+
+    ``stores`` maps resolution (seconds) to a writable RingStore with
+    ``rollup_columns(tags)``. Buckets are appended once a sample of the
+    next bucket arrives, and the open ones on ``close()``.
+    """
+
+    def __init__(self, stores, tags):
+        self.stores = dict(stores)
+        self.tags = list(tags)
+        self._buckets = {resolution: None for resolution in self.stores}
+
+    @classmethod
+    def open_or_create(cls, store_path, tags, capacities=None):
+        """Opens (or creates) the rollup stores that belong to the raw store ``store_path``."""
+        tags = list(tags)
+        columns = rollup_columns(tags)
+        stores = {resolution: RingStore.open_or_create(rollup_path(store_path, resolution), columns, capacity)
+                  for resolution, capacity in (capacities or DEFAULT_CAPACITY).items()}
+        return cls(stores, tags)
+
+    def add(self, timestamp, values):
+        """Adds one sample (values in tag order); missing values count as NaN."""
+        values = [math.nan if value is None else float(value) for value in values]
+        for resolution, bucket in self._buckets.items():
+            start = timestamp - timestamp % resolution
+            if bucket is not None and bucket.start == start:
+                bucket.add(values)
+                continue
+            if bucket is not None:
+                self.stores[resolution].append(bucket.start, bucket.row())
+            self._buckets[resolution] = _Bucket(start, values)
+
+    def close(self):
+        for resolution, bucket in self._buckets.items():
+            if bucket is not None:
+                self.stores[resolution].append(bucket.start, bucket.row())
+            self.stores[resolution].close()
+        self._buckets = {}
+
+
+# ==================== QUERIES ====================
+
+def _store_rows(store, columns, start, end):
+    """Timestamps and one value list per column of the rows in [start, end]."""
+    for _ in range(3):
+        parts = [store.range(start, end, column) for column in columns]
+        # Rows the writer overwrote between two columns would shift them apart
+        if len({part[0][0][0] if part else None for part in parts}) == 1:
+            break
+    timestamps = [t for timestamp_view, _ in parts[0] for t in timestamp_view.tolist()]
+    values = [[v for _, value_view in part for v in value_view.tolist()] for part in parts]
+    length = min([len(timestamps)] + [len(column_values) for column_values in values])
+    return timestamps[:length], [column_values[:length] for column_values in values]
+
+
+def _source_rows(resolution, store, tag, start, end):
+    """(timestamp, count, min, max, avg, last) rows of a raw (resolution 0) or rollup store.
+
+    ``count`` is the number of good values of ``tag``; 0 when it has none.
+    """
+    if resolution == 0:
+        timestamps, (values,) = _store_rows(store, [tag], start, end)
+        return [(t, 0 if v != v else 1, v, v, v, v) for t, v in zip(timestamps, values)]
+    # Files written before per-tag counts only have the bucket's sample count
+    count_column = f"{tag}.count" if f"{tag}.count" in store.typecodes else "count"
+    timestamps, columns = _store_rows(store, [count_column] + [f"{tag}.{stat}" for stat in STATS], start, end)
+    return list(zip(timestamps, *columns))
+
+
+def query_history(sources, tag, start, end, width):
+    """Returns (bucket seconds, rows) with about ``width`` buckets of ``tag`` in [start, end].
+
+    ``sources`` maps resolution (seconds, 0 for raw samples) to a RingStore.
+    Rows are (timestamp, count, min, max, avg, last) per bucket, oldest first.
+    """
+    target = max(end - start, 0) / max(int(width), 1)
+    resolutions = sorted(sources)
+    usable = [resolution for resolution in resolutions if resolution <= target] or resolutions[:1]
+    resolution = usable[-1]
+    size = max(1, int(target // resolution)) * resolution if resolution else target
+
+    buckets = {}
+    since = start
+    # Coarsest first; each finer source only covers what the coarser ones haven't closed yet
+    for source in reversed(usable):
+        rows = _source_rows(source, sources[source], tag, since, end)
+        for timestamp, count, low, high, mean, last in rows:
+            if not count or math.isnan(mean):
+                continue
+            key = timestamp - timestamp % size if size else timestamp
+            bucket = buckets.get(key)
+            if bucket is None:
+                buckets[key] = [count, low, high, mean * count, last]
+            else:
+                bucket[0] += count
+                bucket[1] = min(bucket[1], low)
+                bucket[2] = max(bucket[2], high)
+                bucket[3] += mean * count
+                bucket[4] = last
+        if rows:
+            since = max(since, rows[-1][0] + (source or 1e-9))
+
+    rows = [(key, count, low, high, total / count, last)
+            for key, (count, low, high, total, last) in sorted(buckets.items())]
+    return size, rows
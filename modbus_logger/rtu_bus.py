@@ -0,0 +1,191 @@
+# ==================== RTU BUS MASTER ====================
+#
+# One RS-485 port, many slaves. A single worker thread owns the serial
+# client and runs requests from per-slave priority queues, taking slaves in
+# round-robin order so one busy meter cannot starve the others. The
+# 3.5-character inter-frame silence is enforced from the line settings, and
+# a slave that stops answering is suspended for a growing back-off period
+# so its timeouts do not eat the bus time of the healthy ones.
+
+import heapq
+import itertools
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+
+from modbus_logger.read_plan import block_request, block_values, skipped_block
+from modbus_logger.write_plan import WriteBlock, write_request
+
+PRIORITY_HIGH = 0
+PRIORITY_NORMAL = 1
+PRIORITY_LOW = 2
+
+
+def frame_silence(baudrate, bytesize=8, parity="N", stopbits=1):
+    """Returns the Modbus RTU t3.5 inter-frame silence in seconds.
+
+    A character is a start bit, the data bits, an optional parity bit and
+    the stop bits. Above 19200 baud the spec fixes t3.5 at 1.75 ms.
+    """
+    if baudrate > 19200:
+        return 0.00175
+    bits = 1 + bytesize + (0 if parity == "N" else 1) + stopbits
+    return 3.5 * bits / baudrate
+
+
+class SlaveSuspendedError(Exception):
+    """Raised for requests to a slave that is skipped after timing out."""
+
+
+class RtuBusMaster:
+    """Schedules requests for many unit IDs over one serial client.
+
+    ``submit()`` returns a Future; requests to the same slave run in
+    priority order, and slaves take turns. The worker thread is the only
+    user of ``client``; assign a new one to ``client`` after reconnecting.
+    With a MetricsRegistry, every slave is recorded as "<device>/unit<id>".
+    """
+
+    def __init__(self, client, baudrate, bytesize=8, parity="N", stopbits=1,
+                 skip_time=10.0, max_skip_time=300.0, metrics=None, device="rtu"):
+        self.client = client
+        self.metrics = metrics
+        self.device = device
+        self.frame_gap = frame_silence(baudrate, bytesize, parity, stopbits)
+        self.skip_time = skip_time
+        self.max_skip_time = max_skip_time
+        # unit_id -> {"requests", "timeouts", "skipped"}
+        self.stats = {}
+
+        self._queues = {}
+        self._turns = deque()
+        self._sequence = itertools.count()
+        self._suspended_until = {}
+        self._backoff = {}
+        self._last_frame_end = 0.0
+        self._condition = threading.Condition()
+        self._running = True
+        self._worker = threading.Thread(target=self._run, name="rtu-bus", daemon=True)
+        self._worker.start()
+
+    def submit(self, block, priority=PRIORITY_NORMAL):
+        """Queues a ReadBlock or WriteBlock and returns a Future with its response."""
+        future = Future()
+        with self._condition:
+            if not self._running:
+                raise RuntimeError("RTU bus master is closed")
+            queue = self._queues.setdefault(block.unit_id, [])
+            if not queue:
+                self._turns.append(block.unit_id)
+            heapq.heappush(queue, (priority, next(self._sequence), block, future))
+            self._condition.notify()
+        return future
+
+    def execute_read_plan(self, plan, priority=PRIORITY_NORMAL, timeout=None):
+        """Runs every block of a plan on the bus.
+
+        Returns ({tag: value}, {unit_id: error}); tags of failed or skipped
+        slaves are left out so the healthy ones are still reported.
+        """
+        futures = [(block, self.submit(block, priority)) for block in plan if not skipped_block(block)]
+        values = {}
+        errors = {}
+        for block, future in futures:
+            try:
+                response = future.result(timeout)
+            except Exception as e:
+                errors.setdefault(block.unit_id, str(e) or type(e).__name__)
+                continue
+            if response.isError():
+                errors.setdefault(block.unit_id, f"Modbus Error: {response}")
+            else:
+                values.update(block_values(block, response))
+        return values, errors
+
+    def suspended(self, unit_id):
+        """True while a slave is being skipped after a timeout."""
+        return self._suspended_until.get(unit_id, 0.0) > time.monotonic()
+
+    def close(self):
+        """Stops the worker; requests still queued fail."""
+        with self._condition:
+            self._running = False
+            self._condition.notify()
+        self._worker.join()
+
+    def _next_request(self):
+        # Highest priority among the slaves' next requests; ties go to the
+        # slave whose turn comes first, which then moves to the back.
+        with self._condition:
+            while self._running and not self._turns:
+                self._condition.wait()
+            if not self._running:
+                return None
+            unit_id = min(self._turns, key=lambda unit: self._queues[unit][0][0])
+            self._turns.remove(unit_id)
+            queue = self._queues[unit_id]
+            _, _, block, future = heapq.heappop(queue)
+            if queue:
+                self._turns.append(unit_id)
+            return block, future
+
+    def _run(self):
+        while True:
+            request = self._next_request()
+            if request is None:
+                break
+            block, future = request
+            if not future.set_running_or_notify_cancel():
+                continue
+            stats = self.stats.setdefault(block.unit_id, {"requests": 0, "timeouts": 0, "skipped": 0})
+
+            if self.suspended(block.unit_id):
+                stats["skipped"] += 1
+                if self.metrics is not None:
+                    self.metrics.count(self.unit_label(block.unit_id), "skipped")
+                future.set_exception(SlaveSuspendedError(f"Unit {block.unit_id} is suspended after a timeout"))
+                continue
+
+            # Inter-frame silence since the end of the previous frame
+            gap = self._last_frame_end + self.frame_gap - time.monotonic()
+            if gap > 0:
+                time.sleep(gap)
+            stats["requests"] += 1
+            try:
+                request = write_request if isinstance(block, WriteBlock) else block_request
+                if self.metrics is not None:
+                    response = self.metrics.timed_request(
+                        self.unit_label(block.unit_id), block,
+                        lambda: request(self.client, block), framer="rtu")
+                else:
+                    response = request(self.client, block)
+            except Exception as e:
+                self._last_frame_end = time.monotonic()
+                stats["timeouts"] += 1
+                self._suspend(block.unit_id)
+                future.set_exception(e)
+                continue
+            self._last_frame_end = time.monotonic()
+            self._backoff.pop(block.unit_id, None)
+            future.set_result(response)
+
+        self._fail_pending()
+
+    def unit_label(self, unit_id):
+        return f"{self.device}/unit{unit_id}"
+
+    def _suspend(self, unit_id):
+        backoff = self._backoff.get(unit_id)
+        backoff = self.skip_time if backoff is None else min(backoff * 2, self.max_skip_time)
+        self._backoff[unit_id] = backoff
+        self._suspended_until[unit_id] = time.monotonic() + backoff
+
+    def _fail_pending(self):
+        with self._condition:
+            for queue in self._queues.values():
+                for _, _, _, future in queue:
+                    if future.set_running_or_notify_cancel():
+                        future.set_exception(RuntimeError("RTU bus master is closed"))
+            self._queues.clear()
+            self._turns.clear()
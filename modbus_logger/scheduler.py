@@ -0,0 +1,82 @@
+# ==================== FIXED-RATE SCAN SCHEDULER ====================
+#
+# Scans are driven by monotonic deadlines instead of sleeping a fixed time
+# after each read, so I/O time and reconnects never stretch the period.
+# Deadlines sit on the wall-clock grid (a 1 s class ticks on whole seconds,
+# plus its phase), and each tick is stamped with its grid time.
+
+import asyncio
+import math
+import time
+from collections import namedtuple
+
+ScanClass = namedtuple("ScanClass", ["name", "interval", "tags"])
+
+
+def spread_phase(index, count, interval):
+    """Offset of scan ``index`` out of ``count`` so scans spread over the period."""
+    if count <= 1:
+        return 0.0
+    return interval * (index % count) / count
+
+
+class ScanSchedule:
+    """Fixed-rate deadlines for one scan class.
+
+    ``wait()`` sleeps until the next deadline and returns its grid timestamp
+    (seconds since the epoch). If a scan overran by whole periods, the skipped
+    deadlines are added to ``missed`` and ``last_missed`` instead of being run
+    back to back.
+    """
+
+    def __init__(self, interval, phase=0.0):
+        if interval <= 0:
+            raise ValueError("Scan interval must be greater than zero")
+        self.interval = float(interval)
+        self.phase = phase % self.interval
+        self.ticks = 0
+        self.missed = 0
+        self.last_missed = 0
+
+        # Map the next wall-clock grid point onto the monotonic clock once.
+        # Deadlines are computed from the period number rather than summed,
+        # so rounding never accumulates into drift.
+        now_wall = time.time()
+        now_mono = time.monotonic()
+        self._period = math.floor((now_wall - self.phase) / self.interval) + 1
+        self._first_period = self._period
+        self._first_deadline = now_mono + (self._grid_time() - now_wall)
+
+    def _grid_time(self):
+        return self._period * self.interval + self.phase
+
+    def _deadline(self):
+        return self._first_deadline + (self._period - self._first_period) * self.interval
+
+    def delay(self):
+        """Seconds left until the next deadline (0 if it has passed)."""
+        return max(0.0, self._deadline() - time.monotonic())
+
+    def wait(self):
+        """Blocks until the next deadline and returns its grid timestamp."""
+        time.sleep(self.delay())
+        return self._advance()
+
+    async def wait_async(self):
+        """Coroutine version of ``wait()`` for the asyncio engine."""
+        await asyncio.sleep(self.delay())
+        return self._advance()
+
+    def _advance(self):
+        # Whole periods that already went by are missed; the most recent
+        # overdue deadline is the one that runs now.
+        late = time.monotonic() - self._deadline()
+        skipped = int(late // self.interval) if late > 0 else 0
+        self._period += skipped
+        self.last_missed = skipped
+        self.missed += skipped
+
+        tick = self._grid_time()
+        self.ticks += 1
+        self._period += 1
+        return tick
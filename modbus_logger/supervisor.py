@@ -0,0 +1,235 @@
+# ==================== MULTI-PROCESS SUPERVISOR ====================
+#
+# One asyncio engine still runs framing, decoding and sample handling on a
+# single core. The supervisor splits the device list into shards balanced
+# by tags per second and runs a PollingEngine for each shard in its own
+# worker process. Workers own their connections and send their samples
+# back in batches over a pipe: each batch is pickled once and carries only
+# indexes and value tuples, and the supervisor rebuilds the Samples from
+# its own copy of the configuration. Workers also report device health and
+# metrics. A worker that dies is restarted with backoff; one that keeps
+# dying is given up and its devices are rebalanced onto the others.
+
+import asyncio
+import inspect
+import multiprocessing
+import threading
+import time
+from collections import deque
+
+from modbus_logger.metrics import MetricsRegistry
+from modbus_logger.poller import PollingEngine, Sample, device_scan_classes
+from modbus_logger.read_plan import compile_read_plan, plan_tags
+
+SEND_INTERVAL = 0.05   # Seconds a worker collects samples before sending a batch
+HEALTH_INTERVAL = 1.0  # Seconds between health and metrics reports
+
+
+def device_load(device):
+    """Estimated tags per second a device contributes."""
+    return sum(max(len(scan_class.tags), 1) / scan_class.interval for scan_class in device_scan_classes(device))
+
+
+def shard_devices(devices, shards):
+    """Splits device indexes into ``shards`` lists with about equal load (largest first)."""
+    shards = max(1, min(shards, len(devices)))
+    loads = [0.0] * shards
+    assignment = [[] for _ in range(shards)]
+    for index in sorted(range(len(devices)), key=lambda i: device_load(devices[i]), reverse=True):
+        target = loads.index(min(loads))
+        assignment[target].append(index)
+        loads[target] += device_load(devices[index])
+    return [sorted(indexes) for indexes in assignment]
+
+
+def _worker_main(device_ids, devices, connection, engine_options):
+    """Entry point of a worker process: polls its shard and reports to the supervisor."""
+    try:
+        asyncio.run(_worker_loop(device_ids, devices, connection, engine_options))
+    except (KeyboardInterrupt, BrokenPipeError, EOFError):
+        pass
+
+
+async def _worker_loop(device_ids, devices, connection, engine_options):
+    # device name -> (global device index, {scan class name: index})
+    indexes = {device.name: (device_id, {scan_class.name: i for i, scan_class in enumerate(device_scan_classes(device))})
+               for device_id, device in zip(device_ids, devices)}
+    batch = []
+
+    def sink(sample):
+        device_id, classes = indexes[sample.device.name]
+        values = None if sample.values is None else tuple(sample.values.values())
+        batch.append((device_id, classes[sample.scan_class.name], sample.timestamp, values,
+                      sample.error, sample.missed))
+
+    metrics = MetricsRegistry()
+    engine = PollingEngine(devices, sink, metrics=metrics, **engine_options)
+    engine_task = asyncio.create_task(engine.run())
+    loop = asyncio.get_running_loop()
+    next_health = 0.0
+    try:
+        while not engine_task.done():
+            await asyncio.sleep(SEND_INTERVAL)
+            if batch:
+                samples, batch = batch, []
+                # Sent from a thread so a slow supervisor throttles the worker without freezing its scans
+                await loop.run_in_executor(None, connection.send, ("samples", samples))
+            if time.monotonic() >= next_health:
+                next_health = time.monotonic() + HEALTH_INTERVAL
+                health = {name: breaker.state for name, breaker in engine.breakers.items()}
+                await loop.run_in_executor(None, connection.send, ("health", health, metrics.export()))
+    finally:
+        engine.stop()
+        await asyncio.gather(engine_task, return_exceptions=True)
+
+
+class Supervisor:
+    """Runs PollingEngines for shards of ``devices`` in ``workers`` processes.
+
+    Drop-in for PollingEngine: ``run()``, ``stop()`` and the same ``sink``.
+    ``health`` maps device names to their circuit state and ``metrics``
+    collects the workers' metrics. ``log`` receives worker events.
+    """
+
+    def __init__(self, devices, sink, workers=None, metrics=None, max_restarts=5, restart_window=300.0,
+                 log=None, **engine_options):
+        self.devices = list(devices)
+        self.sink = sink
+        self.workers = workers or multiprocessing.cpu_count()
+        self.metrics = metrics if metrics is not None else MetricsRegistry()
+        self.max_restarts = max_restarts
+        self.restart_window = restart_window
+        self.log = log or (lambda message: None)
+        self.engine_options = engine_options
+        self.running = False
+        self.health = {}
+        self._slots = {}
+        self._loop = None
+        self._stopped = None
+        # (device index, scan class index) -> (device, scan class, tags in value order)
+        self._layouts = {}
+        for device_id, device in enumerate(self.devices):
+            for class_index, scan_class in enumerate(device_scan_classes(device)):
+                tags = plan_tags(compile_read_plan(scan_class.tags, max_gap=device.max_gap,
+                                                   capabilities=device.capabilities))
+                self._layouts[(device_id, class_index)] = (device, scan_class, tags)
+
+    async def run(self):
+        """Starts the workers and supervises them until ``stop()`` or cancellation."""
+        self.running = True
+        self._loop = asyncio.get_running_loop()
+        self._stopped = asyncio.Event()
+        for slot, device_ids in enumerate(shard_devices(self.devices, self.workers)):
+            self._slots[slot] = {"device_ids": device_ids, "restarts": deque(), "restart_at": None}
+            self._start_worker(slot)
+        try:
+            while self.running:
+                try:
+                    await asyncio.wait_for(self._stopped.wait(), 1.0)
+                except asyncio.TimeoutError:
+                    pass
+                self._check_workers()
+        except asyncio.CancelledError:
+            pass
+        finally:
+            self.running = False
+            for slot in list(self._slots):
+                self._stop_worker(slot)
+
+    def stop(self):
+        self.running = False
+        if self._stopped is not None:
+            self._loop.call_soon_threadsafe(self._stopped.set)
+
+    def _start_worker(self, slot):
+        state = self._slots[slot]
+        parent, child = multiprocessing.Pipe(duplex=False)
+        devices = [self.devices[device_id] for device_id in state["device_ids"]]
+        process = multiprocessing.Process(
+            target=_worker_main, args=(state["device_ids"], devices, child, self.engine_options),
+            name=f"modbus-worker-{slot}", daemon=True)
+        process.start()
+        child.close()
+        reader = threading.Thread(target=self._read_worker, args=(parent,), name=f"modbus-worker-{slot}-reader",
+                                  daemon=True)
+        reader.start()
+        state.update(process=process, connection=parent, reader=reader, restart_at=None)
+        self.log(f"Worker {slot} (pid {process.pid}) polls {len(devices)} device(s)")
+
+    def _stop_worker(self, slot):
+        state = self._slots[slot]
+        process = state.get("process")
+        if process is not None and process.is_alive():
+            process.terminate()
+            process.join(5)
+        if state.get("connection") is not None:
+            state["connection"].close()
+            state["connection"] = None
+
+    def _check_workers(self):
+        now = time.monotonic()
+        for slot in list(self._slots):
+            state = self._slots[slot]
+            if state["restart_at"] is not None:
+                if now >= state["restart_at"]:
+                    self._start_worker(slot)
+                continue
+            process = state["process"]
+            if process.is_alive():
+                continue
+
+            self._stop_worker(slot)
+            restarts = state["restarts"]
+            while restarts and now - restarts[0] > self.restart_window:
+                restarts.popleft()
+            if len(restarts) < self.max_restarts:
+                restarts.append(now)
+                delay = min(2 ** (len(restarts) - 1), 60)
+                state["restart_at"] = now + delay
+                self.log(f"Worker {slot} exited with code {process.exitcode}, restarting in {delay} s")
+            else:
+                self.log(f"Worker {slot} keeps failing, moving its {len(state['device_ids'])} device(s) "
+                         f"to the other workers")
+                del self._slots[slot]
+                self._rebalance()
+
+    def _rebalance(self):
+        if not self._slots:
+            self.running = False
+            raise RuntimeError("All worker processes failed")
+        for slot in self._slots:
+            self._stop_worker(slot)
+        shards = shard_devices(self.devices, len(self._slots))
+        for slot, device_ids in zip(list(self._slots), shards):
+            self._slots[slot]["device_ids"] = device_ids
+            self._start_worker(slot)
+
+    def _read_worker(self, connection):
+        while True:
+            try:
+                message = connection.recv()
+            except (EOFError, OSError):
+                return
+            if message[0] == "samples":
+                samples = [self._sample(*item) for item in message[1]]
+                # Waiting for the sink passes its backpressure on to the worker
+                future = asyncio.run_coroutine_threadsafe(self._emit(samples), self._loop)
+                try:
+                    future.result()
+                except Exception:
+                    return
+            elif message[0] == "health":
+                self.health.update(message[1])
+                self.metrics.load(message[2])
+
+    def _sample(self, device_id, class_index, timestamp, values, error, missed):
+        device, scan_class, tags = self._layouts[(device_id, class_index)]
+        if values is not None:
+            values = dict(zip(tags, values))
+        return Sample(device, timestamp, values, error, scan_class, missed)
+
+    async def _emit(self, samples):
+        for sample in samples:
+            result = self.sink(sample)
+            if inspect.isawaitable(result):
+                await result
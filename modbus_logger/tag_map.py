@@ -0,0 +1,151 @@
+# ==================== TAG MAP (TYPED DECODING) ====================
+#
+# A TagDef describes what a register span means: its data type, byte and
+# word order, and a linear scale/offset to engineering units. TagDefs go
+# anywhere plain tags do (read plans, polled devices, the RTU bus); the
+# planner keeps each multi-register value inside one block and
+# ``block_values`` returns decoded values instead of raw registers.
+#
+# Every block is decoded in one pass: the response registers are packed
+# into bytes once, reordered with a precompiled byte gather and unpacked by
+# a single precompiled struct covering all of the block's tags.
+
+import struct
+from collections import namedtuple
+from operator import itemgetter
+
+from modbus_logger.read_plan import (
+    FC_READ_COILS, FC_READ_DISCRETE_INPUTS, FC_READ_HOLDING_REGISTERS, MAX_READ_COUNT,
+)
+
+# data type -> (struct code, registers)
+DATA_TYPES = {
+    "int16": ("h", 1),
+    "uint16": ("H", 1),
+    "int32": ("i", 2),
+    "uint32": ("I", 2),
+    "float32": ("f", 2),
+    "int64": ("q", 4),
+    "uint64": ("Q", 4),
+    "float64": ("d", 4),
+    "bool": ("?", 1),  # coils and discrete inputs
+}
+
+BYTE_ORDERS = ("big", "little")
+
+# Common vendor names for the four register layouts of a 32-bit value
+LAYOUTS = {
+    "ABCD": ("big", "big"),
+    "CDAB": ("big", "little"),
+    "BADC": ("little", "big"),
+    "DCBA": ("little", "little"),
+}
+
+
+class TagDef(namedtuple("TagDef", ["name", "address", "data_type", "function_code", "unit_id",
+                                   "byte_order", "word_order", "scale", "offset"],
+                        defaults=("uint16", FC_READ_HOLDING_REGISTERS, 1, "big", "big", 1, 0))):
+    """A named, typed tag. ``word_order`` "little" means the low word comes first (CDAB)."""
+
+    __slots__ = ()
+
+    @property
+    def width(self):
+        """Registers (or bits) the value occupies."""
+        return DATA_TYPES[self.data_type][1]
+
+
+def make_tag_def(name, address, data_type="uint16", function_code=FC_READ_HOLDING_REGISTERS, unit_id=1,
+                 layout=None, byte_order="big", word_order="big", scale=1, offset=0):
+    """Builds a validated TagDef; ``layout`` ("ABCD", "CDAB", ...) sets both orders at once."""
+    if layout is not None:
+        byte_order, word_order = LAYOUTS[layout.upper()]
+    if data_type not in DATA_TYPES:
+        raise ValueError(f"Unknown data type for {name}: {data_type}")
+    if function_code not in MAX_READ_COUNT:
+        raise ValueError(f"Unsupported read function code for {name}: {function_code}")
+    bits = function_code in (FC_READ_COILS, FC_READ_DISCRETE_INPUTS)
+    if bits != (data_type == "bool"):
+        raise ValueError(f"{name}: bool is for coils/discrete inputs, numeric types for registers")
+    if byte_order not in BYTE_ORDERS or word_order not in BYTE_ORDERS:
+        raise ValueError(f"{name}: byte and word order must be 'big' or 'little'")
+    return TagDef(name, int(address), data_type, int(function_code), int(unit_id),
+                  byte_order, word_order, scale, offset)
+
+
+def tag_name(tag):
+    """Column name of a tag: its TagDef name, or Register_<address> for plain tags."""
+    return getattr(tag, "name", None) or f"Register_{tag.address}"
+
+
+def tag_typecode(tag):
+    """Ring store typecode that holds a tag's decoded value."""
+    data_type = getattr(tag, "data_type", None)
+    if data_type is None:
+        return "b" if tag.function_code in (FC_READ_COILS, FC_READ_DISCRETE_INPUTS) else "d"
+    if data_type == "bool":
+        return "b"
+    if data_type.startswith("float") or tag.scale != 1 or tag.offset != 0:
+        return "d"
+    # uint64 needs its own unsigned column; every narrower integer fits in int64
+    return "Q" if data_type == "uint64" else "q"
+
+
+def _value_bytes(offset, registers, byte_order, word_order):
+    """Positions in the block's byte stream of one value, most significant byte first."""
+    positions = []
+    for word in range(registers):
+        register = offset + (word if word_order == "big" else registers - 1 - word)
+        high, low = 2 * register, 2 * register + 1
+        positions.extend((high, low) if byte_order == "big" else (low, high))
+    return positions
+
+
+def compile_block_decoder(block):
+    """Returns a function mapping a block response to {tag: value} in one pass."""
+    tags = block.tags
+    if not tags:
+        return lambda response: {}
+    offsets = [tag.address - block.address for tag in tags]
+
+    if block.function_code in (FC_READ_COILS, FC_READ_DISCRETE_INPUTS):
+        gather_bits = itemgetter(*offsets)
+        if len(tags) == 1:
+            return lambda response: {tags[0]: gather_bits(response.bits)}
+        return lambda response: dict(zip(tags, gather_bits(response.bits)))
+
+    # Raw big-endian 16-bit registers need no byte shuffling at all
+    if all(getattr(tag, "data_type", "uint16") == "uint16" and getattr(tag, "byte_order", "big") == "big"
+           and getattr(tag, "scale", 1) == 1 and getattr(tag, "offset", 0) == 0 for tag in tags):
+        gather_registers = itemgetter(*offsets)
+        if len(tags) == 1:
+            return lambda response: {tags[0]: gather_registers(response.registers)}
+        return lambda response: dict(zip(tags, gather_registers(response.registers)))
+
+    codes = []
+    positions = []
+    scaled = []
+    for index, (tag, offset) in enumerate(zip(tags, offsets)):
+        data_type = getattr(tag, "data_type", "uint16")
+        code, registers = DATA_TYPES[data_type]
+        codes.append(code)
+        positions.extend(_value_bytes(offset, registers, getattr(tag, "byte_order", "big"),
+                                      getattr(tag, "word_order", "big")))
+        scale, shift = getattr(tag, "scale", 1), getattr(tag, "offset", 0)
+        if scale != 1 or shift != 0:
+            scaled.append((index, scale, shift))
+
+    pack_registers = struct.Struct(f">{block.count}H").pack
+    gather_bytes = itemgetter(*positions)
+    unpack_values = struct.Struct(">" + "".join(codes)).unpack
+
+    def decode(response):
+        raw = pack_registers(*response.registers[:block.count])
+        values = unpack_values(bytes(gather_bytes(raw)))
+        if scaled:
+            values = list(values)
+            for index, scale, shift in scaled:
+                values[index] = values[index] * scale + shift
+        return dict(zip(tags, values))
+
+    return decode
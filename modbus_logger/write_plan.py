@@ -0,0 +1,158 @@
+# ==================== WRITE COMBINING ====================
+#
+# Setpoint pushes often touch hundreds of registers. Sent one by one that
+# is one round trip per register; here pending writes are collected first,
+# repeated writes to the same address collapse to the last value, and
+# contiguous addresses go out as single write_registers / write_coils
+# requests. Every write still gets its own acknowledgment.
+
+import threading
+from collections import namedtuple
+from concurrent.futures import Future
+
+from modbus_logger.read_plan import unit_kwargs
+
+COIL = "coil"
+REGISTER = "register"
+
+# Maximum quantity per multi-write allowed by the Modbus specification (FC15/FC16)
+MAX_WRITE_COUNT = {
+    COIL: 1968,
+    REGISTER: 123,
+}
+
+# (single write, multi-write) client methods per kind
+WRITE_METHODS = {
+    COIL: ("write_coil", "write_coils"),
+    REGISTER: ("write_register", "write_registers"),
+}
+
+Write = namedtuple("Write", ["address", "value", "kind", "unit_id"], defaults=(REGISTER, 1))
+WriteBlock = namedtuple("WriteBlock", ["unit_id", "kind", "address", "values"])
+# superseded is True for a write that was replaced by a later one to the same address
+WriteResult = namedtuple("WriteResult", ["address", "value", "kind", "unit_id", "success", "error", "superseded"])
+
+
+def make_write(write):
+    """Normalizes an (address, value[, kind[, unit_id]]) tuple into a validated Write."""
+    write = Write(*write)
+    if write.kind not in MAX_WRITE_COUNT:
+        raise ValueError(f"Unsupported write type: {write.kind}")
+    if write.kind == COIL:
+        value = bool(write.value)
+    else:
+        value = int(write.value)
+        if not -32768 <= value <= 65535:
+            raise ValueError(f"Register value out of range at {write.address}: {value}")
+        value &= 0xFFFF  # negative values are sent as two's complement
+    return Write(int(write.address), value, write.kind, int(write.unit_id))
+
+
+def compile_write_plan(writes, max_count=None):
+    """Merges writes into the fewest multi-writes; a later write to an address wins."""
+    latest = {}
+    for write in writes:
+        write = make_write(write)
+        latest[(write.unit_id, write.kind, write.address)] = write.value
+
+    plan = []
+    group = []
+    for (unit_id, kind, address), value in sorted(latest.items()):
+        limit = min(MAX_WRITE_COUNT[kind], max_count or MAX_WRITE_COUNT[kind])
+        if (group
+                and group[0][:2] == (unit_id, kind)
+                and address == group[-1][2] + 1
+                and len(group) < limit):
+            group.append((unit_id, kind, address, value))
+            continue
+        if group:
+            plan.append(_make_block(group))
+        group = [(unit_id, kind, address, value)]
+    if group:
+        plan.append(_make_block(group))
+    return plan
+
+
+def _make_block(group):
+    unit_id, kind, address, _ = group[0]
+    return WriteBlock(unit_id, kind, address, tuple(value for *_, value in group))
+
+
+def write_request(client, block, single_writes=True):
+    """Issues the client call for one write block (a coroutine on async clients).
+
+    A block of one value uses the single write function codes (FC5/FC6),
+    which more devices support, unless ``single_writes`` is False.
+    """
+    single, multiple = WRITE_METHODS[block.kind]
+    if single_writes and len(block.values) == 1:
+        method = getattr(client, single)
+        return method(block.address, block.values[0], **unit_kwargs(method, block.unit_id))
+    method = getattr(client, multiple)
+    return method(block.address, list(block.values), **unit_kwargs(method, block.unit_id))
+
+
+class WriteBatcher:
+    """Collects writes and sends them as combined multi-writes on ``flush()``.
+
+    ``execute(block)`` performs one WriteBlock and returns the response, e.g.
+    ``lambda block: write_request(client, block)``. ``write()`` returns a
+    Future that resolves to the WriteResult of that write. Thread-safe.
+    """
+
+    def __init__(self, execute, max_count=None):
+        self.execute = execute
+        self.max_count = max_count
+        self.requests_sent = 0
+        self._pending = []
+        self._lock = threading.Lock()
+
+    @property
+    def pending(self):
+        with self._lock:
+            return len(self._pending)
+
+    def write(self, address, value, kind=REGISTER, unit_id=1):
+        """Queues one write (validated now) and returns its Future."""
+        write = make_write((address, value, kind, unit_id))
+        future = Future()
+        with self._lock:
+            self._pending.append((write, future))
+        return future
+
+    def write_many(self, values, kind=REGISTER, unit_id=1):
+        """Queues {address: value} writes and returns their Futures in the same order."""
+        return [self.write(address, value, kind, unit_id) for address, value in values.items()]
+
+    def flush(self):
+        """Sends everything queued so far; returns the WriteResults in submission order."""
+        with self._lock:
+            pending, self._pending = self._pending, []
+        if not pending:
+            return []
+
+        # The last write to an address is the one sent, earlier ones are superseded
+        last = {}
+        for index, (write, _) in enumerate(pending):
+            last[(write.unit_id, write.kind, write.address)] = index
+
+        outcome = {}
+        for block in compile_write_plan([write for write, _ in pending], self.max_count):
+            try:
+                self.requests_sent += 1
+                response = self.execute(block)
+                error = str(response) if response.isError() else None
+            except Exception as e:
+                error = str(e) or type(e).__name__
+            for offset in range(len(block.values)):
+                outcome[(block.unit_id, block.kind, block.address + offset)] = error
+
+        results = []
+        for index, (write, future) in enumerate(pending):
+            key = (write.unit_id, write.kind, write.address)
+            error = outcome[key]
+            result = WriteResult(write.address, write.value, write.kind, write.unit_id,
+                                 error is None, error, last[key] != index)
+            future.set_result(result)
+            results.append(result)
+        return results
@@ -1,11 +1,21 @@
-import csv
 import time
 import os
+import logging
+import queue
 import threading
 import tkinter as tk
 from tkinter import ttk, scrolledtext, filedialog, messagebox
+from collections import deque
 from datetime import datetime
 from pymodbus.client import ModbusTcpClient, ModbusSerialClient
+from modbus_logger.csv_writer import BufferedCsvWriter
+from modbus_logger.health import Backoff, CircuitBreaker, Reconnector
+from modbus_logger.live_table import QUALITY_GOOD, LiveTable
+from modbus_logger.ring_store import RingStore
+from modbus_logger.read_plan import (
+    FC_READ_COILS, ModbusReadError, compile_read_plan, execute_read_plan,
+)
+from modbus_logger.scheduler import ScanSchedule
 
 class ModbusLoggerUI:
     def __init__(self, root):
@@ -19,7 +29,29 @@ class ModbusLoggerUI:
         self.log_thread = None
         self.client = None
         self.reconnect_count = 0
-        self.max_reconnect_attempts = 3
+        self.max_reconnect_attempts = 3  # Failed reads in a row before reconnecting in the background
+        self.reconnect_backoff_initial = 2
+        self.reconnect_backoff_max = 60
+        self.read_gap_tolerance = 8
+        self.csv_flush_rows = 100
+        self.csv_flush_interval = 5
+        self.ring_store_capacity = 100000
+        self.history_seconds = 3600  # Recent samples from the ring store shown when logging starts
+        self.live_table_name = "plc_live"  # Shared memory published by pymodbus_nogui.py
+        
+        # Data view: the worker queues samples, the Tk thread draws them in batches
+        self.data_queue = queue.Queue()
+        self.data_rows = deque()  # Tree item IDs, newest last
+        self.max_data_rows = 1000
+        self.ui_refresh_ms = 100
+        
+        # Log console: any thread queues messages, the Tk thread shows the last max_log_lines
+        self.log_queue = queue.Queue()
+        self.max_log_lines = 2000
+        self.log_lines = deque(maxlen=self.max_log_lines)  # (level, line), newest last
+        self.log_refresh_ms = 200
+        self.log_level = tk.StringVar(value="INFO")
+        self.echo_log_to_console = False
         
         # Configuration variables
         self.modbus_type = tk.StringVar(value="rtu")
@@ -31,7 +63,7 @@ class ModbusLoggerUI:
         self.stopbits = tk.IntVar(value=1)
         self.bytesize = tk.IntVar(value=8)
         self.timeout = tk.IntVar(value=1)
-        self.register_address = tk.StringVar(value="0x6304")
+        self.register_address = tk.StringVar(value="6304")
         self.register_count = tk.IntVar(value=1)
         self.unit_id = tk.IntVar(value=1)
         self.csv_file = tk.StringVar(value="plc_data.csv")
@@ -39,6 +71,8 @@ class ModbusLoggerUI:
         
         # Create UI
         self.create_ui()
+        self.root.after(self.ui_refresh_ms, self.drain_data_queue)
+        self.root.after(self.log_refresh_ms, self.flush_log_queue)
         
         # Log area
         self.log("Modbus Data Logger started")
@@ -88,6 +122,7 @@ class ModbusLoggerUI:
         ttk.Label(left_frame, text="Modbus Type:").grid(row=0, column=0, sticky=tk.W, pady=2)
         ttk.Radiobutton(left_frame, text="TCP", variable=self.modbus_type, value="tcp", command=self.update_fields).grid(row=0, column=1, sticky=tk.W, pady=2)
         ttk.Radiobutton(left_frame, text="RTU (Serial)", variable=self.modbus_type, value="rtu", command=self.update_fields).grid(row=0, column=2, sticky=tk.W, pady=2)
+        ttk.Radiobutton(left_frame, text="Logger (shared)", variable=self.modbus_type, value="shared", command=self.update_fields).grid(row=0, column=3, sticky=tk.W, pady=2)
         
         # TCP Settings
         self.tcp_frame = ttk.LabelFrame(left_frame, text="TCP Settings")
@@ -161,8 +196,15 @@ class ModbusLoggerUI:
         self.log_text.pack(fill=tk.BOTH, expand=True)
         self.log_text.config(state=tk.DISABLED)
         
-        # Button to clear log
-        ttk.Button(log_frame, text="Clear Log", command=self.clear_log).pack(pady=5)
+        # Level filter and button to clear log
+        log_controls = ttk.Frame(log_frame)
+        log_controls.pack(pady=5)
+        ttk.Label(log_controls, text="Show:").pack(side=tk.LEFT, padx=5)
+        level_box = ttk.Combobox(log_controls, textvariable=self.log_level, width=9, state="readonly",
+                                 values=["DEBUG", "INFO", "WARNING", "ERROR"])
+        level_box.pack(side=tk.LEFT, padx=5)
+        level_box.bind("<<ComboboxSelected>>", lambda event: self.render_log())
+        ttk.Button(log_controls, text="Clear Log", command=self.clear_log).pack(side=tk.LEFT, padx=5)
 
     def create_data_tab(self, parent):
         # Data display
@@ -189,6 +231,10 @@ class ModbusLoggerUI:
                 child.configure(state=tk.NORMAL)
             for child in self.rtu_frame.winfo_children():
                 child.configure(state=tk.DISABLED)
+        elif self.modbus_type.get() == "shared":
+            # Values come from the logger process, which owns the PLC connection
+            for child in self.tcp_frame.winfo_children() + self.rtu_frame.winfo_children():
+                child.configure(state=tk.DISABLED)
         else:
             for child in self.tcp_frame.winfo_children():
                 child.configure(state=tk.DISABLED)
@@ -203,29 +249,82 @@ class ModbusLoggerUI:
         if filename:
             self.csv_file.set(filename)
 
-    def log(self, message):
+    def log(self, message, level=logging.INFO):
+        """Queues a log line; safe to call from any thread."""
         timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        log_message = f"[{timestamp}] {message}\n"
+        self.log_queue.put((level, f"[{timestamp}] {message}\n"))
+
+    def flush_log_queue(self):
+        """Runs on the Tk thread and appends everything queued since last time in one insert."""
+        lines = []
+        try:
+            while True:
+                lines.append(self.log_queue.get_nowait())
+        except queue.Empty:
+            pass
+        
+        if lines:
+            self.log_lines.extend(lines)
+            min_level = logging.getLevelName(self.log_level.get())
+            text = "".join(line for level, line in lines[-self.max_log_lines:] if level >= min_level)
+            if text:
+                self.log_text.config(state=tk.NORMAL)
+                self.log_text.insert(tk.END, text)
+                self.trim_log()
+                self.log_text.see(tk.END)
+                self.log_text.config(state=tk.DISABLED)
+            
+            # Also print to console for debugging
+            if self.echo_log_to_console:
+                print("".join(line for _, line in lines), end="")
         
+        self.root.after(self.log_refresh_ms, self.flush_log_queue)
+
+    def trim_log(self):
+        # The widget always ends with an empty line after the last newline
+        excess = int(self.log_text.index("end-1c").split(".")[0]) - 1 - self.max_log_lines
+        if excess > 0:
+            self.log_text.delete("1.0", f"{excess + 1}.0")
+
+    def render_log(self):
+        """Redraws the console from the line ring after the level filter changed."""
+        min_level = logging.getLevelName(self.log_level.get())
         self.log_text.config(state=tk.NORMAL)
-        self.log_text.insert(tk.END, log_message)
+        self.log_text.delete(1.0, tk.END)
+        self.log_text.insert(tk.END, "".join(line for level, line in self.log_lines if level >= min_level))
         self.log_text.see(tk.END)
         self.log_text.config(state=tk.DISABLED)
-        
-        # Also print to console for debugging
-        print(log_message.strip())
 
     def clear_log(self):
+        self.log_lines.clear()
         self.log_text.config(state=tk.NORMAL)
         self.log_text.delete(1.0, tk.END)
         self.log_text.config(state=tk.DISABLED)
 
-    def add_data_row(self, timestamp, value):
-        self.tree.insert("", 0, values=(timestamp, value))
+    def add_data_rows(self, rows):
+        """Inserts (timestamp, value) rows, oldest first, and trims to the row limit."""
+        # Rows that would be trimmed straight away are never inserted
+        rows = rows[-self.max_data_rows:]
+        for timestamp, value in rows:
+            self.data_rows.append(self.tree.insert("", 0, values=(timestamp, value)))
         
         # Limit to 1000 rows to prevent memory issues
-        if len(self.tree.get_children()) > 1000:
-            self.tree.delete(self.tree.get_children()[-1])
+        excess = len(self.data_rows) - self.max_data_rows
+        if excess > 0:
+            self.tree.delete(*[self.data_rows.popleft() for _ in range(excess)])
+
+    def drain_data_queue(self):
+        """Runs on the Tk thread at a fixed rate and draws everything queued since last time."""
+        rows = []
+        try:
+            while True:
+                timestamp, values = self.data_queue.get_nowait()
+                rows.extend((timestamp, value) for value in values)
+        except queue.Empty:
+            pass
+        if rows:
+            self.add_data_rows(rows)
+        self.root.after(self.ui_refresh_ms, self.drain_data_queue)
 
     def start_logging(self):
         # Validate settings
@@ -275,8 +374,11 @@ class ModbusLoggerUI:
         self.stop_button.config(state=tk.DISABLED)
 
     def connect_to_plc(self, modbus_type, plc_ip, plc_port, serial_port, baudrate, parity, stopbits, bytesize, timeout):
-        """Connects to the PLC using either Modbus TCP or Modbus RTU."""
+        """Connects to the PLC using either Modbus TCP or Modbus RTU, or attaches to the logger's live table."""
         try:
+            if modbus_type == "shared":
+                self.log(f"Attaching to live values '{self.live_table_name}' published by the logger")
+                return LiveTable.attach(self.live_table_name)
             if modbus_type == "tcp":
                 client = ModbusTcpClient(plc_ip, port=plc_port)
                 self.log(f"Attempting to connect to PLC at {plc_ip}:{plc_port} via Modbus TCP")
@@ -295,110 +397,199 @@ class ModbusLoggerUI:
                 self.log(f"✅ Connected to PLC via Modbus {modbus_type.upper()}")
                 return client
             else:
-                self.log("❌ Failed to connect to PLC")
+                self.log("❌ Failed to connect to PLC", logging.ERROR)
                 return None
                 
         except Exception as e:
-            self.log(f"❌ Exception while connecting to PLC: {str(e)}")
+            self.log(f"❌ Exception while connecting to PLC: {str(e)}", logging.ERROR)
             return None
 
-    def read_plc_data(self, client, register_address, register_count, unit_id):
-        """Reads data from PLC coils."""
+    def build_read_plan(self, register_address, register_count, unit_id):
+        """Compiles the configured coil range into block reads."""
+        tags = [(register_address + i, FC_READ_COILS, unit_id) for i in range(register_count)]
+        return compile_read_plan(tags, max_gap=self.read_gap_tolerance)
+
+    def read_plc_data(self, client, plan):
+        """Reads data from PLC coils using the compiled read plan."""
         try:
-            response = client.read_coils(address=6304, count=1)
-            
-            if hasattr(response, 'isError') and response.isError():
-                self.log(f"❌ Modbus Error: {response}")
-                return None
-            else:
-                return response.bits  # ✅ Correct attribute for coils (True/False list)
+            if isinstance(client, LiveTable):
+                return self.read_live_table(client, plan)
+            values = execute_read_plan(client, plan)
+            return [values[tag] for block in plan for tag in block.tags]
 
+        except ModbusReadError as e:
+            self.log(f"❌ Modbus Error: {e}", logging.ERROR)
+            return None
         except Exception as e:
-            self.log(f"❌ Exception while reading PLC: {str(e)}")
+            self.log(f"❌ Exception while reading PLC: {str(e)}", logging.ERROR)
+            return None
+
+    def read_live_table(self, table, plan):
+        """Reads the plan's coils from the logger's live table instead of the PLC."""
+        if table.closed:
+            self.log("❌ The logger stopped publishing live values", logging.ERROR)
+            return None
+        names = [f"Register_{tag.address}" for block in plan for tag in block.tags]
+        missing = [name for name in names if name not in table.index]
+        if missing:
+            self.log(f"❌ The logger doesn't publish {', '.join(missing)}", logging.ERROR)
+            return None
+        snapshot = table.snapshot(names)
+        if any(snapshot[name].quality != QUALITY_GOOD for name in names):
+            self.log("❌ The logger reports bad quality for this scan", logging.ERROR)
             return None
+        return [bool(snapshot[name].value) for name in names]
 
     def initialize_csv(self, csv_file, register_address, register_count):
-        """Creates a new CSV file with headers if it doesn't exist."""
-        if not os.path.exists(csv_file):
-            with open(csv_file, mode="w", newline="") as file:
-                writer = csv.writer(file)
-                headers = ["Timestamp"] + [f"Register_{register_address + i}" for i in range(register_count)]
-                writer.writerow(headers)
+        """Opens the CSV file for buffered logging, creating it with headers if it doesn't exist."""
+        headers = ["Timestamp"] + [f"Register_{register_address + i}" for i in range(register_count)]
+        writer = BufferedCsvWriter(csv_file, headers, flush_rows=self.csv_flush_rows,
+                                   flush_interval=self.csv_flush_interval)
+        if writer.created:
             self.log(f"✅ Created new CSV file: {csv_file}")
+        return writer
 
-    def save_to_csv(self, csv_file, data):
-        """Saves PLC data to a CSV file with timestamps."""
-        if data is None:
-            self.log("⚠️ No data to save")
+    def initialize_store(self, csv_file, register_address, register_count):
+        """Opens the ring store of recent samples that sits next to the CSV file."""
+        columns = [(f"Register_{register_address + i}", "b") for i in range(register_count)]
+        store_file = os.path.splitext(csv_file)[0] + ".ring"
+        return RingStore.open_or_create(store_file, columns, self.ring_store_capacity)
+
+    def show_recent_history(self, store):
+        """Fills the data view with the last history_seconds of samples already in the ring store."""
+        latest = store.latest()
+        if latest is None:
             return
+        end = latest[0]
+        timestamps = []
+        columns = {name: [] for name in store.columns}
+        for name in store.columns:
+            for timestamp_view, value_view in store.range(end - self.history_seconds, end, name):
+                if name == store.columns[0]:
+                    timestamps.extend(timestamp_view.tolist())
+                columns[name].extend(value_view.tolist())
+        # Only what fits the data view; every row shows one value per column
+        keep = max(1, self.max_data_rows // max(1, len(store.columns)))
+        start = max(0, len(timestamps) - keep)
+        for index in range(start, len(timestamps)):
+            timestamp = datetime.fromtimestamp(timestamps[index]).strftime("%Y-%m-%d %H:%M:%S")
+            self.data_queue.put((timestamp, [columns[name][index] for name in store.columns]))
+        if timestamps:
+            self.log(f"Loaded {len(timestamps) - start} recent sample(s) from {store.path}")
 
-        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    def show_logger_history(self, csv_file):
+        """Shows recent samples from the ring file the logger keeps next to ``csv_file``, if any."""
+        store_file = os.path.splitext(csv_file)[0] + ".ring"
+        try:
+            store = RingStore.open(store_file)
+        except (OSError, ValueError):
+            return
+        try:
+            self.show_recent_history(store)
+        finally:
+            store.close()
 
-        # Open CSV in append mode
-        with open(csv_file, mode="a", newline="") as file:
-            writer = csv.writer(file)
-            writer.writerow([timestamp] + [1 if bit else 0 for bit in data])  # Convert boolean to 1/0
+    def save_to_csv(self, csv_writer, data, timestamp=None):
+        """Queues PLC data for the CSV file (None in shared mode) with timestamps (the scan time if given)."""
+        if data is None:
+            self.log("⚠️ No data to save", logging.WARNING)
+            return
+
+        if timestamp is None:
+            timestamp = time.time()
         
         # Format data for display
-        data_str = [1 if bit else 0 for bit in data]
-        self.log(f"✅ Data logged at {timestamp}: {data_str}")
+        data_str = [1 if bit else 0 for bit in data]  # Convert boolean to 1/0
+        if csv_writer is None:
+            # Shared mode: the logger process already writes these values to disk
+            timestamp = datetime.fromtimestamp(timestamp).strftime("%Y-%m-%d %H:%M:%S")
+            self.log(f"✅ Data received at {timestamp}: {data_str}")
+        else:
+            csv_writer.write_row(timestamp, data_str)
+            timestamp = csv_writer.format_timestamp(timestamp)
+            self.log(f"✅ Data logged at {timestamp}: {data_str}")
         
-        # Add to data display
-        for i, bit in enumerate(data):
-            value = 1 if bit else 0
-            self.root.after(0, lambda t=timestamp, v=value: self.add_data_row(t, v))
+        # Add to data display (drawn by the Tk thread on its next refresh)
+        self.data_queue.put((timestamp, data_str))
 
     def logging_thread(self, modbus_type, plc_ip, plc_port, serial_port, baudrate, parity, stopbits, bytesize, timeout, 
                      register_address, register_count, unit_id, csv_file, log_interval):
         """Thread function for logging data."""
-        # Initialize CSV file with headers
-        self.initialize_csv(csv_file, register_address, register_count)
-        
+        if modbus_type == "shared":
+            # The logger owns the CSV and ring files; writing them too would
+            # duplicate rows and corrupt the ring. Only show what it recorded.
+            csv_writer = store = None
+            self.log("Logger (shared) mode: values are shown, not written (the logger records them)")
+            self.show_logger_history(csv_file)
+        else:
+            # Initialize CSV file with headers
+            csv_writer = self.initialize_csv(csv_file, register_address, register_count)
+            store = self.initialize_store(csv_file, register_address, register_count)
+            self.show_recent_history(store)
+        
+        # Compile the block reads once for the whole session
+        plan = self.build_read_plan(register_address, register_count, unit_id)
+        
+        # Failed connections are retried in the background with backoff
+        health = CircuitBreaker(self.max_reconnect_attempts,
+                                Backoff(self.reconnect_backoff_initial, self.reconnect_backoff_max))
+        reconnector = Reconnector(
+            lambda: self.connect_to_plc(modbus_type, plc_ip, plc_port, serial_port, baudrate, parity, stopbits, bytesize, timeout),
+            health, name="plc-reconnect")
+
         # Connect to PLC
         client = self.connect_to_plc(modbus_type, plc_ip, plc_port, serial_port, baudrate, parity, stopbits, bytesize, timeout)
         if client is None:
-            retry_count = 0
-            while client is None and retry_count < self.max_reconnect_attempts and self.log_running:
-                self.log(f"Retrying connection ({retry_count + 1}/{self.max_reconnect_attempts})...")
-                time.sleep(5)  # Wait before retry
-                retry_count += 1
-                client = self.connect_to_plc(modbus_type, plc_ip, plc_port, serial_port, baudrate, parity, stopbits, bytesize, timeout)
-                
-            if client is None:
-                self.log("Failed to connect after multiple attempts. Exiting.")
-                self.root.after(0, self.stop_logging)
-                return
+            self.log("Retrying connection in the background...", logging.WARNING)
+            health.trip()
+            reconnector.start()
 
         self.log("📡 Starting data logging...")
 
         try:
-            reconnect_count = 0
+            schedule = ScanSchedule(log_interval)
             while self.log_running:
-                data = self.read_plc_data(client, register_address, register_count, unit_id)
-                
-                # Handle connection loss during operation
-                if data is None and reconnect_count < self.max_reconnect_attempts:
-                    self.log(f"Connection may be lost. Attempting to reconnect ({reconnect_count + 1}/{self.max_reconnect_attempts})...")
-                    client.close()
-                    time.sleep(2)
-                    client = self.connect_to_plc(modbus_type, plc_ip, plc_port, serial_port, baudrate, parity, stopbits, bytesize, timeout)
-                    reconnect_count += 1
+                # Wait for the next grid deadline; the read time doesn't stretch the period
+                scan_time = schedule.wait()
+                if not self.log_running:
+                    break
+                if schedule.last_missed:
+                    self.log(f"⚠️ Missed {schedule.last_missed} scan deadline(s) ({schedule.missed} total)", logging.WARNING)
+
+                # While the PLC is down the scans are skipped, not delayed
+                if client is None:
+                    client = reconnector.take()
                     if client is None:
                         continue
-                elif data is None:
-                    self.log("Too many failed read attempts. Stopping logging.")
-                    break
+
+                data = self.read_plc_data(client, plan)
+                
+                # Handle connection loss during operation
+                if data is None:
+                    if health.record_failure():
+                        self.log(f"Connection may be lost. Reconnecting in the background "
+                                 f"(next attempt in {health.retry_in():.1f} s)...", logging.WARNING)
+                        client.close()
+                        client = None
+                        reconnector.start()
                 else:
-                    reconnect_count = 0  # Reset counter on successful read
+                    health.record_success()
                     
-                self.save_to_csv(csv_file, data)
-                time.sleep(log_interval)  # Wait before next read
+                self.save_to_csv(csv_writer, data, timestamp=scan_time)
+                if data is not None and store is not None:
+                    store.append(scan_time, data)
 
         except Exception as e:
-            self.log(f"Error in logging thread: {str(e)}")
+            self.log(f"Error in logging thread: {str(e)}", logging.ERROR)
         finally:
-            if client is not None:
-                client.close()
+            reconnector.stop()
+            for open_client in (client, reconnector.take()):
+                if open_client is not None:
+                    open_client.close()
+            if csv_writer is not None:
+                csv_writer.close()
+            if store is not None:
+                store.close()
             self.log("Connection closed. Logging stopped.")
             self.root.after(0, self.stop_logging)
 
@@ -1,10 +1,31 @@
 # ==================== PYMODBUS (RTU/TCP) ====================
 
-import csv
+import asyncio
 import time
 import os
-from datetime import datetime
-from pymodbus.client import ModbusTcpClient, ModbusSerialClient
+from concurrent.futures import ThreadPoolExecutor
+from pymodbus.client import AsyncModbusTcpClient, ModbusTcpClient, ModbusSerialClient
+from modbus_logger.archive import ArchiveCompactor
+from modbus_logger.capabilities import CapabilityCache, device_key, load_capabilities
+from modbus_logger.capture import CaptureWriter, capture_kwargs, supports_capture
+from modbus_logger.csv_writer import BufferedCsvWriter
+from modbus_logger.deadband import ChangeFilter, Deadband
+from modbus_logger.health import Backoff, CircuitBreaker, Reconnector
+from modbus_logger.live_table import LiveTable
+from modbus_logger.metrics import MetricsRegistry
+from modbus_logger.pipeline import PipelinedTcpClient
+from modbus_logger.ring_store import RingStore
+from modbus_logger.rollups import RollupWriter
+from modbus_logger.rtu_bus import PRIORITY_HIGH, RtuBusMaster
+from modbus_logger.poller import Device, PollingEngine, device_scan_classes
+from modbus_logger.read_plan import (
+    FC_READ_COILS, FC_READ_DISCRETE_INPUTS, ModbusReadError, compile_read_plan, execute_read_plan, make_tag,
+    plan_tags, skipped_block,
+)
+from modbus_logger.scheduler import ScanClass, ScanSchedule
+from modbus_logger.supervisor import Supervisor
+from modbus_logger.tag_map import make_tag_def, tag_name, tag_typecode
+from modbus_logger.write_plan import REGISTER, WriteBatcher, write_request
 
 # ==================== CONFIGURATION ====================
 
@@ -14,6 +35,7 @@ MODBUS_TYPE = "rtu"  # Change to "rtu" if using Serial (RS-485)
 # Modbus TCP (Ethernet) Configuration
 PLC_IP = "192.168.1.10"  # Change to your PLC's IP Address
 PLC_PORT = 502           # Default Modbus TCP Port
+TCP_PIPELINE_WINDOW = 1  # Requests in flight at once; raise it for PLCs/gateways that queue requests
 
 # Modbus RTU (Serial) Configuration RS-485
 SERIAL_PORT = "COM3"     # Windows: COM3, Linux: "/dev/ttyUSB0"
@@ -24,26 +46,137 @@ BYTESIZE = 8
 TIMEOUT = 1
 
 # Modbus Register Settings
-REGISTER_ADDRESS = 0x6304  # Change based on PLC's register map
+REGISTER_ADDRESS = 6304    # Change based on PLC's register map (decimal, as the backend reads it)
 REGISTER_COUNT = 1   # Number of registers to read
 UNIT_ID = 1          # Usually 1 for a single PLC
+READ_FUNCTION_CODE = FC_READ_COILS  # 1 = coils, 2 = discrete inputs, 3 = holding, 4 = input registers
+
+# Tags to read as (address, function code, unit ID); add more to log several ranges.
+# In RTU mode tags may name several unit IDs on the same RS-485 line: the bus
+# master takes the slaves in turn and skips one that times out for a while.
+READ_TAGS = [(REGISTER_ADDRESS + i, READ_FUNCTION_CODE, UNIT_ID) for i in range(REGISTER_COUNT)]
+# Typed tags are decoded to engineering units and logged under their own name:
+#   make_tag_def("temperature", 100, "float32", layout="CDAB"),
+#   make_tag_def("pressure", 102, "int16", scale=0.01),
+#   make_tag_def("run_hours", 104, "uint32", function_code=4),
+# Types: int16, uint16, int32, uint32, float32, int64, uint64, float64, bool (coils/inputs)
+
+# Unused addresses that may be read to merge two tags into one request
+READ_GAP_TOLERANCE = 8
+
+# Probe every unit once for the largest read it accepts, the addresses it can
+# read and the function codes it supports, and size the block reads to match.
+# Results are cached per host:port/unit; a unit is probed again when its tags
+# move outside the probed addresses (or after removing it from the file).
+PROBE_CAPABILITIES = False
+CAPABILITIES_FILE = "device_capabilities.json"
+
+# Setpoints written once after the first connection, e.g. {10: 100, 11: 200}.
+# Contiguous registers are combined into multi-register writes. This is the
+# setting the logger uses; WRITE_REGISTERS in config.py is not read by it.
+WRITE_REGISTERS = {}
 
 # CSV File Name
 CSV_FILE = "plc_data.csv"
 
+# CSV buffering: rows are written in groups instead of reopening the file per row
+CSV_FLUSH_ROWS = 100        # Write once this many rows are queued...
+CSV_FLUSH_INTERVAL = 5      # ...or this many seconds have passed
+CSV_FSYNC = "never"         # "never", "flush" (every group commit) or "rotate"
+CSV_ROTATE_MAX_BYTES = 0    # Start a new file past this size (0 = never)
+CSV_ROTATE_DAILY = False    # Start a new file every day
+
+# Rotated CSV files are compacted in the background into .mba archives next to
+# them (delta-of-delta timestamps, compressed values, run-length coils), often
+# 10-50x smaller; read them with modbus_logger.archive.ArchiveReader
+ARCHIVE_ROTATED_CSV = True
+ARCHIVE_DELETE_CSV = False   # Remove a rotated CSV once its archive is written and verified
+ARCHIVE_SCAN_INTERVAL = 300  # Seconds between looks for newly rotated files
+
+# Report by exception: log only values that changed, one "Timestamp,Tag,Value"
+# row per change, instead of a full row every scan
+REPORT_BY_EXCEPTION = False
+DEADBAND_ABSOLUTE = 0       # Minimum change in raw units (0 = any change)
+DEADBAND_PERCENT = 0        # Minimum change in % of the last logged value
+DEADBAND_MAX_SILENCE = 600  # Log unchanged values again after this many seconds (None = never)
+TAG_DEADBANDS = {}          # Per-address (or tag name) overrides, e.g. {100: Deadband(absolute=0.5, max_silence=60)}
+
+# Recent history kept in a memory-mapped ring file next to the CSV (plc_data.ring)
+# so the GUI and the backend can query the last minutes without parsing the CSV
+RING_STORE_ENABLED = True
+RING_STORE_CAPACITY = 100000  # Rows kept before the oldest are overwritten
+# Trend rollups: min/max/avg/last per 1 s, 1 min and 1 h kept next to the ring
+# store (plc_data.1s.ring, ...), so the backend serves long trends without raw rows
+ROLLUPS_ENABLED = True
+
+# Latest value of every tag published in shared memory, so the GUI and the
+# backend on the same machine read it from here instead of polling the PLC too
+LIVE_TABLE_NAME = "plc_live"  # None = don't publish
+
 # Data Logging Interval (Seconds)
 LOG_INTERVAL = 5  # Change to your desired logging frequency
+# Scans run on a fixed grid (e.g. every 5 s on :00, :05, ...) whatever the read takes
 
-# Max reconnection attempts
+# Connection health: after this many failed reads in a row the PLC is
+# reconnected in the background while the scan grid keeps running
 MAX_RECONNECT_ATTEMPTS = 3
+RECONNECT_BACKOFF_INITIAL = 2  # Seconds before the first reconnect attempt, doubled each time
+RECONNECT_BACKOFF_MAX = 60     # Longest wait between attempts (randomly shortened by up to 20%)
+
+# Multi-device polling (Modbus TCP only). When this list is not empty, every
+# device is polled from this one process instead of the single PLC above and
+# each one is logged to its own CSV file (plc_data_<name>.csv).
+# Example: Device("press1", "192.168.1.21", tags=READ_TAGS, interval=LOG_INTERVAL)
+# Several rates per device, one CSV per scan class (plc_data_<name>_<class>.csv):
+#   Device("press1", "192.168.1.21", scan_classes=[
+#       ScanClass("alarms", 0.1, ALARM_TAGS),
+#       ScanClass("process", 1, PROCESS_TAGS),
+#       ScanClass("counters", 60, COUNTER_TAGS),
+#   ])
+DEVICES = []
+MAX_CONCURRENT_REQUESTS = 50  # Requests in flight at once across all devices (per worker process)
+# Worker processes that share the DEVICES between them (1 = poll everything in
+# this process). Crashed workers are restarted and their devices rebalanced.
+WORKER_PROCESSES = 1
+
+# Metrics (request latency, timeouts, reconnects, bytes, overruns, queue depth per device)
+METRICS_DUMP_INTERVAL = 60         # Seconds between metric dumps to the console (0 = never)
+METRICS_FILE = "plc_metrics.prom"  # Prometheus text file, e.g. for node_exporter (None = console only)
+
+# Traffic capture: every request and response PDU is recorded with its time
+# and latency, to be served back offline by benchmarks/replay.py (None = off).
+# Multi-device polling is only captured with WORKER_PROCESSES = 1.
+CAPTURE_FILE = None                # e.g. "plc_traffic.mbcap"
+CAPTURE_MAX_BYTES = 1024 ** 3      # Stop recording once the file is this large
+
+metrics = MetricsRegistry()
+
+def plc_device_name():
+    """Label of the single PLC (or RS-485 line) in the metrics."""
+    return f"{PLC_IP}:{PLC_PORT}" if MODBUS_TYPE == "tcp" else SERIAL_PORT
+
+def dump_metrics():
+    """Prints a per-device metrics summary and writes the Prometheus text file."""
+    print("📊 Metrics:")
+    for line in metrics.summary():
+        print(f"   {line}")
+    if METRICS_FILE:
+        metrics.write_textfile(METRICS_FILE)
 
 # ==================== CONNECT TO PLC ====================
 
-def connect_to_plc():
-    """Connects to the PLC using either Modbus TCP or Modbus RTU."""
+def connect_to_plc(capture=None):
+    """Connects to the PLC using either Modbus TCP or Modbus RTU.
+
+    With a CaptureWriter the client's traffic is recorded into it.
+    """
     try:
-        if MODBUS_TYPE == "tcp":
-            client = ModbusTcpClient(PLC_IP, port=PLC_PORT)
+        if MODBUS_TYPE == "tcp" and TCP_PIPELINE_WINDOW > 1:
+            client = PipelinedTcpClient(PLC_IP, PLC_PORT, TCP_PIPELINE_WINDOW, timeout=TIMEOUT,
+                                        **capture_kwargs(PipelinedTcpClient, capture, plc_device_name()))
+        elif MODBUS_TYPE == "tcp":
+            client = ModbusTcpClient(PLC_IP, port=PLC_PORT,
+                                     **capture_kwargs(ModbusTcpClient, capture, plc_device_name()))
         else:
             # Updated for newer pymodbus versions
             client = ModbusSerialClient(
@@ -53,6 +186,7 @@ def connect_to_plc():
                 stopbits=STOPBITS,
                 bytesize=BYTESIZE,
                 timeout=TIMEOUT,
+                **capture_kwargs(ModbusSerialClient, capture, plc_device_name()),
             )
 
         if client.connect():
@@ -60,108 +194,470 @@ def connect_to_plc():
             return client
         else:
             print("❌ Failed to connect to PLC")
+            metrics.count(plc_device_name(), "connect_failures")
             return None
             
     except Exception as e:
         print(f"❌ Exception while connecting to PLC: {str(e)}")
+        metrics.count(plc_device_name(), "connect_failures")
+        return None
+
+def start_capture(client_class):
+    """Opens CAPTURE_FILE for recording, or returns None when capture is off."""
+    if not CAPTURE_FILE:
         return None
+    if not supports_capture(client_class):
+        print("⚠️ This pymodbus version can't trace PDUs (needs 3.9 or newer), traffic is not captured")
+        return None
+    print(f"📼 Capturing traffic to {CAPTURE_FILE}")
+    return CaptureWriter(CAPTURE_FILE, CAPTURE_MAX_BYTES)
+
+def stop_capture(capture):
+    if capture is not None:
+        capture.close()
+        print(f"📼 Captured {capture.records} transaction(s)"
+              + (f", {capture.dropped} dropped past CAPTURE_MAX_BYTES" if capture.dropped else ""))
+
+# ==================== DEVICE CAPABILITIES ====================
+
+def unit_capabilities(cache, client, tags, host, port=None):
+    """Returns {unit_id: DeviceCapabilities} for the units in ``tags``, from the cache or probed.
+
+    Without a client only cached units are returned.
+    """
+    tags = [make_tag(tag) for tag in tags]
+    capabilities = {}
+    for unit_id in sorted({tag.unit_id for tag in tags}):
+        unit_tags = [tag for tag in tags if tag.unit_id == unit_id]
+        key = device_key(host, port, unit_id)
+        try:
+            found = load_capabilities(cache, key, client, unit_id, unit_tags)
+        except ConnectionError as e:
+            print(f"❌ Probing {key} failed: {e}")
+            continue
+        if found is None:
+            continue
+        if found.requests:
+            print(f"🔎 Probed {key} in {found.requests} request(s): {found}")
+        for tag in found.unreadable(unit_tags):
+            print(f"⚠️ {key} can't read {tag_name(tag)} (FC{tag.function_code}); it is not requested and logged empty")
+        capabilities[unit_id] = found
+    return capabilities
+
+def sized_read_plan(client):
+    """Compiles READ_TAGS into block reads sized for what the PLC accepts."""
+    host, port = (PLC_IP, PLC_PORT) if MODBUS_TYPE == "tcp" else (SERIAL_PORT, None)
+    capabilities = unit_capabilities(CapabilityCache(CAPABILITIES_FILE), client, READ_TAGS, host, port)
+    plan = compile_read_plan(READ_TAGS, max_gap=READ_GAP_TOLERANCE, capabilities=capabilities)
+    requests = sum(not skipped_block(block) for block in plan)
+    print(f"📋 Sized for the probed device: {requests} request(s) per cycle")
+    return plan
+
+def probe_devices(devices):
+    """Returns ``devices`` with the capabilities of their units, from the cache or probed."""
+    cache = CapabilityCache(CAPABILITIES_FILE)
+
+    def probe(device):
+        tags = [tag for scan_class in device_scan_classes(device) for tag in scan_class.tags]
+        client = ModbusTcpClient(device.host, port=device.port, timeout=device.timeout)
+        try:
+            # A failed connect still plans from whatever is cached
+            connected = client if client.connect() else None
+            capabilities = unit_capabilities(cache, connected, tags, device.host, device.port)
+        finally:
+            client.close()
+        return device._replace(capabilities=capabilities or None)
+
+    with ThreadPoolExecutor(max_workers=max(1, min(len(devices), 16))) as pool:
+        return list(pool.map(probe, devices))
 
 # ==================== READ DATA FROM PLC ====================
 
-def read_plc_data(client):
-    """Reads data from PLC coils."""
-    try:
-        response = client.read_coils(address=6304,count= 1)  # Read 1 coil at address 6304
-        
-        if response.isError():
-            print(f"❌ Modbus Error: {response}")
+def read_plc_data(client, plan=None, bus=None):
+    """Reads all configured tags from the PLC using the fewest block requests.
+
+    With an RTU bus master, tags of slaves that failed are logged as empty.
+    """
+    if plan is None:
+        plan = compile_read_plan(READ_TAGS, max_gap=READ_GAP_TOLERANCE)
+    if bus is not None:
+        values, errors = bus.execute_read_plan(plan)
+        for unit_id, error in errors.items():
+            print(f"❌ Unit {unit_id}: {error}")
+        if not values:
             return None
-        else:
-            return response.bits  # ✅ Correct attribute for coils (True/False list)
+        return [values.get(tag) for tag in plan_tags(plan)]
 
+    try:
+        values = execute_read_plan(client, plan, metrics, plc_device_name())
+        return [values[tag] for block in plan for tag in block.tags]
+
+    except ModbusReadError as e:
+        print(f"❌ Modbus Error: {e}")
+        return None
     except Exception as e:
         print(f"❌ Exception while reading PLC: {str(e)}")
         return None
 
 
+# ==================== WRITE SETPOINTS ====================
+
+def write_setpoints(client, registers, bus=None, unit_id=UNIT_ID):
+    """Writes {address: value} to holding registers in as few requests as possible.
+
+    Returns True if every write was acknowledged.
+    """
+    if bus is not None:
+        batcher = WriteBatcher(lambda block: bus.submit(block, PRIORITY_HIGH).result())
+    else:
+        batcher = WriteBatcher(lambda block: write_request(client, block))
+    batcher.write_many(registers, REGISTER, unit_id)
+    results = batcher.flush()
+    failed = [result for result in results if not result.success]
+    for result in failed:
+        print(f"❌ Write to register {result.address} failed: {result.error}")
+    print(f"✏️ Wrote {len(results) - len(failed)}/{len(results)} setpoint(s) in {batcher.requests_sent} request(s)")
+    return not failed
+
+
 # ==================== SAVE DATA TO CSV ====================
 
-def initialize_csv():
-    """Creates a new CSV file with headers if it doesn't exist."""
-    if not os.path.exists(CSV_FILE):
-        with open(CSV_FILE, mode="w", newline="") as file:
-            writer = csv.writer(file)
-            headers = ["Timestamp"] + [f"Register_{REGISTER_ADDRESS + i}" for i in range(REGISTER_COUNT)]
-            writer.writerow(headers)
-        print(f"✅ Created new CSV file: {CSV_FILE}")
-
-def save_to_csv(data):
-    """Saves PLC data to a CSV file with timestamps."""
+def initialize_csv(plan, csv_file=CSV_FILE):
+    """Opens the CSV file for buffered logging, creating it with headers if it doesn't exist."""
+    if REPORT_BY_EXCEPTION:
+        headers = ["Timestamp", "Tag", "Value"]
+    else:
+        headers = ["Timestamp"] + [tag_name(tag) for tag in plan_tags(plan)]
+    writer = BufferedCsvWriter(
+        csv_file,
+        headers,
+        flush_rows=CSV_FLUSH_ROWS,
+        flush_interval=CSV_FLUSH_INTERVAL,
+        fsync=CSV_FSYNC,
+        rotate_max_bytes=CSV_ROTATE_MAX_BYTES,
+        rotate_daily=CSV_ROTATE_DAILY,
+    )
+    if writer.created:
+        print(f"✅ Created new CSV file: {csv_file}")
+    return writer
+
+def start_compactor(csv_files):
+    """Starts archiving the rotated CSV files in the background, or returns None if disabled."""
+    if not ARCHIVE_ROTATED_CSV:
+        return None
+    compactor = ArchiveCompactor(csv_files, interval=ARCHIVE_SCAN_INTERVAL, delete_source=ARCHIVE_DELETE_CSV,
+                                 log=lambda message: print(f"🗜️ {message}"))
+    compactor.start()
+    return compactor
+
+def save_to_csv(writer, data, timestamp=None):
+    """Queues PLC data for the CSV file with timestamps (the scan time if given)."""
     if data is None:
         print("⚠️ No data to save")
         return
 
-    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    if timestamp is None:
+        timestamp = time.time()
+    writer.write_row(timestamp, data)
 
-    # Open CSV in append mode
-    with open(CSV_FILE, mode="a", newline="") as file:
-        writer = csv.writer(file)
-        writer.writerow([timestamp] + data)
-    
-    print(f"✅ Data logged at {timestamp}: {data}")
+    print(f"✅ Data logged at {writer.format_timestamp(timestamp)}: {data}")
+
+def initialize_change_filter(plan):
+    """Creates the report-by-exception filter for a plan, or returns None if disabled."""
+    if not REPORT_BY_EXCEPTION:
+        return None
+    default = Deadband(DEADBAND_ABSOLUTE, DEADBAND_PERCENT, DEADBAND_MAX_SILENCE)
+    deadbands = {}
+    for tag in plan_tags(plan):
+        deadband = TAG_DEADBANDS.get(tag_name(tag), TAG_DEADBANDS.get(tag.address))
+        if deadband is not None:
+            deadbands[tag] = deadband
+    return ChangeFilter(default, deadbands)
+
+def save_changes_to_csv(writer, change_filter, tags, data, timestamp):
+    """Queues one "Timestamp,Tag,Value" row per value that passed the deadband filter."""
+    if data is None:
+        print("⚠️ No data to save")
+        return
+
+    changes = change_filter.changes(timestamp, dict(zip(tags, data)))
+    for tag, value in changes:
+        writer.write_row(timestamp, [tag_name(tag), value])
+
+    if changes:
+        print(f"✅ {len(changes)} change(s) logged at {writer.format_timestamp(timestamp)}")
+
+# ==================== RECENT HISTORY STORE ====================
+
+def initialize_store(plan, csv_file=CSV_FILE):
+    """Opens the ring store that sits next to a CSV file, or returns None if disabled."""
+    if not RING_STORE_ENABLED:
+        return None
+    columns = [(tag_name(tag), tag_typecode(tag)) for tag in plan_tags(plan)]
+    store_file = os.path.splitext(csv_file)[0] + ".ring"
+    return RingStore.open_or_create(store_file, columns, RING_STORE_CAPACITY)
+
+def save_to_store(store, data, timestamp):
+    """Appends PLC data to the ring store, if there is one."""
+    if store is not None and data is not None:
+        store.append(timestamp, data)
+
+def initialize_rollups(plan, csv_file=CSV_FILE):
+    """Opens the trend rollups that sit next to a CSV file, or returns None if disabled."""
+    if not ROLLUPS_ENABLED:
+        return None
+    store_file = os.path.splitext(csv_file)[0] + ".ring"
+    try:
+        return RollupWriter.open_or_create(store_file, [tag_name(tag) for tag in plan_tags(plan)])
+    except ValueError as e:
+        print(f"⚠️ Trend rollups disabled for {csv_file}: {e}")
+        return None
+
+def save_to_rollups(rollups, data, timestamp):
+    """Folds PLC data into the trend rollups, if there are any."""
+    if rollups is not None and data is not None:
+        rollups.add(timestamp, data)
+
+def initialize_live_table(tags):
+    """Creates the shared live value table for the tag names, or returns None if disabled."""
+    if not LIVE_TABLE_NAME:
+        return None
+    table = LiveTable.create(LIVE_TABLE_NAME, tags)
+    print(f"📢 Publishing live values in shared memory '{LIVE_TABLE_NAME}'")
+    return table
+
+def publish_live(table, data, timestamp, slots=None):
+    """Publishes a scan to the live table; a failed read marks its tags bad."""
+    if table is None:
+        return
+    if data is None:
+        table.mark_bad(timestamp, slots)
+    else:
+        table.publish(timestamp, data, slots)
 
 # ==================== MAIN LOOP ====================
 
 def main():
     """Continuously reads and logs PLC data."""
+    # Compile the block reads once, they only change with the configuration
+    plan = compile_read_plan(READ_TAGS, max_gap=READ_GAP_TOLERANCE)
+    print(f"📋 Reading {len(READ_TAGS)} tags in {len(plan)} request(s) per cycle")
+
     # Initialize CSV file with headers
-    initialize_csv()
+    csv_writer = initialize_csv(plan)
+    compactor = start_compactor([CSV_FILE])
+    store = initialize_store(plan)
+    rollups = initialize_rollups(plan)
+    change_filter = initialize_change_filter(plan)
+    live_table = initialize_live_table([tag_name(tag) for tag in plan_tags(plan)])
     
+    # Failed connections are retried in the background with backoff
+    health = CircuitBreaker(MAX_RECONNECT_ATTEMPTS, Backoff(RECONNECT_BACKOFF_INITIAL, RECONNECT_BACKOFF_MAX))
+    if MODBUS_TYPE != "tcp":
+        capture = start_capture(ModbusSerialClient)
+    else:
+        capture = start_capture(PipelinedTcpClient if TCP_PIPELINE_WINDOW > 1 else ModbusTcpClient)
+    reconnector = Reconnector(lambda: connect_to_plc(capture), health, name="plc-reconnect")
+
     # Connect to PLC
-    client = connect_to_plc()
+    client = connect_to_plc(capture)
     if client is None:
-        retry_count = 0
-        while client is None and retry_count < MAX_RECONNECT_ATTEMPTS:
-            print(f"Retrying connection ({retry_count + 1}/{MAX_RECONNECT_ATTEMPTS})...")
-            time.sleep(5)  # Wait before retry
-            retry_count += 1
-            client = connect_to_plc()
-            
-        if client is None:
-            print("Failed to connect after multiple attempts. Exiting.")
-            return
+        print("Retrying connection in the background...")
+        health.trip()
+        reconnector.start()
+    if PROBE_CAPABILITIES:
+        # Block sizes change, the tag order (and so the CSV columns) doesn't
+        plan = sized_read_plan(client)
 
     print("📡 Starting data logging... (Press CTRL+C to stop)")
 
+    # On RS-485 one bus master schedules the requests for every slave on the line
+    bus = None
+    if MODBUS_TYPE != "tcp":
+        bus = RtuBusMaster(client, BAUDRATE, BYTESIZE, PARITY, STOPBITS,
+                           metrics=metrics, device=plc_device_name())
+
     try:
-        reconnect_count = 0
+        connected_once = client is not None
+        if client is not None and WRITE_REGISTERS:
+            write_setpoints(client, WRITE_REGISTERS, bus)
+        schedule = ScanSchedule(LOG_INTERVAL)
+        next_dump = time.monotonic() + METRICS_DUMP_INTERVAL
         while True:
-            data = read_plc_data(client)
-            
-            # Handle connection loss during operation
-            if data is None and reconnect_count < MAX_RECONNECT_ATTEMPTS:
-                print(f"Connection may be lost. Attempting to reconnect ({reconnect_count + 1}/{MAX_RECONNECT_ATTEMPTS})...")
-                client.close()
-                time.sleep(2)
-                client = connect_to_plc()
-                reconnect_count += 1
+            # Wait for the next grid deadline; the read time doesn't stretch the period
+            scan_time = schedule.wait()
+            if schedule.last_missed:
+                print(f"⚠️ Missed {schedule.last_missed} scan deadline(s) ({schedule.missed} total)")
+                metrics.count(plc_device_name(), "scan_overruns", schedule.last_missed)
+
+            if METRICS_DUMP_INTERVAL and time.monotonic() >= next_dump:
+                dump_metrics()
+                next_dump = time.monotonic() + METRICS_DUMP_INTERVAL
+
+            # While the PLC is down the scans are skipped, not delayed
+            if client is None:
+                client = reconnector.take()
                 if client is None:
                     continue
-            elif data is None:
-                print("Too many failed read attempts. Exiting.")
-                break
+                if PROBE_CAPABILITIES and not connected_once:
+                    # Probed before the bus master gets the client
+                    plan = sized_read_plan(client)
+                if bus is not None:
+                    bus.client = client
+                if connected_once:
+                    metrics.count(plc_device_name(), "reconnects")
+                elif WRITE_REGISTERS:
+                    write_setpoints(client, WRITE_REGISTERS, bus)
+                connected_once = True
+
+            data = read_plc_data(client, plan, bus)
+            
+            # Handle connection loss during operation
+            if data is None:
+                if health.record_failure():
+                    print(f"Connection may be lost. Reconnecting in the background "
+                          f"(next attempt in {health.retry_in():.1f} s)...")
+                    client.close()
+                    client = None
+                    reconnector.start()
             else:
-                reconnect_count = 0  # Reset counter on successful read
+                health.record_success()
                 
-            save_to_csv(data)
-            time.sleep(LOG_INTERVAL)  # Wait before next read
+            if change_filter is not None:
+                save_changes_to_csv(csv_writer, change_filter, plan_tags(plan), data, scan_time)
+            else:
+                save_to_csv(csv_writer, data, timestamp=scan_time)
+            save_to_store(store, data, scan_time)
+            save_to_rollups(rollups, data, scan_time)
+            publish_live(live_table, data, scan_time)
+            metrics.set_gauge(plc_device_name(), "writer_queue_depth", csv_writer.pending)
 
     except KeyboardInterrupt:
         print("\n🛑 Stopping data logging...")
     finally:
-        if client is not None:
-            client.close()
+        dump_metrics()
+        reconnector.stop()
+        if bus is not None:
+            bus.close()
+        for open_client in (client, reconnector.take()):
+            if open_client is not None:
+                open_client.close()
+        csv_writer.close()
+        if compactor is not None:
+            compactor.stop()
+        if store is not None:
+            store.close()
+        if rollups is not None:
+            rollups.close()
+        if live_table is not None:
+            live_table.close()
+        stop_capture(capture)
         print("Connection closed. Exiting.")
 
+# ==================== MULTI-DEVICE MAIN LOOP ====================
+
+def device_csv_file(device, scan_class=None):
+    """Returns the CSV file used for one device (and scan class) in multi-device mode."""
+    base, ext = os.path.splitext(CSV_FILE)
+    if scan_class is not None and device.scan_classes:
+        return f"{base}_{device.name}_{scan_class.name}{ext}"
+    return f"{base}_{device.name}{ext}"
+
+async def log_samples(queue, writers, stores, rollups, change_filters, live_table=None, live_slots=None):
+    """Consumes samples from the polling engine and logs them to CSV, the ring stores and the live table."""
+    while True:
+        sample = await queue.get()
+        key = (sample.device.name, sample.scan_class.name)
+        if sample.missed:
+            print(f"⚠️ {sample.device.name}/{sample.scan_class.name}: missed {sample.missed} scan deadline(s)")
+        if sample.error:
+            print(f"❌ {sample.device.name}: {sample.error}")
+            if live_table is not None:
+                publish_live(live_table, None, sample.timestamp, live_slots[key])
+        else:
+            data = list(sample.values.values())
+            if change_filters[key] is not None:
+                save_changes_to_csv(writers[key], change_filters[key], list(sample.values), data,
+                                    sample.timestamp)
+            else:
+                save_to_csv(writers[key], data, timestamp=sample.timestamp)
+            save_to_store(stores[key], data, sample.timestamp)
+            save_to_rollups(rollups[key], data, sample.timestamp)
+            if live_table is not None:
+                publish_live(live_table, data, sample.timestamp, live_slots[key])
+            metrics.set_gauge(sample.device.name, "writer_queue_depth", writers[key].pending)
+        queue.task_done()
+
+async def dump_metrics_periodically():
+    """Dumps the metrics every METRICS_DUMP_INTERVAL seconds."""
+    while True:
+        await asyncio.sleep(METRICS_DUMP_INTERVAL)
+        dump_metrics()
+
+async def main_async():
+    """Polls every device in DEVICES (sharded over WORKER_PROCESSES) and logs the results."""
+    devices = DEVICES
+    if PROBE_CAPABILITIES:
+        devices = await asyncio.get_running_loop().run_in_executor(None, probe_devices, DEVICES)
+    writers = {}
+    stores = {}
+    rollups = {}
+    change_filters = {}
+    live_names = {}  # Live table tags are named <device>/<tag>
+    for device in devices:
+        for scan_class in device_scan_classes(device):
+            plan = compile_read_plan(scan_class.tags, max_gap=device.max_gap, capabilities=device.capabilities)
+            csv_file = device_csv_file(device, scan_class)
+            writers[(device.name, scan_class.name)] = initialize_csv(plan, csv_file)
+            stores[(device.name, scan_class.name)] = initialize_store(plan, csv_file)
+            rollups[(device.name, scan_class.name)] = initialize_rollups(plan, csv_file)
+            change_filters[(device.name, scan_class.name)] = initialize_change_filter(plan)
+            live_names[(device.name, scan_class.name)] = [f"{device.name}/{tag_name(tag)}" for tag in plan_tags(plan)]
+
+    live_table = initialize_live_table([name for names in live_names.values() for name in names])
+    live_slots = {key: live_table.slots(names) for key, names in live_names.items()} if live_table else None
+
+    queue = asyncio.Queue(maxsize=10 * len(devices))
+    engine_options = dict(max_concurrency=MAX_CONCURRENT_REQUESTS, failure_threshold=MAX_RECONNECT_ATTEMPTS,
+                          backoff_initial=RECONNECT_BACKOFF_INITIAL, backoff_max=RECONNECT_BACKOFF_MAX)
+    capture = None
+    if WORKER_PROCESSES > 1:
+        if CAPTURE_FILE:
+            print("⚠️ CAPTURE_FILE needs WORKER_PROCESSES = 1, traffic is not captured")
+        engine = Supervisor(devices, queue.put, workers=WORKER_PROCESSES, metrics=metrics,
+                            log=lambda message: print(f"🧩 {message}"), **engine_options)
+    else:
+        capture = start_capture(AsyncModbusTcpClient)
+        engine = PollingEngine(devices, queue.put, metrics=metrics, capture=capture, **engine_options)
+    compactor = start_compactor(writer.path for writer in writers.values())
+    consumer = asyncio.create_task(log_samples(queue, writers, stores, rollups, change_filters, live_table, live_slots))
+    dumper = asyncio.create_task(dump_metrics_periodically()) if METRICS_DUMP_INTERVAL else None
+
+    print(f"📡 Polling {len(devices)} devices... (Press CTRL+C to stop)")
+    try:
+        await engine.run()
+    finally:
+        consumer.cancel()
+        if dumper is not None:
+            dumper.cancel()
+        dump_metrics()
+        for writer in writers.values():
+            writer.close()
+        if compactor is not None:
+            compactor.stop()
+        for store in list(stores.values()) + list(rollups.values()):
+            if store is not None:
+                store.close()
+        if live_table is not None:
+            live_table.close()
+        stop_capture(capture)
+        print("Connections closed. Exiting.")
+
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    if DEVICES:
+        try:
+            asyncio.run(main_async())
+        except KeyboardInterrupt:
+            print("\n🛑 Stopping data logging...")
+    else:
+        main()
\ No newline at end of file
@@ -13,6 +13,73 @@ export interface ModbusConnection {
   bytesize?: string;
   timeout: string;
   retries: string;
+  poll_interval?: string;
+  pipeline_window?: string;
+}
+
+export interface BatchReadRequest {
+  connection_id: string;
+  function_code: number;
+  address: number;
+  count: number;
+  unit_id?: number;
+}
+
+export interface BatchReadResult extends BatchReadRequest {
+  success: boolean;
+  data?: (boolean | number)[];
+  message?: string;
+  latency_ms?: number;
+}
+
+export interface WriteRequest {
+  address: number;
+  value: boolean | number;
+  type?: 'register' | 'coil';
+  unit_id?: number;
+}
+
+export interface WriteResult extends WriteRequest {
+  success: boolean;
+  message?: string | null;
+  superseded: boolean;
+}
+
+export interface HistoryTrend {
+  success: boolean;
+  bucket: number;
+  timestamps: number[];
+  count: number[];
+  min: number[];
+  max: number[];
+  avg: number[];
+  last: number[];
+}
+
+export interface DeviceCapabilities {
+  function_codes: number[];
+  max_count: Record<string, number>;
+  ranges: Record<string, [number, number][]>;
+  spans: Record<string, [number, number]>;
+  probed_at: number;
+}
+
+export interface ProbeSpan {
+  function_code: number;
+  address: number;
+  count: number;
+}
+
+export interface LiveValue {
+  value: number;
+  quality: 'good' | 'bad' | 'unknown';
+  timestamp: number;
+}
+
+export interface LiveUpdate {
+  connection_id: string;
+  timestamp: number;
+  values: Record<string, boolean | number>;
 }
 
 export const modbusService = {
@@ -71,4 +138,112 @@ export const modbusService = {
       throw error;
     }
   },
+
+  readBatch: async (requests: BatchReadRequest[]): Promise<{ success: boolean; results: BatchReadResult[]; elapsed_ms: number }> => {
+    const response = await fetch(`${API_BASE_URL}/read/batch`, {
+      method: 'POST',
+      headers: {
+        'Content-Type': 'application/json',
+      },
+      body: JSON.stringify({ requests }),
+    });
+
+    const data = await response.json();
+
+    if (!response.ok) {
+      throw new Error(data.message || 'Failed to read data');
+    }
+
+    return data;
+  },
+
+  // Contiguous addresses are sent as one multi-write; each write is acknowledged separately
+  writeData: async (connectionId: string, writes: WriteRequest[]): Promise<{ success: boolean; requests: number; results: WriteResult[] }> => {
+    const response = await fetch(`${API_BASE_URL}/write/${connectionId}`, {
+      method: 'POST',
+      headers: {
+        'Content-Type': 'application/json',
+      },
+      body: JSON.stringify({ writes }),
+    });
+
+    const data = await response.json();
+
+    if (!response.ok) {
+      throw new Error(data.message || 'Failed to write data');
+    }
+
+    return data;
+  },
+
+  // Min/max/avg/last per bucket, about one bucket per pixel of `width`
+  getHistory: async (column: string, start: number, end: number, width: number): Promise<HistoryTrend> => {
+    const params = new URLSearchParams({ start: String(start), end: String(end), width: String(width) });
+    const response = await fetch(`${API_BASE_URL}/history/${encodeURIComponent(column)}?${params}`);
+    const data = await response.json();
+
+    if (!response.ok) {
+      throw new Error(data.message || 'Failed to load history');
+    }
+
+    return data;
+  },
+
+  // Capabilities of the connection's units, keyed by unit ID
+  getCapabilities: async (connectionId: string): Promise<{ success: boolean; units: Record<string, DeviceCapabilities> }> => {
+    const response = await fetch(`${API_BASE_URL}/capabilities/${connectionId}`);
+    const data = await response.json();
+
+    if (!response.ok) {
+      throw new Error(data.message || 'Failed to load capabilities');
+    }
+
+    return data;
+  },
+
+  // Probes one unit (or reuses the cached result); can take a while on slow devices
+  probeCapabilities: async (connectionId: string, unitId: number, spans: ProbeSpan[], reprobe = false): Promise<{ success: boolean; requests: number; capabilities: DeviceCapabilities }> => {
+    const response = await fetch(`${API_BASE_URL}/capabilities/${connectionId}`, {
+      method: 'POST',
+      headers: {
+        'Content-Type': 'application/json',
+      },
+      body: JSON.stringify({ unit_id: unitId, spans, reprobe }),
+    });
+    const data = await response.json();
+
+    if (!response.ok) {
+      throw new Error(data.message || 'Failed to probe device');
+    }
+
+    return data;
+  },
+
+  // Latest values published by the logger in shared memory; no PLC traffic
+  getLiveValues: async (tags: string[] = []): Promise<{ success: boolean; sequence: number; values: Record<string, LiveValue> }> => {
+    const params = new URLSearchParams({ tags: tags.join(',') });
+    const response = await fetch(`${API_BASE_URL}/live?${params}`);
+    const data = await response.json();
+
+    if (!response.ok) {
+      throw new Error(data.message || 'Failed to read live values');
+    }
+
+    return data;
+  },
+
+  // Subscribes to pushed value changes; returns a function that closes the stream
+  streamData: (
+    connectionIds: string[],
+    onUpdate: (updates: LiveUpdate[]) => void,
+    tick = 0.1
+  ): (() => void) => {
+    const params = new URLSearchParams({
+      connections: connectionIds.join(','),
+      tick: String(tick),
+    });
+    const source = new EventSource(`${API_BASE_URL}/stream?${params}`);
+    source.onmessage = (event) => onUpdate(JSON.parse(event.data));
+    return () => source.close();
+  },
 }; 
\ No newline at end of file
@@ -0,0 +1,5 @@
+# Tests import modbus_logger from the repository root, like the scripts do
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,159 @@
+import math
+
+import pytest
+
+from modbus_logger.archive import (
+    CHUNK, CHUNK_POINTS, KIND_ANALOG, KIND_BITS, KIND_DECIMAL, ArchiveReader, ArchiveWriter, BitReader, BitWriter,
+    compact_csv, decode_bits, decode_decimals, decode_floats, decode_timestamps, encode_bits, encode_decimals,
+    encode_floats, encode_timestamps,
+)
+
+
+def same_floats(a, b):
+    """Equal bit for bit, so NaN matches NaN and -0.0 doesn't match 0.0."""
+    return len(a) == len(b) and all(x == y and math.copysign(1, x) == math.copysign(1, y) or (x != x and y != y)
+                                    for x, y in zip(a, b))
+
+
+def test_bit_stream_round_trip():
+    fields = [(1, 1), (0, 3), (0x7F, 7), (2 ** 64 - 1, 64), (0, 1), (5, 12)]
+    writer = BitWriter()
+    for value, bits in fields:
+        writer.write(value, bits)
+    reader = BitReader(writer.getvalue())
+    assert [reader.read(bits) for _, bits in fields] == [value for value, _ in fields]
+
+
+@pytest.mark.parametrize("timestamps", [
+    [1700000000000],
+    [1700000000000 + 1000 * i for i in range(5000)],                    # steady scan rate
+    [1700000000000 + 1000 * i + (i % 7) * 13 for i in range(500)],      # jitter
+    [1700000000000, 1700000000000, 1700000000000],                      # identical
+    [10_000, 9_000, 12_000, 5_000, 5_000, -3_000],                       # negative deltas
+    [0, 2 ** 40, 2 ** 41, -2 ** 50],                                     # deltas beyond the small classes
+])
+def test_timestamps_round_trip(timestamps):
+    assert decode_timestamps(encode_timestamps(timestamps), len(timestamps)) == timestamps
+
+
+@pytest.mark.parametrize("values, decimals", [
+    ([5] * 100, 0),                                                     # identical
+    ([0, -1, 300, -300, 70000, -(2 ** 40), 2 ** 40], 0),                # negative and large deltas
+    ([21.5, 21.5, 21.6, 21.4, -0.1, 0.0], 1),
+    ([1.25, -3.125, 1e-6], 6),
+])
+def test_decimals_round_trip(values, decimals):
+    decoded = decode_decimals(encode_decimals(values, decimals), len(values))
+    assert decoded == values
+
+
+@pytest.mark.parametrize("values", [
+    [math.pi] * 50,                                                      # identical
+    [math.nan, 1.0, math.nan, math.nan, 2.5],
+    [math.inf, -math.inf, 0.0, -0.0, math.inf],
+    [1e308, -1e-308, 5e-324, 123.456, -123.456],
+    [0.1 * i for i in range(1000)],
+])
+def test_floats_round_trip(values):
+    assert same_floats(decode_floats(encode_floats(values), len(values)), values)
+
+
+@pytest.mark.parametrize("values", [
+    [0],
+    [1] * 10000,                                                         # one long run (multi-byte length)
+    [1, 0, 1, 1, 0, 0, 0, 1],
+    [i % 2 for i in range(300)],
+])
+def test_bits_round_trip(values):
+    assert decode_bits(encode_bits(values), len(values)) == values
+
+
+@pytest.mark.parametrize("encode, decode", [
+    (encode_timestamps, decode_timestamps),
+    (encode_floats, decode_floats),
+    (encode_bits, decode_bits),
+    (lambda values: encode_decimals(values, 0), decode_decimals),
+])
+def test_empty_series(encode, decode):
+    assert decode(encode([]), 0) == []
+
+
+def write_archive(path, series):
+    writer = ArchiveWriter(str(path))
+    for tag, (timestamps, values) in series.items():
+        writer.add_series(tag, timestamps, values)
+    writer.close()
+    return ArchiveReader(str(path))
+
+
+def test_archive_round_trip_picks_a_kind_per_chunk(tmp_path):
+    timestamps = [1700000000.0 + i for i in range(CHUNK_POINTS + 10)]
+    series = {
+        "coil": (timestamps, [i // 3 % 2 for i in range(len(timestamps))]),
+        "register": (timestamps, [float(i % 50 - 25) for i in range(len(timestamps))]),
+        "analog": (timestamps, [math.sin(i) for i in range(len(timestamps))]),
+        "empty": ([], []),
+    }
+    with write_archive(tmp_path / "a.mba", series) as reader:
+        assert reader.tags == ["coil", "register", "analog"]
+        kinds = {tag: {info.kind for info in infos} for tag, infos in reader.chunks_by_tag.items()}
+        assert kinds == {"coil": {KIND_BITS}, "register": {KIND_DECIMAL}, "analog": {KIND_ANALOG}}
+        assert all(len(infos) == 2 for infos in reader.chunks_by_tag.values())
+        for tag in reader.tags:
+            assert list(reader.read(tag)) == list(zip(*series[tag]))
+        assert list(reader.read("empty")) == []
+        assert list(reader.read("analog", timestamps[100], timestamps[102])) == \
+            list(zip(timestamps[100:103], series["analog"][1][100:103]))
+
+
+def test_archive_without_samples(tmp_path):
+    with write_archive(tmp_path / "empty.mba", {"a": ([], [])}) as reader:
+        assert reader.tags == []
+        assert reader.time_range() is None
+
+
+def test_corrupted_chunk_is_detected(tmp_path):
+    path = tmp_path / "a.mba"
+    write_archive(path, {"a": ([1.0, 2.0, 3.0], [1.5, 2.5, 3.5])}).close()
+    data = bytearray(path.read_bytes())
+    with ArchiveReader(str(path)) as reader:
+        info = reader.chunks_by_tag["a"][0]
+    data[info.offset + CHUNK.size + info.payload_bytes - 1] ^= 0xFF
+    path.write_bytes(bytes(data))
+
+    with ArchiveReader(str(path)) as reader:
+        with pytest.raises(ValueError, match="corrupt chunk"):
+            list(reader.read("a"))
+
+
+def test_truncated_archive_is_rejected(tmp_path):
+    path = tmp_path / "a.mba"
+    write_archive(path, {"a": ([1.0], [1.0])}).close()
+    path.write_bytes(path.read_bytes()[:-4])
+    with pytest.raises(ValueError):
+        ArchiveReader(str(path))
+
+
+def test_compact_csv_streams_both_layouts(tmp_path):
+    rows = tmp_path / "rows.csv"
+    with open(rows, "w") as f:
+        f.write("Timestamp,x,y\n")
+        for i in range(CHUNK_POINTS * 2 + 5):
+            f.write(f"2026-01-01 {i // 3600 % 24:02d}:{i // 60 % 60:02d}:{i % 60:02d},{i % 2},"
+                    f"{'' if i % 10 == 0 else i / 4}\n")
+    path, samples = compact_csv(str(rows))
+    with ArchiveReader(path) as reader:
+        x = [value for _, value in reader.read("x")]
+        y = [value for _, value in reader.read("y")]
+    assert x == [i % 2 for i in range(CHUNK_POINTS * 2 + 5)]
+    assert y == [i / 4 for i in range(CHUNK_POINTS * 2 + 5) if i % 10]
+    assert samples == len(x) + len(y)
+
+    changes = tmp_path / "changes.csv"
+    changes.write_text("Timestamp,Tag,Value\n2026-01-01 00:00:00,a,1\n2026-01-01 00:00:05,b,-2.5\n"
+                       "2026-01-01 00:00:09,a,0\n")
+    path, samples = compact_csv(str(changes))
+    with ArchiveReader(path) as reader:
+        assert [value for _, value in reader.read("a")] == [1, 0]
+        assert [value for _, value in reader.read("b")] == [-2.5]
+    assert samples == 3
@@ -0,0 +1,142 @@
+import json
+from types import SimpleNamespace
+
+from modbus_logger.capabilities import (
+    ILLEGAL_FUNCTION, CapabilityCache, DeviceCapabilities, _Prober, device_key, load_capabilities, probe_device,
+)
+from modbus_logger.read_plan import (
+    FC_READ_COILS, FC_READ_HOLDING_REGISTERS, FC_READ_INPUT_REGISTERS, compile_read_plan, skipped_block,
+)
+
+ILLEGAL_ADDRESS = 2
+
+
+class FakeDevice:
+    """Holding registers 0-199 with holes; reads above ``max_count`` are rejected; no input registers."""
+
+    def __init__(self, holes=(), max_count=125):
+        self.holes = set(holes)
+        self.max_count = max_count
+        self.connected = True
+        self.requests = []
+
+    def _answer(self, function_code, address, count):
+        self.requests.append((function_code, address, count))
+        if function_code == FC_READ_INPUT_REGISTERS:
+            return SimpleNamespace(isError=lambda: True, exception_code=ILLEGAL_FUNCTION)
+        addresses = range(address, address + count)
+        if count > self.max_count or address + count > 200 or self.holes.intersection(addresses):
+            return SimpleNamespace(isError=lambda: True, exception_code=ILLEGAL_ADDRESS)
+        return SimpleNamespace(isError=lambda: False, registers=list(addresses))
+
+    def read_holding_registers(self, address, count=1, device_id=1):
+        return self._answer(FC_READ_HOLDING_REGISTERS, address, count)
+
+    def read_input_registers(self, address, count=1, device_id=1):
+        return self._answer(FC_READ_INPUT_REGISTERS, address, count)
+
+
+def test_split_finds_the_readable_addresses_around_holes():
+    holes = set(range(10, 20)) | {50}
+    device = FakeDevice(holes=holes)
+    pieces, largest = _Prober(device, 1)._split(FC_READ_HOLDING_REGISTERS, 0, 99)
+    # The pieces that read in one go cover exactly the readable addresses
+    covered = [address for low, high in pieces for address in range(low, high + 1)]
+    assert covered == [address for address in range(100) if address not in holes]
+    assert largest == max(high - low + 1 for low, high in pieces)
+    assert len(device.requests) < 50                         # well under one read per address
+
+    device.requests.clear()
+    ranges, _ = _Prober(device, 1).readable_ranges(FC_READ_HOLDING_REGISTERS, 0, 99)
+    assert ranges == [(0, 9), (20, 49), (51, 99)]
+
+
+def test_split_without_holes_is_one_read():
+    device = FakeDevice()
+    assert _Prober(device, 1)._split(FC_READ_HOLDING_REGISTERS, 0, 99) == ([(0, 99)], 100)
+    assert len(device.requests) == 1
+
+
+def test_readable_ranges_merge_pieces_of_a_size_limited_device():
+    device = FakeDevice(max_count=30)
+    ranges, largest = _Prober(device, 1).readable_ranges(FC_READ_HOLDING_REGISTERS, 0, 99)
+    assert ranges == [(0, 99)]
+    assert largest <= 30
+
+
+def test_probe_device():
+    device = FakeDevice(holes={50}, max_count=40)
+    tags = [(0, FC_READ_HOLDING_REGISTERS, 1), (99, FC_READ_HOLDING_REGISTERS, 1),
+            (5, FC_READ_INPUT_REGISTERS, 1)]
+    capabilities = probe_device(device, 1, tags)
+
+    assert capabilities.function_codes == {FC_READ_HOLDING_REGISTERS}
+    assert capabilities.ranges == {FC_READ_HOLDING_REGISTERS: [(0, 49), (51, 99)], FC_READ_INPUT_REGISTERS: []}
+    assert capabilities.max_count == {FC_READ_HOLDING_REGISTERS: 40}
+    assert capabilities.spans == {FC_READ_HOLDING_REGISTERS: (0, 99), FC_READ_INPUT_REGISTERS: (5, 5)}
+    assert capabilities.requests == len(device.requests)
+    assert capabilities.covers(tags)
+    assert not capabilities.covers([(120, FC_READ_HOLDING_REGISTERS, 1)])
+
+
+def test_plan_respects_probed_capabilities():
+    device = FakeDevice(holes={50}, max_count=40)
+    tags = [(address, FC_READ_HOLDING_REGISTERS, 1) for address in range(0, 100, 7)] + [
+        (50, FC_READ_HOLDING_REGISTERS, 1), (5, FC_READ_INPUT_REGISTERS, 1)]
+    capabilities = {1: probe_device(device, 1, tags)}
+    plan = compile_read_plan(tags, max_gap=125, capabilities=capabilities)
+
+    for block in plan:
+        if skipped_block(block):
+            continue
+        response = device._answer(block.function_code, block.address, block.count)
+        assert not response.isError(), block
+    assert sorted((block.function_code, block.address) for block in plan if skipped_block(block)) == [
+        (FC_READ_HOLDING_REGISTERS, 50), (FC_READ_INPUT_REGISTERS, 5)]
+
+
+def test_cache_round_trip(tmp_path):
+    path = str(tmp_path / "capabilities.json")
+    capabilities = DeviceCapabilities({1, 3}, {3: 60}, {3: [(0, 49), (51, 99)], 1: [(0, 15)]},
+                                      {3: (0, 99), 1: (0, 15)}, probed_at=1700000000.0)
+    cache = CapabilityCache(path)
+    cache.put(device_key("10.0.0.5", 502, 1), capabilities)
+    cache.put(device_key("10.0.0.5", 502, 2), DeviceCapabilities({3}))
+    cache.put(device_key("10.0.0.50", 502, 1), DeviceCapabilities({4}))
+
+    reloaded = CapabilityCache(path).get("10.0.0.5:502/1")
+    assert reloaded.to_dict() == capabilities.to_dict()
+    assert reloaded.ranges == {3: [(0, 49), (51, 99)], 1: [(0, 15)]}
+    assert reloaded.limit(3) == 60 and reloaded.limit(1) == 2000
+    assert not reloaded.readable(3, 45, 55) and reloaded.readable(3, 51, 60)
+
+    units = CapabilityCache(path).for_device("10.0.0.5", 502)
+    assert sorted(units) == [1, 2]
+
+    cache.remove("10.0.0.5:502/2")
+    assert sorted(CapabilityCache(path).for_device("10.0.0.5", 502)) == [1]
+
+
+def test_damaged_cache_is_ignored(tmp_path):
+    path = tmp_path / "capabilities.json"
+    path.write_text("{not json")
+    assert CapabilityCache(str(path)).get("x:502/1") is None
+    path.write_text(json.dumps({"x:502/1": {"max_count": {}}}))
+    assert CapabilityCache(str(path)).get("x:502/1") is None
+
+
+def test_load_capabilities_probes_only_when_tags_move_outside(tmp_path):
+    cache = CapabilityCache(str(tmp_path / "capabilities.json"))
+    device = FakeDevice()
+    tags = [(10, FC_READ_HOLDING_REGISTERS, 1), (20, FC_READ_HOLDING_REGISTERS, 1)]
+    load_capabilities(cache, "plc:502/1", device, 1, tags)
+    probes = len(device.requests)
+
+    assert load_capabilities(cache, "plc:502/1", device, 1, tags[:1]) is not None
+    assert len(device.requests) == probes                  # covered by the cache
+    assert load_capabilities(cache, "plc:502/1", None, 1, tags + [(150, 3, 1)]).spans == {3: (10, 20)}
+
+    capabilities = load_capabilities(cache, "plc:502/1", device, 1, tags + [(150, FC_READ_HOLDING_REGISTERS, 1)])
+    assert len(device.requests) > probes
+    assert capabilities.spans == {FC_READ_HOLDING_REGISTERS: (10, 150)}
+    assert FC_READ_COILS not in capabilities.function_codes
@@ -0,0 +1,105 @@
+import os
+from types import SimpleNamespace
+
+import pytest
+from pymodbus.client import ModbusTcpClient
+
+from modbus_logger.capture import CaptureWriter, PduTracer, capture_kwargs, read_capture
+from modbus_logger.pipeline import PipelinedTcpClient
+
+REQUEST = bytes.fromhex("03189f0002")
+RESPONSE = bytes.fromhex("030400070008")
+
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / "traffic.cap")
+
+
+def test_round_trip(path):
+    writer = CaptureWriter(path)
+    start = writer.start
+    writer.record("10.0.0.5:502", 1, REQUEST, RESPONSE, start + 0.5, 0.012)
+    writer.record("10.0.0.6:502", 7, REQUEST, None, start + 1.25)                 # unanswered
+    writer.record("10.0.0.5:502", 2, REQUEST, bytes.fromhex("8302"), start + 2, 0.004)
+    writer.close()
+
+    transactions = list(read_capture(path))
+    assert [(t.source, t.unit_id, t.request, t.response) for t in transactions] == [
+        ("10.0.0.5:502", 1, REQUEST, RESPONSE),
+        ("10.0.0.6:502", 7, REQUEST, b""),
+        ("10.0.0.5:502", 2, REQUEST, bytes.fromhex("8302")),
+    ]
+    assert [t.latency for t in transactions] == [pytest.approx(0.012), None, pytest.approx(0.004)]
+    assert [t.timestamp - start for t in transactions] == [pytest.approx(0.5), pytest.approx(1.25),
+                                                           pytest.approx(2)]
+    assert writer.records == 3
+
+
+def test_truncated_trailing_record_ends_the_capture(path):
+    writer = CaptureWriter(path)
+    for unit_id in range(1, 4):
+        writer.record("plc:502", unit_id, REQUEST, RESPONSE, writer.start, 0.01)
+    writer.close()
+
+    # The logger was killed while writing the last record
+    os.truncate(path, os.path.getsize(path) - 3)
+    assert [t.unit_id for t in read_capture(path)] == [1, 2]
+    # Even with only part of its fixed-size header left
+    os.truncate(path, os.path.getsize(path) - len(REQUEST) - len(RESPONSE) - 5)
+    assert [t.unit_id for t in read_capture(path)] == [1, 2]
+
+
+def test_records_are_buffered_until_flush(path):
+    writer = CaptureWriter(path)
+    writer.record("plc:502", 1, REQUEST, RESPONSE, writer.start, 0.01)
+    assert os.path.getsize(path) == 0
+    writer.flush()
+    assert len(list(read_capture(path))) == 1
+    writer.close()
+    writer.record("plc:502", 1, REQUEST, RESPONSE, writer.start, 0.01)          # ignored after close
+    assert len(list(read_capture(path))) == 1
+
+
+def test_max_bytes_drops_further_transactions(path):
+    writer = CaptureWriter(path, max_bytes=200)
+    for _ in range(20):
+        writer.record("plc:502", 1, REQUEST, RESPONSE, writer.start, 0.01)
+    writer.close()
+    assert writer.dropped > 0
+    assert len(list(read_capture(path))) == writer.records == 20 - writer.dropped
+
+
+def test_other_files_are_rejected(path):
+    with open(path, "wb") as f:
+        f.write(b"\0" * 64)
+    with pytest.raises(ValueError):
+        list(read_capture(path))
+
+
+def fake_pdu(data, dev_id=1):
+    return SimpleNamespace(function_code=data[0], encode=lambda: data[1:], dev_id=dev_id)
+
+
+def test_pdu_tracer_pairs_requests_with_responses(path):
+    writer = CaptureWriter(path)
+    tracer = PduTracer(writer, "plc:502")
+    request = fake_pdu(REQUEST, dev_id=4)
+    assert tracer(True, request) is request
+    tracer(False, fake_pdu(RESPONSE))
+    tracer(True, fake_pdu(REQUEST, dev_id=5))
+    tracer(True, fake_pdu(REQUEST, dev_id=6))    # the previous request went unanswered
+    tracer(False, fake_pdu(RESPONSE))
+    writer.close()
+
+    assert [(t.unit_id, t.response, t.latency is None) for t in read_capture(path)] == [
+        (4, RESPONSE, False), (5, b"", True), (6, RESPONSE, False)]
+
+
+def test_capture_kwargs(path):
+    writer = CaptureWriter(path)
+    assert capture_kwargs(ModbusTcpClient, None, "plc:502") == {}
+    assert capture_kwargs(PipelinedTcpClient, writer, "plc:502") == {"capture": writer, "source": "plc:502"}
+    tracer = capture_kwargs(ModbusTcpClient, writer, "plc:502")["trace_pdu"]
+    assert isinstance(tracer, PduTracer) and tracer.source == "plc:502"
+    writer.close()
@@ -0,0 +1,81 @@
+import math
+
+from modbus_logger.deadband import ChangeFilter, Deadband, exceeds_deadband
+
+
+def test_first_value_is_always_reported():
+    assert ChangeFilter(Deadband(absolute=100)).changes(0, {"a": 5}) == [("a", 5)]
+
+
+def test_absolute_deadband():
+    band = Deadband(absolute=0.5)
+    assert not exceeds_deadband(band, 10.0, 10.5)   # must move by more than the band
+    assert exceeds_deadband(band, 10.0, 10.51)
+    assert exceeds_deadband(band, 10.0, 9.4)
+
+
+def test_percent_deadband_is_relative_to_the_last_reported_value():
+    band = Deadband(percent=10)
+    assert not exceeds_deadband(band, 200, 220)
+    assert exceeds_deadband(band, 200, 221)
+    assert exceeds_deadband(band, -200, -179)
+
+
+def test_larger_of_absolute_and_percent_applies():
+    band = Deadband(absolute=5, percent=1)
+    assert not exceeds_deadband(band, 100, 105)     # 5 > 1 % of 100
+    assert not exceeds_deadband(band, 1000, 1010)   # 1 % of 1000 > 5
+    assert exceeds_deadband(band, 1000, 1011)
+
+
+def test_zero_deadband_reports_any_change():
+    band = Deadband()
+    assert not exceeds_deadband(band, 3, 3)
+    assert exceeds_deadband(band, 3, 4)
+
+
+def test_booleans_report_on_any_change():
+    band = Deadband(absolute=10, percent=50)
+    assert exceeds_deadband(band, False, True)
+    assert not exceeds_deadband(band, True, True)
+
+
+def test_filter_compares_against_the_last_reported_value():
+    change_filter = ChangeFilter(Deadband(absolute=1))
+    change_filter.changes(0, {"a": 10})
+    # Small steps that add up are reported once they pass the band from 10
+    assert change_filter.changes(1, {"a": 10.6}) == []
+    assert change_filter.changes(2, {"a": 11.2}) == [("a", 11.2)]
+    assert change_filter.changes(3, {"a": 11.9}) == []
+    assert change_filter.reported == 2
+    assert change_filter.suppressed == 2
+
+
+def test_max_silence_reports_unchanged_values():
+    change_filter = ChangeFilter(Deadband(max_silence=60))
+    assert change_filter.changes(0, {"a": 1}) == [("a", 1)]
+    assert change_filter.changes(59, {"a": 1}) == []
+    assert change_filter.changes(60, {"a": 1}) == [("a", 1)]
+    assert change_filter.changes(119, {"a": 1}) == []
+
+
+def test_per_tag_deadbands_override_the_default():
+    change_filter = ChangeFilter(Deadband(absolute=100), {"fine": Deadband(absolute=0.1)})
+    change_filter.changes(0, {"fine": 1.0, "coarse": 1.0})
+    assert change_filter.changes(1, {"fine": 1.5, "coarse": 50.0}) == [("fine", 1.5)]
+
+
+def test_missing_values_are_skipped_without_forgetting_the_last():
+    change_filter = ChangeFilter(Deadband(absolute=1))
+    change_filter.changes(0, {"a": 5.0})
+    assert change_filter.changes(1, {"a": None}) == []
+    assert change_filter.changes(2, {"a": math.nan}) == []
+    assert change_filter.changes(3, {"a": 5.5}) == []
+    assert change_filter.changes(4, {"a": 6.5}) == [("a", 6.5)]
+
+
+def test_reset_reports_the_next_scan_in_full():
+    change_filter = ChangeFilter()
+    change_filter.changes(0, {"a": 1, "b": 2})
+    change_filter.reset()
+    assert change_filter.changes(1, {"a": 1, "b": 2}) == [("a", 1), ("b", 2)]
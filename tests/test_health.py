@@ -0,0 +1,121 @@
+import time
+
+import pytest
+
+from modbus_logger import health
+from modbus_logger.health import CLOSED, HALF_OPEN, OPEN, Backoff, CircuitBreaker, Reconnector
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 100.0
+
+    def advance(self, seconds):
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(health.time, "monotonic", lambda: clock.now)
+    return clock
+
+
+def test_backoff_grows_up_to_the_maximum():
+    backoff = Backoff(initial=1, maximum=10, multiplier=3, jitter=0)
+    assert [backoff.next_delay() for _ in range(5)] == [1, 3, 9, 10, 10]
+    backoff.reset()
+    assert backoff.next_delay() == 1
+
+
+def test_jitter_only_shortens_the_delay():
+    delays = [Backoff(initial=10, jitter=0.2).next_delay() for _ in range(50)]
+    assert all(8 <= delay <= 10 for delay in delays)
+    assert len(set(delays)) > 1
+
+
+def test_circuit_opens_after_consecutive_failures(clock):
+    breaker = CircuitBreaker(failure_threshold=3, backoff=Backoff(initial=5, jitter=0))
+    assert not breaker.record_failure()
+    assert not breaker.record_failure()
+    assert breaker.allow() and breaker.state == CLOSED
+    assert breaker.record_failure()
+    assert breaker.state == OPEN
+    assert not breaker.allow()
+    assert breaker.retry_in() == 5
+
+
+def test_success_resets_the_failure_count(clock):
+    breaker = CircuitBreaker(failure_threshold=2)
+    breaker.record_failure()
+    breaker.record_success()
+    assert not breaker.record_failure()
+    assert breaker.state == CLOSED
+
+
+def test_closed_open_half_open_closed(clock):
+    breaker = CircuitBreaker(failure_threshold=1, backoff=Backoff(initial=5, jitter=0))
+    breaker.record_failure()
+    assert breaker.state == OPEN
+
+    clock.advance(4.9)
+    assert not breaker.allow()
+    clock.advance(0.1)
+    assert breaker.allow()                           # one probe gets through
+    assert breaker.state == HALF_OPEN
+    assert not breaker.allow()                       # and only one
+
+    breaker.record_success()
+    assert breaker.state == CLOSED
+    assert breaker.allow() and breaker.retry_in() == 0
+
+
+def test_failed_probe_reopens_with_a_longer_backoff(clock):
+    breaker = CircuitBreaker(failure_threshold=3, backoff=Backoff(initial=5, jitter=0))
+    breaker.trip()
+    assert breaker.state == OPEN and breaker.retry_in() == 5
+
+    clock.advance(5)
+    assert breaker.allow()
+    assert breaker.record_failure()                  # a half-open failure opens at once
+    assert breaker.state == OPEN and breaker.retry_in() == 10
+
+    clock.advance(10)
+    assert breaker.allow()
+    breaker.record_success()
+    breaker.trip()
+    assert breaker.retry_in() == 5                   # the backoff starts over after a success
+
+
+def test_reconnector_retries_in_the_background_until_connected():
+    attempts = []
+
+    def connect():
+        attempts.append(time.monotonic())
+        return "client" if len(attempts) == 3 else None
+
+    breaker = CircuitBreaker(backoff=Backoff(initial=0.02, jitter=0))
+    reconnector = Reconnector(connect, breaker)
+    reconnector.start()
+    deadline = time.monotonic() + 2
+    client = None
+    while client is None and time.monotonic() < deadline:
+        client = reconnector.take()
+        time.sleep(0.01)
+
+    assert client == "client"
+    assert len(attempts) == 3
+    assert breaker.state == CLOSED
+    assert reconnector.take() is None                # handed over once
+
+
+def test_reconnector_stop():
+    breaker = CircuitBreaker(backoff=Backoff(initial=0.05, jitter=0))
+    reconnector = Reconnector(lambda: None, breaker)
+    reconnector.start()
+    reconnector.stop()
+    deadline = time.monotonic() + 1
+    while reconnector.running and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert not reconnector.running
+    assert breaker.state == OPEN
@@ -0,0 +1,86 @@
+import multiprocessing
+import os
+import time
+
+import pytest
+
+from modbus_logger.live_table import QUALITY_BAD, QUALITY_GOOD, QUALITY_UNKNOWN, LiveTable
+
+
+@pytest.fixture
+def table(request):
+    table = LiveTable.create(f"test_live_{os.getpid()}_{request.node.name}"[:30], [f"t{i}" for i in range(200)])
+    yield table
+    table.close()
+
+
+def test_publish_and_snapshot(table):
+    reader = LiveTable.attach(table.name)
+    try:
+        assert reader.get("t0").quality == QUALITY_UNKNOWN
+        table.publish(10.0, [float(i) for i in range(200)])
+        assert reader.get("t5") == (5.0, QUALITY_GOOD, 10.0)
+        assert table.sequence == 2
+
+        # A failed read keeps the last value and marks it bad
+        table.publish(11.0, [None, 7.5], table.slots(["t5", "t6"]))
+        assert reader.snapshot(["t5", "t6"]) == {"t5": (5.0, QUALITY_BAD, 11.0), "t6": (7.5, QUALITY_GOOD, 11.0)}
+        with pytest.raises(PermissionError):
+            reader.publish(12.0, [1.0])
+    finally:
+        reader.close()
+
+
+def test_reader_refuses_a_half_written_update(table):
+    reader = LiveTable.attach(table.name)
+    try:
+        # A writer that died between making the sequence odd and even again
+        table._sequence[0] = table.sequence + 1
+        with pytest.raises(TimeoutError):
+            reader.snapshot(timeout=0.05)
+        table._sequence[0] = table.sequence + 1
+        assert reader.snapshot()["t0"].quality == QUALITY_UNKNOWN
+    finally:
+        reader.close()
+
+
+@pytest.mark.skipif(not hasattr(os, "fork"), reason="needs a forked writer process")
+def test_snapshots_never_mix_two_scans(table):
+    # Every scan writes its number into all 200 tags, so a torn copy shows two numbers.
+    # The writer runs in its own process, as the logger does, so it really overlaps the reads.
+    context = multiprocessing.get_context("fork")
+    stop = context.Event()
+
+    def write():
+        scan = 0
+        while not stop.is_set():
+            scan += 1
+            table.publish(float(scan), [float(scan)] * 200)
+        os._exit(0)
+
+    reader = LiveTable.attach(table.name)
+    writer = context.Process(target=write)
+    writer.start()
+    try:
+        seen = set()
+        deadline = time.monotonic() + 0.5
+        while time.monotonic() < deadline or len(seen) < 100:
+            snapshot = reader.snapshot(timeout=5)
+            values = {value.value for value in snapshot.values()}
+            assert len(values) == 1
+            seen |= values
+    finally:
+        stop.set()
+        writer.join(5)
+        reader.close()
+
+
+def test_readers_see_the_writer_go_away(table):
+    reader = LiveTable.attach(table.name)
+    try:
+        assert not reader.closed
+        table.close(unlink=False)
+        assert reader.closed
+    finally:
+        reader.close()
+        table._segment.unlink()
@@ -0,0 +1,152 @@
+import socket
+import struct
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from modbus_logger.pipeline import MBAP, REQUEST, PipelinedTcpClient
+from modbus_logger.read_plan import FC_READ_HOLDING_REGISTERS
+
+
+class FakeDevice:
+    """The device end of one pipelined connection; answers only when told to."""
+
+    def __init__(self, client_factory):
+        self.server = socket.create_server(("127.0.0.1", 0))
+        self.client = client_factory(self.server.getsockname()[1])
+        assert self.client.connect()
+        self.conn, _ = self.server.accept()
+        self.conn.settimeout(2)
+
+    def receive(self):
+        """Returns (transaction ID, unit ID, address) of the next request."""
+        header = self._read(MBAP.size)
+        transaction_id, _, length, unit_id = MBAP.unpack(header)
+        _, address, _ = REQUEST.unpack(self._read(length - 1))
+        return transaction_id, unit_id, address
+
+    def answer(self, transaction_id, unit_id, *registers, protocol_id=0):
+        pdu = struct.pack(f">BB{len(registers)}H", FC_READ_HOLDING_REGISTERS, 2 * len(registers), *registers)
+        self.conn.sendall(MBAP.pack(transaction_id, protocol_id, len(pdu) + 1, unit_id) + pdu)
+
+    def _read(self, size):
+        data = b""
+        while len(data) < size:
+            chunk = self.conn.recv(size - len(data))
+            assert chunk, "client closed the connection"
+            data += chunk
+        return data
+
+    def close(self):
+        self.client.close()
+        self.conn.close()
+        self.server.close()
+
+
+@pytest.fixture
+def device():
+    devices = []
+
+    def make(window=8, timeout=2.0):
+        device = FakeDevice(lambda port: PipelinedTcpClient("127.0.0.1", port, window=window, timeout=timeout))
+        devices.append(device)
+        return device
+
+    yield make
+    for device in devices:
+        device.close()
+
+
+def read(client, address, unit_id=1):
+    return client.submit(unit_id, REQUEST.pack(FC_READ_HOLDING_REGISTERS, address, 1))
+
+
+def wait_for(condition, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "condition not met in time"
+        time.sleep(0.01)
+
+
+def test_out_of_order_responses_are_matched_by_transaction_id(device):
+    fake = device()
+    futures = {address: read(fake.client, address) for address in (10, 20, 30)}
+    requests = [fake.receive() for _ in futures]
+    assert len({transaction_id for transaction_id, _, _ in requests}) == 3
+
+    for transaction_id, unit_id, address in reversed(requests):
+        fake.answer(transaction_id, unit_id, address + 1)
+    assert {address: future.result(2).registers for address, future in futures.items()} == {
+        10: [11], 20: [21], 30: [31]}
+
+
+def test_a_timeout_fails_only_its_own_transaction(device):
+    fake = device(timeout=0.3)
+    slow = read(fake.client, 1)
+    fast = read(fake.client, 2)
+    _, (fast_id, unit_id, _) = fake.receive(), fake.receive()
+    fake.answer(fast_id, unit_id, 42)
+
+    assert fast.result(2).registers == [42]
+    with pytest.raises(TimeoutError):
+        slow.result(2)
+    # The connection stays usable for later transactions
+    later = read(fake.client, 3)
+    transaction_id, unit_id, _ = fake.receive()
+    fake.answer(transaction_id, unit_id, 7)
+    assert later.result(2).registers == [7]
+
+
+def test_late_response_is_counted_and_dropped(device):
+    fake = device(timeout=0.2)
+    future = read(fake.client, 1)
+    transaction_id, unit_id, _ = fake.receive()
+    with pytest.raises(TimeoutError):
+        future.result(2)
+
+    fake.answer(transaction_id, unit_id, 5)
+    wait_for(lambda: fake.client.late_responses == 1)
+
+
+@pytest.mark.parametrize("protocol_id, unit_offset", [(0, 1), (1, 0)])
+def test_wrong_unit_or_protocol_id_is_rejected(device, protocol_id, unit_offset):
+    fake = device()
+    future = read(fake.client, 1, unit_id=3)
+    transaction_id, unit_id, _ = fake.receive()
+    assert unit_id == 3
+    fake.answer(transaction_id, unit_id + unit_offset, 5, protocol_id=protocol_id)
+    with pytest.raises(ValueError):
+        future.result(2)
+
+
+def test_lost_connection_fails_every_pending_transaction(device):
+    fake = device()
+    futures = [read(fake.client, address) for address in range(4)]
+    for _ in futures:
+        fake.receive()
+    fake.conn.close()
+
+    for future in futures:
+        with pytest.raises(ConnectionError):
+            future.result(2)
+    wait_for(lambda: not fake.client.connected)
+    with pytest.raises(ConnectionError):
+        read(fake.client, 1)
+
+
+def test_window_limits_transactions_in_flight(device):
+    fake = device(window=2)
+    read(fake.client, 1)
+    read(fake.client, 2)
+    first, _ = fake.receive(), fake.receive()
+    with ThreadPoolExecutor(1) as executor:
+        third = executor.submit(read, fake.client, 3)
+        time.sleep(0.1)
+        assert not third.done()          # waits for a free slot
+
+        fake.answer(first[0], first[1], 0)
+        transaction_id, unit_id, address = fake.receive()
+        assert address == 3
+        fake.answer(transaction_id, unit_id, 9)
+        assert third.result(2).result(2).registers == [9]
@@ -0,0 +1,83 @@
+import pytest
+
+from modbus_logger.read_plan import (
+    FC_READ_COILS, FC_READ_HOLDING_REGISTERS, FC_READ_INPUT_REGISTERS, MAX_READ_COUNT, compile_read_plan, plan_tags,
+)
+from modbus_logger.tag_map import make_tag_def
+
+
+def blocks(plan):
+    return [(block.unit_id, block.function_code, block.address, block.count) for block in plan]
+
+
+def registers(*addresses, unit_id=1):
+    return [(address, FC_READ_HOLDING_REGISTERS, unit_id) for address in addresses]
+
+
+def test_contiguous_tags_share_one_block():
+    assert blocks(compile_read_plan(registers(3, 1, 2, 0))) == [(1, 3, 0, 4)]
+
+
+def test_duplicates_are_read_once():
+    plan = compile_read_plan(registers(5, 5, 6))
+    assert blocks(plan) == [(1, 3, 5, 2)]
+    assert [tag.address for tag in plan_tags(plan)] == [5, 6]
+
+
+@pytest.mark.parametrize("max_gap, expected", [
+    (0, [(1, 3, 0, 1), (1, 3, 5, 1), (1, 3, 20, 1)]),
+    (3, [(1, 3, 0, 1), (1, 3, 5, 1), (1, 3, 20, 1)]),
+    (4, [(1, 3, 0, 6), (1, 3, 20, 1)]),      # 4 unused addresses between 0 and 5
+    (14, [(1, 3, 0, 21)]),
+])
+def test_gap_tolerance(max_gap, expected):
+    assert blocks(compile_read_plan(registers(0, 5, 20), max_gap=max_gap)) == expected
+
+
+def test_units_and_function_codes_are_never_merged():
+    tags = registers(0, 1) + registers(2, unit_id=2) + [(3, FC_READ_INPUT_REGISTERS, 1), (0, FC_READ_COILS, 1)]
+    assert blocks(compile_read_plan(tags, max_gap=10)) == [
+        (1, 1, 0, 1), (1, 3, 0, 2), (1, 4, 3, 1), (2, 3, 2, 1),
+    ]
+
+
+@pytest.mark.parametrize("function_code", [FC_READ_COILS, FC_READ_HOLDING_REGISTERS])
+def test_protocol_limit_splits_blocks(function_code):
+    limit = MAX_READ_COUNT[function_code]
+    tags = [(address, function_code, 1) for address in range(limit * 2 + 1)]
+    assert blocks(compile_read_plan(tags)) == [
+        (1, function_code, 0, limit), (1, function_code, limit, limit), (1, function_code, 2 * limit, 1),
+    ]
+
+
+def test_max_count_lowers_the_limit():
+    assert blocks(compile_read_plan(registers(*range(10)), max_count=4)) == [
+        (1, 3, 0, 4), (1, 3, 4, 4), (1, 3, 8, 2),
+    ]
+    tags = registers(*range(6)) + [(address, FC_READ_COILS, 1) for address in range(6)]
+    assert blocks(compile_read_plan(tags, max_count={FC_READ_HOLDING_REGISTERS: 3})) == [
+        (1, 1, 0, 6), (1, 3, 0, 3), (1, 3, 3, 3),
+    ]
+
+
+def test_gap_never_exceeds_the_limit():
+    assert blocks(compile_read_plan(registers(0, 124, 125), max_gap=200)) == [(1, 3, 0, 125), (1, 3, 125, 1)]
+
+
+def test_wide_tags_are_never_split():
+    tags = [make_tag_def("a", 0, "uint16"), make_tag_def("b", 1, "float32"), make_tag_def("c", 3, "float64")]
+    assert blocks(compile_read_plan(tags)) == [(1, 3, 0, 7)]
+    # The float32 at 3-4 doesn't fit behind 0-2, so it starts the next block whole
+    tags = [make_tag_def("a", 0, "uint16"), make_tag_def("b", 1, "uint16"), make_tag_def("c", 2, "uint16"),
+            make_tag_def("d", 3, "float32")]
+    assert blocks(compile_read_plan(tags, max_count=4)) == [(1, 3, 0, 3), (1, 3, 3, 2)]
+
+
+def test_wide_tag_extends_the_block_end():
+    tags = [make_tag_def("wide", 0, "float64"), make_tag_def("inside", 2, "uint16")]
+    assert blocks(compile_read_plan(tags)) == [(1, 3, 0, 4)]
+
+
+def test_unsupported_function_code():
+    with pytest.raises(ValueError):
+        compile_read_plan([(0, 6, 1)])
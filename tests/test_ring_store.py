@@ -0,0 +1,122 @@
+import math
+import os
+
+import pytest
+
+from modbus_logger.ring_store import RingStore
+
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / "plc.ring")
+
+
+def rows(store, start, end, column):
+    """Flattens range() into (timestamps, values) lists."""
+    timestamps, values = [], []
+    for timestamp_view, value_view in store.range(start, end, column):
+        timestamps.extend(timestamp_view.tolist())
+        values.extend(value_view.tolist())
+    return timestamps, values
+
+
+def test_append_and_read_back(path):
+    store = RingStore.create(path, [("a", "d"), ("b", "q")], 8)
+    assert store.latest() is None
+    store.append(1.0, [1.5, -3])
+    store.append(2.0, {"b": 4, "a": 2.5})
+    assert len(store) == store.count == 2
+    assert store.latest() == (2.0, {"a": 2.5, "b": 4})
+    assert rows(store, 0, 10, "b") == ([1.0, 2.0], [-3, 4])
+    store.close()
+
+
+def test_missing_values_are_nan_or_zero(path):
+    store = RingStore.create(path, [("a", "d"), ("b", "b")], 4)
+    store.append(1.0, [None, None])
+    _, row = store.latest()
+    assert math.isnan(row["a"]) and row["b"] == 0
+    store.close()
+
+
+def test_wraparound_keeps_the_newest_rows(path):
+    store = RingStore.create(path, [("a", "i")], 5)
+    for i in range(12):
+        store.append(float(i), [i * 10])
+    assert store.count == 12 and len(store) == 5
+    assert store.latest() == (11.0, {"a": 110})
+    assert rows(store, 0, 100, "a") == ([7.0, 8.0, 9.0, 10.0, 11.0], [70, 80, 90, 100, 110])
+    store.close()
+
+
+def test_range_is_inclusive_and_slices_the_buffer(path):
+    store = RingStore.create(path, [("a", "d")], 10)
+    for i in range(10):
+        store.append(float(i), [i / 2])
+    assert rows(store, 3, 6, "a") == ([3.0, 4.0, 5.0, 6.0], [1.5, 2.0, 2.5, 3.0])
+    assert rows(store, 2.5, 3.5, "a") == ([3.0], [1.5])
+    assert store.range(20, 30, "a") == []
+    assert store.range(6, 3, "a") == []
+    store.close()
+
+
+def test_range_across_the_wrap_point_returns_two_segments(path):
+    store = RingStore.create(path, [("a", "H")], 4)
+    for i in range(6):                    # slots now hold 4, 5, 2, 3
+        store.append(float(i), [i])
+    segments = store.range(2, 5, "a")
+    assert [segment[1].tolist() for segment in segments] == [[2, 3], [4, 5]]
+    assert rows(store, 3, 4, "a") == ([3.0, 4.0], [3, 4])
+    del segments
+    store.close()
+
+
+def test_reader_sees_the_writers_appends(path):
+    writer = RingStore.create(path, [("a", "d")], 4)
+    reader = RingStore.open(path)
+    writer.append(1.0, [7.0])
+    assert reader.latest() == (1.0, {"a": 7.0})
+    with pytest.raises(PermissionError):
+        reader.append(2.0, [1.0])
+    reader.close()
+    writer.close()
+
+
+def test_open_or_create_reuses_a_matching_layout(path):
+    store = RingStore.open_or_create(path, [("a", "d")], 4)
+    store.append(1.0, [1.0])
+    store.close()
+    store = RingStore.open_or_create(path, [("a", "d")], 4)
+    assert store.count == 1
+    store.close()
+    store = RingStore.open_or_create(path, [("a", "d"), ("b", "d")], 4)
+    assert store.count == 0 and store.columns == ["a", "b"]
+    store.close()
+
+
+def test_replaced_after_the_file_is_recreated_or_removed(path):
+    RingStore.create(path, [("a", "d")], 4).close()
+    reader = RingStore.open(path)
+    assert not reader.replaced()
+
+    writer = RingStore.create(path, [("a", "d"), ("b", "d")], 4)
+    assert reader.replaced()
+    assert not writer.replaced()
+    # The old mapping stays readable until the reader reopens
+    assert reader.columns == ["a"] and reader.latest() is None
+    reader.close()
+
+    os.remove(path)
+    assert writer.replaced()
+    writer.close()
+
+
+def test_invalid_files_and_columns_are_rejected(path):
+    with pytest.raises(ValueError):
+        RingStore.create(path, [("a", "x")], 4)
+    with pytest.raises(ValueError):
+        RingStore.create(path, [("a" * 40, "d")], 4)
+    with open(path, "wb") as file:
+        file.write(b"\0" * 64)
+    with pytest.raises(ValueError):
+        RingStore.open(path)
@@ -0,0 +1,134 @@
+import math
+
+import pytest
+
+from modbus_logger.ring_store import RingStore
+from modbus_logger.rollups import RollupWriter, query_history, rollup_columns, rollup_path
+
+BASE = 3600 * 500000  # an hour boundary, so every bucket starts on a whole second, minute and hour
+
+
+@pytest.fixture
+def stores(tmp_path):
+    """A raw store for tags a, b and a RollupWriter with 1 s and 1 min rollups."""
+    raw_path = str(tmp_path / "plc.ring")
+    raw = RingStore.create(raw_path, [("a", "d"), ("b", "d")], 4096)
+    writer = RollupWriter.open_or_create(raw_path, ["a", "b"], {1: 1024, 60: 64})
+    yield raw, writer
+    writer.close()  # a no-op if the test closed it already
+    raw.close()
+
+
+def record(raw, writer, timestamp, values):
+    raw.append(timestamp, values)
+    writer.add(timestamp, values)
+
+
+def rollup_rows(store):
+    """Every row of a rollup store as (timestamp, {column: value})."""
+    columns = {name: [value for _, view in store.range(-math.inf, math.inf, name) for value in view.tolist()]
+               for name in store.columns}
+    timestamps = [t for view, _ in store.range(-math.inf, math.inf, "count") for t in view.tolist()]
+    return [(t, {name: values[i] for name, values in columns.items()}) for i, t in enumerate(timestamps)]
+
+
+def test_rollup_paths_and_columns():
+    assert rollup_path("/data/plc_data.ring", 1) == "/data/plc_data.1s.ring"
+    assert rollup_path("/data/plc_data.ring", 60) == "/data/plc_data.1m.ring"
+    assert rollup_path("/data/plc_data", 3600) == "/data/plc_data.1h.ring"
+    assert rollup_columns(["a"]) == [("count", "I"), ("a.count", "I"), ("a.min", "d"), ("a.max", "d"),
+                                     ("a.avg", "d"), ("a.last", "d")]
+
+
+def test_samples_are_merged_into_buckets(stores):
+    raw, writer = stores
+    for offset, value in [(0.0, 4), (0.5, 1), (0.75, 7), (1.0, 2)]:
+        record(raw, writer, BASE + offset, [value, -value])
+
+    # The first second closed when the sample at 1.0 arrived
+    ((timestamp, row),) = rollup_rows(writer.stores[1])
+    assert timestamp == BASE
+    assert row["count"] == 3 and row["a.count"] == 3
+    assert (row["a.min"], row["a.max"], row["a.avg"], row["a.last"]) == (1, 7, 4, 7)
+    assert (row["b.min"], row["b.max"], row["b.last"]) == (-7, -1, -7)
+    assert rollup_rows(writer.stores[60]) == []
+
+    # Closing appends the buckets still open
+    writer.close()
+    minutes = RingStore.open(rollup_path(raw.path, 60))
+    ((timestamp, row),) = rollup_rows(minutes)
+    minutes.close()
+    assert timestamp == BASE
+    assert (row["count"], row["a.min"], row["a.max"], row["a.avg"], row["a.last"]) == (4, 1, 7, 3.5, 2)
+
+
+def test_missing_values_are_left_out_of_a_tags_statistics(stores):
+    raw, writer = stores
+    record(raw, writer, BASE, [10, None])
+    record(raw, writer, BASE + 0.25, [None, None])
+    record(raw, writer, BASE + 0.5, [20, None])
+    record(raw, writer, BASE + 1, [0, 0])
+
+    ((_, row),) = rollup_rows(writer.stores[1])
+    assert row["count"] == 3
+    assert (row["a.count"], row["a.min"], row["a.max"], row["a.avg"], row["a.last"]) == (2, 10, 20, 15, 20)
+    assert row["b.count"] == 0
+    assert all(math.isnan(row[f"b.{stat}"]) for stat in ("min", "max", "avg", "last"))
+
+
+def brute_force(samples, start, end, size):
+    """Expected (timestamp, count, min, max, avg, last) buckets straight from the samples."""
+    buckets = {}
+    for timestamp, value in samples:
+        if start <= timestamp <= end and value is not None:
+            buckets.setdefault(timestamp - timestamp % size, []).append(value)
+    return [(key, len(values), min(values), max(values), pytest.approx(sum(values) / len(values)), values[-1])
+            for key, values in sorted(buckets.items())]
+
+
+def test_query_uses_the_coarsest_store_and_fills_the_newest_part_from_finer_ones(stores):
+    raw, writer = stores
+    samples = []
+    for i in range(200 * 4 + 3):                 # 200.75 s of samples every 0.25 s
+        timestamp = BASE + i * 0.25
+        value = None if i % 37 == 5 else (i * 7) % 23
+        samples.append((timestamp, value))
+        record(raw, writer, timestamp, [value, 0])
+    sources = {0: raw, **writer.stores}
+
+    # 3 buckets over 200 s: 1 min buckets. Minutes 0-2 come from the 1 min store;
+    # minute 3 is still open there, so its closed seconds come from the 1 s store
+    # and the open last second from the raw samples.
+    start, end = BASE, BASE + 200.75
+    size, rows = query_history(sources, "a", start, end, 3)
+    assert size == 60
+    assert [row[0] for row in rows] == [BASE, BASE + 60, BASE + 120, BASE + 180]
+    assert rows == brute_force(samples, start, end, 60)
+
+    # 40 buckets over 200 s: 5 s buckets merged from the 1 s rollups
+    size, rows = query_history(sources, "a", start, end, 40)
+    assert size == 5
+    assert rows == brute_force(samples, start, end, 5)
+
+
+def test_short_ranges_are_served_from_raw_samples(stores):
+    raw, writer = stores
+    samples = [(BASE + i * 0.25, float(i)) for i in range(40)]
+    for timestamp, value in samples:
+        record(raw, writer, timestamp, [value, value])
+    sources = {0: raw, **writer.stores}
+
+    size, rows = query_history(sources, "a", BASE, BASE + 5, 100)
+    assert size == pytest.approx(0.05)
+    expected = [(t, v) for t, v in samples if t <= BASE + 5]
+    assert [(row[1], row[4]) for row in rows] == [(1, v) for _, v in expected]
+    assert all(abs(row[0] - t) <= size for row, (t, _) in zip(rows, expected))
+
+
+def test_buckets_without_good_values_are_skipped(stores):
+    raw, writer = stores
+    for i in range(180):
+        record(raw, writer, BASE + i, [None if 60 <= i < 120 else 1.0, 0])
+    sources = {0: raw, **writer.stores}
+    _, rows = query_history(sources, "a", BASE, BASE + 180, 3)
+    assert [(row[0], row[1]) for row in rows] == [(BASE, 60), (BASE + 120, 60)]
@@ -0,0 +1,145 @@
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from modbus_logger.read_plan import FC_READ_HOLDING_REGISTERS, ReadBlock, compile_read_plan
+from modbus_logger.rtu_bus import PRIORITY_HIGH, PRIORITY_LOW, RtuBusMaster, SlaveSuspendedError, frame_silence
+
+
+class FakeSerialClient:
+    """Answers holding register reads with the address; listed units time out."""
+
+    def __init__(self, dead_units=()):
+        self.dead_units = set(dead_units)
+        self.calls = []  # (monotonic time, unit ID, address)
+        self.gate = None  # Event that holds the next call until set
+        self.waiting = threading.Event()
+
+    def read_holding_registers(self, address, count=1, device_id=1):
+        if self.gate is not None:
+            self.waiting.set()
+            self.gate.wait(2)
+        self.calls.append((time.monotonic(), device_id, address))
+        if device_id in self.dead_units:
+            raise TimeoutError(f"No response from unit {device_id}")
+        return SimpleNamespace(registers=list(range(address, address + count)), isError=lambda: False)
+
+
+def block(unit_id, address=0):
+    return ReadBlock(unit_id, FC_READ_HOLDING_REGISTERS, address, 1, ())
+
+
+@pytest.fixture
+def bus():
+    buses = []
+
+    def make(client, baudrate=115200, **kwargs):
+        buses.append(RtuBusMaster(client, baudrate, **kwargs))
+        return buses[-1]
+
+    yield make
+    for master in buses:
+        master.close()
+
+
+def test_frame_silence():
+    assert frame_silence(9600) == pytest.approx(3.5 * 10 / 9600)            # 8N1: 10 bits a character
+    assert frame_silence(9600, parity="E") == pytest.approx(3.5 * 11 / 9600)
+    assert frame_silence(19200, bytesize=7, stopbits=2) == pytest.approx(3.5 * 10 / 19200)
+    assert frame_silence(38400) == frame_silence(115200) == 0.00175          # fixed above 19200 baud
+
+
+def test_requests_are_separated_by_the_frame_silence(bus):
+    client = FakeSerialClient()
+    master = bus(client, baudrate=1200)                                      # t3.5 is about 29 ms
+    futures = [master.submit(block(1, address)) for address in range(4)]
+    for future in futures:
+        future.result(2)
+    gaps = [later[0] - earlier[0] for earlier, later in zip(client.calls, client.calls[1:])]
+    assert min(gaps) >= master.frame_gap
+
+
+def test_slaves_take_turns_and_priority_goes_first(bus):
+    client = FakeSerialClient()
+    client.gate = threading.Event()
+    master = bus(client)
+    first = master.submit(block(9))                                          # holds the bus
+    client.waiting.wait(2)
+    futures = [master.submit(block(1, address)) for address in (1, 2, 3)]
+    futures.append(master.submit(block(2, 10)))
+    futures.append(master.submit(block(3, 20), PRIORITY_LOW))
+    futures.append(master.submit(block(3, 21), PRIORITY_HIGH))
+    client.gate.set()
+    for future in [first] + futures:
+        future.result(2)
+    # Unit 3's high priority request goes first; normal priority slaves then
+    # alternate, and unit 3's low priority request waits for them
+    assert [(unit, address) for _, unit, address in client.calls] == [
+        (9, 0), (3, 21), (1, 1), (2, 10), (1, 2), (1, 3), (3, 20)]
+
+
+def test_a_failing_slave_is_suspended_without_blocking_the_others(bus):
+    client = FakeSerialClient(dead_units={2})
+    master = bus(client, skip_time=60)
+    with pytest.raises(TimeoutError):
+        master.submit(block(2)).result(2)
+    assert master.suspended(2)
+
+    with pytest.raises(SlaveSuspendedError):
+        master.submit(block(2)).result(2)
+    assert master.submit(block(1, 5)).result(2).registers == [5]
+    assert [unit for _, unit, _ in client.calls] == [2, 1]                  # the suspended request never went out
+    assert master.stats[2] == {"requests": 1, "timeouts": 1, "skipped": 1}
+
+
+def test_suspension_backs_off_and_resets_after_an_answer(bus):
+    client = FakeSerialClient(dead_units={2})
+    master = bus(client, skip_time=0.1, max_skip_time=1.0)
+    with pytest.raises(TimeoutError):
+        master.submit(block(2)).result(2)
+    time.sleep(0.12)
+    assert not master.suspended(2)
+
+    with pytest.raises(TimeoutError):                                        # second timeout: 0.2 s
+        master.submit(block(2)).result(2)
+    time.sleep(0.12)
+    assert master.suspended(2)
+    time.sleep(0.1)
+    assert not master.suspended(2)
+
+    client.dead_units.clear()
+    assert master.submit(block(2)).result(2).registers == [0]
+    client.dead_units.add(2)
+    with pytest.raises(TimeoutError):                                        # back to 0.1 s
+        master.submit(block(2)).result(2)
+    time.sleep(0.12)
+    assert not master.suspended(2)
+
+
+def test_read_plan_reports_healthy_slaves_and_errors_per_unit(bus):
+    client = FakeSerialClient(dead_units={2})
+    master = bus(client, skip_time=60)
+    plan = compile_read_plan([(3, 3, 1), (4, 3, 1), (7, 3, 2)])
+    values, errors = master.execute_read_plan(plan, timeout=2)
+    assert {tag.address: value for tag, value in values.items()} == {3: 3, 4: 4}
+    assert list(errors) == [2]
+
+
+def test_close_fails_queued_requests(bus):
+    client = FakeSerialClient()
+    client.gate = threading.Event()
+    master = bus(client)
+    running = master.submit(block(1))
+    client.waiting.wait(2)
+    queued = master.submit(block(1, 1))
+    closer = threading.Thread(target=master.close)
+    closer.start()
+    client.gate.set()
+    closer.join(2)
+    assert running.result(2).registers == [0]
+    with pytest.raises(RuntimeError):
+        queued.result(2)
+    with pytest.raises(RuntimeError):
+        master.submit(block(1))
@@ -0,0 +1,80 @@
+import pytest
+
+from modbus_logger import scheduler
+from modbus_logger.scheduler import ScanSchedule, spread_phase
+
+
+class FakeClock:
+    """Wall and monotonic time that only move when the test (or sleep) moves them."""
+
+    def __init__(self, wall=1000.25, monotonic=50.0):
+        self.wall = wall
+        self.mono = monotonic
+
+    def advance(self, seconds):
+        self.wall += seconds
+        self.mono += seconds
+
+    def sleep(self, seconds):
+        self.advance(max(0.0, seconds))
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(scheduler.time, "time", lambda: clock.wall)
+    monkeypatch.setattr(scheduler.time, "monotonic", lambda: clock.mono)
+    monkeypatch.setattr(scheduler.time, "sleep", clock.sleep)
+    return clock
+
+
+def test_ticks_on_the_wall_clock_grid(clock):
+    schedule = ScanSchedule(1)
+    assert [schedule.wait() for _ in range(3)] == [1001.0, 1002.0, 1003.0]
+    assert schedule.ticks == 3
+    assert schedule.missed == 0
+
+
+def test_read_time_does_not_stretch_the_period(clock):
+    schedule = ScanSchedule(5)
+    assert schedule.wait() == 1005.0
+    clock.advance(3.9)  # a slow read
+    assert schedule.wait() == 1010.0
+    assert clock.wall == pytest.approx(1010.0)
+    assert schedule.last_missed == 0
+
+
+def test_overrun_counts_skipped_deadlines(clock):
+    schedule = ScanSchedule(1)
+    schedule.wait()                      # 1001
+    clock.advance(3.5)                   # deadlines 1002, 1003 and 1004 pass during the scan
+    assert schedule.wait() == 1004.0     # the latest overdue deadline runs at once
+    assert schedule.last_missed == 2
+    assert schedule.missed == 2
+
+    assert schedule.wait() == 1005.0     # back on the grid, nothing missed
+    assert schedule.last_missed == 0
+    clock.advance(1.2)
+    assert schedule.wait() == 1006.0     # less than a whole period late: not a miss
+    assert schedule.last_missed == 0
+    clock.advance(10)
+    schedule.wait()
+    assert schedule.last_missed == 9
+    assert schedule.missed == 11
+    assert schedule.ticks == 5
+
+
+def test_phase_shifts_the_grid(clock):
+    schedule = ScanSchedule(10, phase=spread_phase(1, 4, 10))
+    assert schedule.wait() == 1002.5
+    assert schedule.wait() == 1012.5
+
+
+def test_spread_phase():
+    assert spread_phase(0, 1, 10) == 0.0
+    assert [spread_phase(index, 4, 2) for index in range(5)] == [0.0, 0.5, 1.0, 1.5, 0.0]
+
+
+def test_interval_must_be_positive():
+    with pytest.raises(ValueError):
+        ScanSchedule(0)
@@ -0,0 +1,48 @@
+import pytest
+
+from modbus_logger.poller import Device
+from modbus_logger.scheduler import ScanClass
+from modbus_logger.supervisor import device_load, shard_devices
+
+
+def device(name, tags, interval=1.0):
+    return Device(name, "127.0.0.1", tags=tuple((address, 3, 1) for address in range(tags)), interval=interval)
+
+
+def loads(devices, shards):
+    return [sum(device_load(devices[index]) for index in shard) for shard in shards]
+
+
+def test_device_load_is_tags_per_second():
+    assert device_load(device("a", 10, interval=0.5)) == 20
+    assert device_load(device("empty", 0)) == 1                  # a device without tags still costs a scan
+    fast_and_slow = Device("b", "127.0.0.1", scan_classes=(
+        ScanClass("fast", 0.1, ((0, 3, 1),)), ScanClass("slow", 10, tuple((a, 3, 1) for a in range(50)))))
+    assert device_load(fast_and_slow) == pytest.approx(15)
+
+
+def test_every_device_is_assigned_exactly_once():
+    devices = [device(f"d{i}", tags) for i, tags in enumerate([5, 40, 1, 12, 7, 30, 3, 9])]
+    shards = shard_devices(devices, 3)
+    assert len(shards) == 3
+    assert sorted(index for shard in shards for index in shard) == list(range(len(devices)))
+    assert all(shard == sorted(shard) for shard in shards)
+
+
+def test_shards_are_balanced_by_load():
+    devices = [device(f"d{i}", tags) for i, tags in enumerate([10, 10, 10, 10, 20, 20])]
+    shards = shard_devices(devices, 2)
+    assert loads(devices, shards) == [40, 40]
+
+
+def test_heaviest_device_gets_a_shard_of_its_own():
+    devices = [device("big", 100)] + [device(f"small{i}", 10) for i in range(6)]
+    shards = shard_devices(devices, 2)
+    assert [0] in shards
+    assert sorted(loads(devices, shards)) == [60, 100]
+
+
+def test_no_more_shards_than_devices():
+    devices = [device("a", 1), device("b", 2)]
+    assert sorted(shard_devices(devices, 8)) == [[0], [1]]
+    assert shard_devices(devices, 0) == [[0, 1]]
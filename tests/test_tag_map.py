@@ -0,0 +1,104 @@
+import math
+import struct
+from types import SimpleNamespace
+
+import pytest
+
+from modbus_logger.read_plan import FC_READ_COILS, compile_read_plan
+from modbus_logger.ring_store import RingStore
+from modbus_logger.tag_map import DATA_TYPES, compile_block_decoder, make_tag_def, tag_name, tag_typecode
+
+# Smallest and largest value of every data type
+EXTREMES = {
+    "int16": (-2 ** 15, 2 ** 15 - 1),
+    "uint16": (0, 2 ** 16 - 1),
+    "int32": (-2 ** 31, 2 ** 31 - 1),
+    "uint32": (0, 2 ** 32 - 1),
+    "float32": (-3.4028234663852886e38, 3.4028234663852886e38),
+    "int64": (-2 ** 63, 2 ** 63 - 1),
+    "uint64": (0, 2 ** 64 - 1),
+    "float64": (-1.7976931348623157e308, 1.7976931348623157e308),
+    "bool": (False, True),
+}
+
+
+def to_registers(data_type, value):
+    """Big-endian (ABCD) registers holding ``value``."""
+    raw = struct.pack(">" + DATA_TYPES[data_type][0], value)
+    return list(struct.unpack(f">{len(raw) // 2}H", raw))
+
+
+def decode(tags, registers=None, bits=None):
+    (block,) = compile_read_plan(tags)
+    response = SimpleNamespace(registers=registers, bits=bits)
+    return compile_block_decoder(block)(response)
+
+
+def test_every_data_type_is_covered():
+    assert set(EXTREMES) == set(DATA_TYPES)
+
+
+@pytest.mark.parametrize("data_type", sorted(DATA_TYPES))
+def test_every_data_type_decodes_and_round_trips_through_a_ring_store(data_type, tmp_path):
+    if data_type == "bool":
+        tags = [make_tag_def("low", 0, "bool", FC_READ_COILS), make_tag_def("high", 1, "bool", FC_READ_COILS)]
+        decoded = decode(tags, bits=[False, True])
+    else:
+        width = DATA_TYPES[data_type][1]
+        tags = [make_tag_def("low", 100, data_type), make_tag_def("high", 100 + width, data_type)]
+        low, high = EXTREMES[data_type]
+        decoded = decode(tags, registers=to_registers(data_type, low) + to_registers(data_type, high))
+    assert [decoded[tag] for tag in tags] == list(EXTREMES[data_type])
+
+    store = RingStore.create(str(tmp_path / "ring"), [(tag_name(tag), tag_typecode(tag)) for tag in tags], 4)
+    try:
+        store.append(1.0, [decoded[tag] for tag in tags])
+        _, row = store.latest()
+        assert [row[tag_name(tag)] for tag in tags] == list(EXTREMES[data_type])
+    finally:
+        store.close()
+
+
+def test_large_uint64_counter_is_stored_unsigned(tmp_path):
+    tag = make_tag_def("energy", 107, "uint64")
+    assert tag_typecode(tag) == "Q"
+    store = RingStore.create(str(tmp_path / "ring"), [(tag.name, tag_typecode(tag))], 4)
+    try:
+        store.append(1.0, [2 ** 64 - 1])
+        assert store.latest()[1] == {"energy": 2 ** 64 - 1}
+    finally:
+        store.close()
+
+
+@pytest.mark.parametrize("layout, registers", [
+    ("ABCD", [0x1234, 0x5678]),
+    ("CDAB", [0x5678, 0x1234]),
+    ("BADC", [0x3412, 0x7856]),
+    ("DCBA", [0x7856, 0x3412]),
+])
+def test_word_and_byte_orders(layout, registers):
+    tag = make_tag_def("value", 0, "uint32", layout=layout)
+    assert decode([tag], registers=registers) == {tag: 0x12345678}
+
+
+def test_scale_and_offset_give_engineering_units():
+    tag = make_tag_def("temperature", 0, "int16", scale=0.1, offset=-40)
+    assert tag_typecode(tag) == "d"
+    assert math.isclose(decode([tag], registers=to_registers("int16", -150))[tag], -55.0)
+
+
+def test_plain_registers_skip_the_struct_path():
+    (block,) = compile_read_plan([(0, 3, 1), (2, 3, 1)], max_gap=1)
+    values = compile_block_decoder(block)(SimpleNamespace(registers=[7, 8, 9]))
+    assert [values[tag] for tag in block.tags] == [7, 9]
+
+
+def test_invalid_definitions_are_rejected():
+    with pytest.raises(ValueError):
+        make_tag_def("x", 0, "int128")
+    with pytest.raises(ValueError):
+        make_tag_def("x", 0, "bool")                     # bool needs a bit function code
+    with pytest.raises(ValueError):
+        make_tag_def("x", 0, "int16", FC_READ_COILS)
+    with pytest.raises(ValueError):
+        make_tag_def("x", 0, "int32", byte_order="middle")
@@ -0,0 +1,100 @@
+import pytest
+
+from modbus_logger.write_plan import (
+    COIL, MAX_WRITE_COUNT, REGISTER, WriteBatcher, WriteBlock, compile_write_plan, make_write, write_request,
+)
+
+
+def test_contiguous_registers_become_one_write():
+    assert compile_write_plan([(12, 3), (10, 1), (11, 2), (20, 9)]) == [
+        WriteBlock(1, REGISTER, 10, (1, 2, 3)), WriteBlock(1, REGISTER, 20, (9,)),
+    ]
+
+
+def test_later_write_to_an_address_wins():
+    assert compile_write_plan([(10, 1), (11, 2), (10, 7)]) == [WriteBlock(1, REGISTER, 10, (7, 2))]
+
+
+def test_kinds_and_units_are_never_merged():
+    writes = [(0, 1), (1, True, COIL), (1, 2, REGISTER, 2), (2, 3)]
+    assert compile_write_plan(writes) == [
+        WriteBlock(1, COIL, 1, (True,)), WriteBlock(1, REGISTER, 0, (1,)), WriteBlock(1, REGISTER, 2, (3,)),
+        WriteBlock(2, REGISTER, 1, (2,)),
+    ]
+
+
+@pytest.mark.parametrize("kind", [REGISTER, COIL])
+def test_protocol_limit_splits_writes(kind):
+    limit = MAX_WRITE_COUNT[kind]
+    plan = compile_write_plan([(address, 1, kind) for address in range(2 * limit + 1)])
+    assert [(block.address, len(block.values)) for block in plan] == [(0, limit), (limit, limit), (2 * limit, 1)]
+
+
+def test_max_count_lowers_the_limit():
+    plan = compile_write_plan([(address, address) for address in range(10)], max_count=4)
+    assert [(block.address, len(block.values)) for block in plan] == [(0, 4), (4, 4), (8, 2)]
+    # Never above what the protocol allows
+    plan = compile_write_plan([(address, 0) for address in range(200)], max_count=1000)
+    assert [len(block.values) for block in plan] == [MAX_WRITE_COUNT[REGISTER], 200 - MAX_WRITE_COUNT[REGISTER]]
+
+
+def test_register_values_are_validated():
+    assert make_write((5, -1)).value == 0xFFFF
+    assert make_write((5, 65535)).value == 65535
+    for value in (-32769, 65536):
+        with pytest.raises(ValueError):
+            make_write((5, value))
+    with pytest.raises(ValueError):
+        make_write((5, 1, "holding"))
+
+
+class FakeClient:
+    def __init__(self, fail_at=None):
+        self.calls = []
+        self.fail_at = fail_at
+
+    def _call(self, name, address, value, device_id=1):
+        self.calls.append((name, address, value, device_id))
+        return FakeResponse(address == self.fail_at)
+
+    def write_register(self, address, value, device_id=1):
+        return self._call("write_register", address, value, device_id)
+
+    def write_registers(self, address, values, device_id=1):
+        return self._call("write_registers", address, values, device_id)
+
+
+class FakeResponse:
+    def __init__(self, error):
+        self.error = error
+
+    def isError(self):
+        return self.error
+
+    def __str__(self):
+        return "Exception Response"
+
+
+def test_single_values_use_the_single_write_function_code():
+    client = FakeClient()
+    write_request(client, WriteBlock(3, REGISTER, 10, (5,)))
+    write_request(client, WriteBlock(3, REGISTER, 10, (5,)), single_writes=False)
+    write_request(client, WriteBlock(3, REGISTER, 10, (5, 6)))
+    assert client.calls == [("write_register", 10, 5, 3), ("write_registers", 10, [5], 3),
+                            ("write_registers", 10, [5, 6], 3)]
+
+
+def test_batcher_acknowledges_every_write():
+    client = FakeClient(fail_at=20)
+    batcher = WriteBatcher(lambda block: write_request(client, block))
+    futures = batcher.write_many({10: 1, 11: 2, 20: 3})
+    superseded = batcher.write(10, 4)
+    results = batcher.flush()
+
+    assert client.calls == [("write_registers", 10, [4, 2], 1), ("write_register", 20, 3, 1)]
+    assert batcher.requests_sent == 2
+    assert [future.result() for future in futures + [superseded]] == results
+    assert [(result.address, result.success, result.superseded) for result in results] == [
+        (10, True, True), (11, True, False), (20, False, False), (10, True, False),
+    ]
+    assert batcher.flush() == []